@@ -0,0 +1,143 @@
+"""
+Admission control for heavy jobs (filtering and exporting).
+
+Filtering a large KRO dataset and writing the HUP with openpyxl take seconds
+of CPU. AdmissionController lets at most `slots` of those jobs run at the same
+time; the others wait in a first-come, first-served queue and can show their
+position. In the multi-process server the controller lives in a manager
+process shared by all workers, so the limit holds across the whole server.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+from typing import Callable, Dict, Optional
+
+
+class AdmissionController:
+    """
+    First-come, first-served queue with a fixed number of running slots.
+
+    Args:
+        slots: Number of heavy jobs that may run at the same time
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(1, int(slots))
+        self._waiting = []
+        self._running = {}
+        self._owners = {}
+        self._next_ticket = 0
+        self._lock = threading.Lock()
+
+    def _admit(self) -> None:
+        while self._waiting and len(self._running) < self.slots:
+            ticket = self._waiting.pop(0)
+            self._running[ticket] = time.time()
+
+    def enqueue(self, owner: Optional[int] = None) -> int:
+        """
+        Put a job in the queue.
+
+        Args:
+            owner: Process id of the worker that runs the job, used by release_owner
+
+        Returns:
+            Ticket for position and release
+        """
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._waiting.append(ticket)
+            self._owners[ticket] = owner
+            self._admit()
+            return ticket
+
+    def position(self, ticket: int) -> int:
+        """Returns 0 when the job may run, otherwise its place in the queue (1 is next)."""
+        with self._lock:
+            self._admit()
+            if ticket in self._running:
+                return 0
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                raise KeyError(f"Unknown or released ticket: {ticket}")
+
+    def release(self, ticket: int) -> None:
+        """Finish a running job or leave the queue; releasing twice is harmless."""
+        with self._lock:
+            self._running.pop(ticket, None)
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._owners.pop(ticket, None)
+            self._admit()
+
+    def release_owner(self, owner: int) -> int:
+        """
+        Release all jobs of a worker process, e.g. after it crashed.
+
+        Returns:
+            Number of released tickets
+        """
+        with self._lock:
+            tickets = [ticket for ticket, ticket_owner in self._owners.items() if ticket_owner == owner]
+        for ticket in tickets:
+            self.release(ticket)
+        return len(tickets)
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            self._admit()
+            return {"slots": self.slots, "running": len(self._running), "waiting": len(self._waiting)}
+
+
+class AdmissionManager(BaseManager):
+    """Manager process that hosts one AdmissionController for all server workers."""
+
+
+AdmissionManager.register("AdmissionController", AdmissionController)
+
+
+# Controller used by this process; None means heavy jobs are never queued
+_controller = None
+
+
+def configure(controller) -> None:
+    """Set the controller (local object or manager proxy) used by admitted()."""
+    global _controller
+    _controller = controller
+
+
+def get_controller():
+    return _controller
+
+
+@contextmanager
+def admitted(on_wait: Optional[Callable[[int], None]] = None, interval: float = 0.5):
+    """
+    Wait for a free slot, run the body and free the slot again.
+
+    Args:
+        on_wait: Called with the queue position while waiting (also when it has not changed)
+        interval: Seconds between position checks
+    """
+    controller = _controller
+    if controller is None:
+        yield
+        return
+
+    ticket = controller.enqueue(os.getpid())
+    try:
+        while True:
+            position = controller.position(ticket)
+            if position == 0:
+                break
+            if on_wait is not None:
+                on_wait(position)
+            time.sleep(interval)
+        yield
+    finally:
+        controller.release(ticket)
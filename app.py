@@ -1,30 +1,44 @@
+# The startup timer is imported first so it measures the other imports
+from startup import STARTUP, wait_for_port, warm_up
+
 import os
 import sys
 import time
 import threading
+import multiprocessing
 import webbrowser
 import argparse
 import signal
+import shutil
+import logging
+import contextlib
 from datetime import datetime
 import tempfile
-from typing import List, Dict, Any
+from typing import List, Dict, Any, TYPE_CHECKING
 
 # PyWebIO imports
-from pywebio.platform.flask import start_server
 from pywebio import start_server as start_pywebio_server
 from pywebio.input import *
 from pywebio.output import *
 from pywebio.session import set_env, info as session_info, run_js, register_thread, defer_call
 from pywebio.session import get_current_session
 
-# Local imports
-from data_management import (
-    load_data_from_content, 
-    get_executable_relative_path, 
-    FILTER_DEFINITIONS, 
-    apply_filter_to_tree
-)
-from classes import KRO_Tree
+# Local imports. Modules that load pandas, numpy or openpyxl are imported inside the functions
+# that use them, so the server starts without them; startup.warm_up loads them in the background.
+from instrumentation import Tracer, NULL_TRACER
+from admission import AdmissionController, admitted, configure as configure_admission
+from exporters import EXPORT_FORMATS, available_formats
+from schema_scanner import check_upload, header_from_content, guess_kind
+
+if TYPE_CHECKING:
+    from classes import KRO_Tree
+    from profiling import ProfileSession
+
+STARTUP.mark("imports (webinterface)")
+
+# Settings from the command line that apply to every session
+APP_SETTINGS = {"profile": False, "format": "xlsx", "backend": "pandas", "memory_budget": None, "enriched_view": True,
+                "parallel_filters": 1, "partition": "rows", "output_cache": 500}
 
 def ui_header():
     """Display application header and information."""
@@ -51,8 +65,26 @@ def ui_header():
     </div>
     """)
 
-def ui_file_upload() -> tuple:
-    """Handle file upload UI and return the loaded dataframes."""
+def ui_check_header(upload: Dict[str, Any], kind: str) -> bool:
+    """Check the columns of an uploaded KRO file from its first line before it is parsed."""
+    report = check_upload(upload['content'], upload['filename'], kind)
+    if report.ok:
+        return True
+    
+    label = "KRO-aanzien" if kind == "aanzien" else "KRO-gebruik"
+    other = guess_kind(header_from_content(upload['content']).columns)
+    if other and other != kind:
+        put_error(f"{upload['filename']} lijkt een KRO-{other} bestand, maar hier wordt een {label} bestand verwacht.")
+    else:
+        put_error(f"{upload['filename']} is geen geldig {label} bestand. "
+                  f"Ontbrekende kolommen: {', '.join(report.missing)}")
+    return False
+
+def ui_file_upload(tracer: Tracer = NULL_TRACER) -> tuple:
+    """Handle file upload UI and return the loaded dataframes and a fingerprint of the uploads."""
+    from data_management import load_data_from_content
+    from mask_cache import content_fingerprint
+    
     put_markdown("## Stap 1: Upload Gegevensbestanden")
     
     try:
@@ -67,19 +99,25 @@ def ui_file_upload() -> tuple:
             placeholder="Kies KRO-gebruik CSV bestand..."
         )
         
+        # Check the columns before parsing the whole file
+        if not ui_check_header(gebruik_file, "gebruik"):
+            return None, None, None
+        
         # Process the gebruik file
         put_text("KRO-gebruik bestand verwerken...")
         try:
             # Modify load_data_from_content call to handle different delimiters
-            df_gebruik = load_data_from_content(
-                gebruik_file['content'], 
-                gebruik_file['filename'],
-                delimiters=[',', ';']  # Try both common CSV delimiters
-            )
+            with tracer.span("load gebruik", file=gebruik_file['filename']) as span:
+                df_gebruik = load_data_from_content(
+                    gebruik_file['content'], 
+                    gebruik_file['filename'],
+                    delimiters=[',', ';']  # Try both common CSV delimiters
+                )
+                span.rows_out = len(df_gebruik)
             put_success(f"KRO-gebruik bestand succesvol geladen: {gebruik_file['filename']}")
         except Exception as e:
             put_error(f"Fout bij het laden van KRO-gebruik bestand: {str(e)}")
-            return None, None
+            return None, None, None
         
         # Section 1b: KRO-aanzien file upload
         put_html('<div style="margin-top: 15px; margin-bottom: 10px; padding: 10px; background-color: #e8f4f8; border-left: 4px solid #3498db; border-radius: 4px;">'
@@ -92,29 +130,58 @@ def ui_file_upload() -> tuple:
             placeholder="Kies KRO-aanzien CSV bestand..."
         )
         
+        # Check the columns before parsing the whole file
+        if not ui_check_header(aanzien_file, "aanzien"):
+            return None, None, None
+        
         # Process the aanzien file
         put_text("KRO-aanzien bestand verwerken...")
         try:
             # Modify load_data_from_content call to handle different delimiters
-            df_aanzien = load_data_from_content(
-                aanzien_file['content'], 
-                aanzien_file['filename'],
-                delimiters=[',', ';']  # Try both common CSV delimiters
-            )
+            with tracer.span("load aanzien", file=aanzien_file['filename']) as span:
+                df_aanzien = load_data_from_content(
+                    aanzien_file['content'], 
+                    aanzien_file['filename'],
+                    delimiters=[',', ';']  # Try both common CSV delimiters
+                )
+                span.rows_out = len(df_aanzien)
             put_success(f"KRO-aanzien bestand succesvol geladen: {aanzien_file['filename']}")
         except Exception as e:
             put_error(f"Fout bij het laden van KRO-aanzien bestand: {str(e)}")
-            return None, None
+            return None, None, None
         
         # Both files loaded successfully
-        return df_aanzien, df_gebruik
+        return df_aanzien, df_gebruik, content_fingerprint(aanzien_file['content'], gebruik_file['content'])
                 
     except Exception as e:
         put_error(f"Fout tijdens bestandsupload: {str(e)}")
-        return None, None
+        return None, None, None
+
+def ui_filter_preview(tree: "KRO_Tree", selected_filters: List[str]) -> None:
+    """Show the object counts of the selected filters in the 'filter_preview' scope."""
+    from data_management import FILTER_DEFINITIONS, preview_filters
+    
+    started = time.time()
+    try:
+        preview = preview_filters(tree, selected_filters)
+    except Exception as e:
+        logging.warning("Filter preview failed: %s", e)
+        clear('filter_preview')
+        return
+    
+    rows = [[FILTER_DEFINITIONS[key]['name'], FILTER_DEFINITIONS[key]['risk'], count]
+            for key, count in preview["definitions"].items()]
+    per_risk = ", ".join(f"{risk}: {count}" for risk, count in sorted(preview["risk"].items()))
+    with use_scope('filter_preview', clear=True):
+        put_table(rows, header=["Filter", "Risico", "Objecten"])
+        put_text(f"Totaal {preview['total']} objecten" + (f" ({per_risk})" if per_risk else "") +
+                 f", waarvan {preview['overlap']} in meer dan één filter "
+                 f"(berekend in {(time.time() - started) * 1000:.0f} ms)")
 
-def ui_filter_selection() -> List[str]:
-    """UI for filter selection."""
+def ui_filter_selection(tree: "KRO_Tree") -> List[str]:
+    """UI for filter selection, with a live count of the objects the selected filters give."""
+    from data_management import FILTER_DEFINITIONS
+    
     put_markdown("## Stap 2: Selecteer Filters")
     
     # Create user-friendly options from filter definitions
@@ -135,11 +202,16 @@ def ui_filter_selection() -> List[str]:
     # Get all filter keys to pre-select them
     all_filter_keys = list(FILTER_DEFINITIONS.keys())
     
+    # Counts of the selected filters, updated whenever a box is toggled
+    put_scope('filter_preview')
+    ui_filter_preview(tree, all_filter_keys)
+    
     # Render checkboxes with all options pre-selected
     selected_filters = checkbox(
         "Selecteer welke filters u wilt toepassen:", 
         options=options,
-        value=all_filter_keys  # Pre-select all filters
+        value=all_filter_keys,  # Pre-select all filters
+        onchange=lambda keys: ui_filter_preview(tree, keys)
     )
     
     if not selected_filters:
@@ -155,24 +227,45 @@ def ui_export_options() -> Dict[str, Any]:
         "Kies Excel-sjabloon:",
         options=[
             {"label": "Gebruik ingebouwd HUP-sjabloon", "value": "builtin"},
-            {"label": "Upload aangepast HUP-sjabloon", "value": "custom"}
+            {"label": "Upload aangepast HUP-sjabloon", "value": "custom"},
+            {"label": "Werk een bestaande HUP bij (ingevulde kolommen blijven behouden)", "value": "update"}
         ],
         required=True
     )
     
     # Use get_resource_path for reading the template
     from data_management import get_resource_path
+    from template_cache import store_uploaded_template
     template_path = get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx"))
     
     if template_selection == "custom":
         template_file = file_upload("Upload Excel-sjabloon:", accept=".xlsx", required=True)
         if template_file:
+            template_path = store_uploaded_template(template_file['content'])
+    
+    previous_hup_path = None
+    if template_selection == "update":
+        previous_file = file_upload("Upload de vorige HUP:", accept=".xlsx", required=True)
+        if previous_file:
             with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-                temp_file.write(template_file['content'])
-                template_path = temp_file.name
+                temp_file.write(previous_file['content'])
+                previous_hup_path = temp_file.name
     
     options = {}
     options["template_path"] = template_path
+    options["previous_hup_path"] = previous_hup_path
+    
+    # Updating an existing HUP only works on the Excel sheet
+    options["output_format"] = "xlsx"
+    if previous_hup_path is None:
+        formats = available_formats()
+        options["output_format"] = radio(
+            "Uitvoerformaat:",
+            options=[{"label": spec["label"] + ("" if formats[key] else " (vereist pyarrow)"), "value": key,
+                      "disabled": not formats[key]} for key, spec in EXPORT_FORMATS.items()],
+            value=APP_SETTINGS["format"] if formats.get(APP_SETTINGS["format"]) else "xlsx",
+            required=True
+        )
     
     options["remove_no_name"] = checkbox(
         "Uitvoeropties:", 
@@ -184,58 +277,128 @@ def ui_export_options() -> Dict[str, Any]:
         options=[{"label": "Voeg klasse A objecten toe (waarschuwing: dit kan de verwerkingstijd aanzienlijk verlengen)", "value": "add_A"}]
     )
     
+    options["show_timings"] = checkbox(
+        "Diagnose:", 
+        options=[
+            {"label": "Toon tijdsoverzicht van de verwerking", "value": "show_timings"},
+            {"label": "Maak een profielrapport (CPU en geheugen; verwerking wordt trager)", "value": "profile"}
+        ],
+        value=["profile"] if APP_SETTINGS["profile"] else []
+    )
+    
     return options
 
-def ui_process_and_export(tree: KRO_Tree, selected_filters: List[str], export_options: Dict[str, Any]) -> None:
-    """Process the data with selected filters and export to Excel."""
+def ui_process_and_export(tree: "KRO_Tree", selected_filters: List[str], export_options: Dict[str, Any]) -> None:
+    """Process the data with selected filters and export to Excel or another output format."""
+    from data_management import get_executable_relative_path, FILTER_DEFINITIONS, apply_filter_to_tree
+    from memory_budget import MemoryBudget
+    from output_cache import OUTPUT_CACHE, output_key
+    
     put_markdown("## Verwerken en Genereren van de HUP")
     
     # Initialize process bar
     put_processbar('process_bar')
     set_processbar('process_bar', 0)
     
-    total_steps = len(selected_filters) + 1  # Filters + Excel export
+    total_steps = len(selected_filters) + 1  # Filters + export
     current_step = 0
     
+    # The same files, filters and options as an earlier request give the same HUP, which is then reused
+    output_format = export_options.get("output_format", "xlsx")
+    cache_key = None
+    if APP_SETTINGS["output_cache"]:
+        OUTPUT_CACHE.max_bytes = APP_SETTINGS["output_cache"] * 2 ** 20
+        try:
+            cache_key = output_key(tree.fingerprint, selected_filters, output_format,
+                                   add_A="add_A" in export_options["add_A"],
+                                   remove_no_name="remove_no_name" in export_options["remove_no_name"],
+                                   template_path=export_options.get("template_path"),
+                                   previous_hup_path=export_options.get("previous_hup_path"))
+        except OSError as e:
+            logging.warning("No output cache key: %s", e)
+    cached_path = cache_key and OUTPUT_CACHE.get(cache_key, EXPORT_FORMATS[output_format]['extension'])
+    
     # Apply filters
-    put_info("Filters toepassen...")
+    if cached_path:
+        put_info("Deze HUP is eerder gemaakt met dezelfde bestanden, filters en opties; het bewaarde bestand wordt "
+                 "gebruikt.")
+    else:
+        put_info("Filters toepassen...")
     try:
-        for filter_key in selected_filters:
-            current_step += 1
-            put_text(f"Filter toepassen: {FILTER_DEFINITIONS[filter_key]['name']}")
-            apply_filter_to_tree(tree, filter_key)
+        if cached_path:
+            current_step = len(selected_filters)
+            set_processbar('process_bar', current_step / total_steps)
+        elif APP_SETTINGS["parallel_filters"] > 1:
+            from parallel_filters import apply_filters_parallel
+            put_text(f"Filters toepassen in {APP_SETTINGS['parallel_filters']} processen: "
+                     f"{', '.join(FILTER_DEFINITIONS[key]['name'] for key in selected_filters)}")
+            apply_filters_parallel(tree, selected_filters, workers=APP_SETTINGS["parallel_filters"],
+                                   by=APP_SETTINGS["partition"])
+            current_step = len(selected_filters)
             set_processbar('process_bar', current_step / total_steps)
+        else:
+            for filter_key in selected_filters:
+                current_step += 1
+                put_text(f"Filter toepassen: {FILTER_DEFINITIONS[filter_key]['name']}")
+                apply_filter_to_tree(tree, filter_key)
+                set_processbar('process_bar', current_step / total_steps)
     except Exception as e:
         put_error(f"Fout bij het toepassen van filters: {str(e)}")
         return
     
-    # Export to Excel
-    put_info("Excel-bestand genereren...")
+    # Export to Excel or one of the other formats
+    file_label = f"{EXPORT_FORMATS[output_format]['name']}-bestand"
+    if not cached_path:
+        put_info(f"{file_label} genereren...")
+    output_path = None
     try:
         # Create output directory if it doesn't exist
         output_dir = get_executable_relative_path("HUP")
         os.makedirs(output_dir, exist_ok=True)
         
         datetime_string = datetime.now().strftime("%d-%m-%Y_%H-%M")
-        output_filename = f"HUP-{datetime_string}.xlsx"
+        output_filename = f"HUP-{datetime_string}{EXPORT_FORMATS[output_format]['extension']}"
         output_path = os.path.join(output_dir, output_filename)
         
-        # Generate the Excel file
-        tree.insert_dataframe_into_excel(
-            export_options["template_path"],
-            "Online Checklist Bedrijven", 
-            2,
-            output_path=output_path,
-            add_A="add_A" in export_options["add_A"],
-            remove_no_name="remove_no_name" in export_options["remove_no_name"]
-        )
+        # Copy the cached file, generate the Excel file, update the previous HUP in place, or write another format
+        if cached_path:
+            shutil.copyfile(cached_path, output_path)
+        elif output_format != "xlsx":
+            tree.export_file(
+                output_format,
+                output_path=output_path,
+                add_A="add_A" in export_options["add_A"],
+                remove_no_name="remove_no_name" in export_options["remove_no_name"]
+            )
+        elif export_options.get("previous_hup_path"):
+            tree.update_excel(
+                export_options["previous_hup_path"],
+                "Online Checklist Bedrijven",
+                2,
+                output_path=output_path,
+                add_A="add_A" in export_options["add_A"],
+                remove_no_name="remove_no_name" in export_options["remove_no_name"]
+            )
+        else:
+            tree.insert_dataframe_into_excel(
+                export_options["template_path"],
+                "Online Checklist Bedrijven", 
+                2,
+                output_path=output_path,
+                add_A="add_A" in export_options["add_A"],
+                remove_no_name="remove_no_name" in export_options["remove_no_name"]
+            )
+        
+        if cache_key and not cached_path and os.path.exists(output_path):
+            OUTPUT_CACHE.put(cache_key, output_path, EXPORT_FORMATS[output_format]['extension'])
         
         current_step += 1
         set_processbar('process_bar', current_step / total_steps)
         
         # Verify the file was actually created
         if os.path.exists(output_path):
-            put_success(f"Excel-bestand succesvol gegenereerd!")
+            put_success(f"{file_label} succesvol gegenereerd!")
+            put_text((tree.memory_budget or MemoryBudget(None)).report())
             
             # Display file info with simple access options
             put_html(f"""
@@ -270,7 +433,7 @@ def ui_process_and_export(tree: KRO_Tree, selected_filters: List[str], export_op
                     break
             
             if found_location:
-                put_success("Excel-bestand succesvol gegenereerd!")
+                put_success(f"{file_label} succesvol gegenereerd!")
                 
                 put_html(f"""
                 <div style="margin-top: 15px; padding: 15px; background-color: #d4edda; border-radius: 5px;">
@@ -303,10 +466,60 @@ def ui_process_and_export(tree: KRO_Tree, selected_filters: List[str], export_op
         put_text(f"Details: {str(e)}")
         put_text("Zorg ervoor dat u schrijfrechten heeft voor de uitvoermap en dat het bestand niet open is in een ander programma.")
     except Exception as e:
-        put_error(f"Fout bij het genereren van Excel-bestand: {str(e)}")
+        put_error(f"Fout bij het genereren van {file_label}: {str(e)}")
     
     # Process completed
     set_processbar('process_bar', 1)
+    
+    if "show_timings" in export_options.get("show_timings", []):
+        ui_timing_panel(tree.tracer, output_path)
+
+def ui_timing_panel(tracer: Tracer, output_path: str) -> None:
+    """Show how long each stage of the run took and offer the timings as JSON."""
+    from data_management import get_executable_relative_path
+    
+    put_markdown("### Tijdsoverzicht")
+    
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else ""
+    
+    rows = []
+    for row in tracer.summary():
+        rows.append([
+            put_html(f'<span style="padding-left: {row["depth"] * 20}px;">{row["name"]}</span>'),
+            fmt(row["seconds"], "{:.3f} s"),
+            fmt(row["share"], "{:.0%}"),
+            fmt(row["rows_in"], "{}"),
+            fmt(row["rows_out"], "{}"),
+            fmt(row["selectivity"], "{:.1%}"),
+            fmt(row["rss_delta_mb"], "{:+.1f} MB"),
+        ])
+    put_table(rows, header=["Stap", "Duur", "Aandeel", "Rijen in", "Rijen uit", "Selectiviteit", "Geheugen"])
+    
+    try:
+        if output_path is None:
+            output_path = get_executable_relative_path("HUP", f"HUP-{datetime.now().strftime('%d-%m-%Y_%H-%M')}.xlsx")
+        json_path = tracer.to_json(os.path.splitext(output_path)[0] + "-tijden.json")
+        put_button("💾 Download tijden (JSON)", onclick=lambda: download_file(json_path), color='secondary')
+    except OSError as e:
+        put_warning(f"Tijdsoverzicht kon niet worden opgeslagen: {str(e)}")
+
+def ui_profile_report(profiler: "ProfileSession") -> None:
+    """Save the profile of the run and offer the report for download."""
+    put_markdown("### Profielrapport")
+    try:
+        paths = profiler.save()
+    except OSError as e:
+        put_error(f"Profielrapport kon niet worden opgeslagen: {str(e)}")
+        return
+    
+    rows = [[row["name"], f'{row["seconds"]:.3f} s'] for row in profiler.focus_functions()]
+    put_table(rows, header=["Onderdeel", "Duur"])
+    put_text(f"Rapport opgeslagen in: {paths['html']}")
+    put_row([
+        put_button("💾 Download rapport (HTML)", onclick=lambda: download_file(paths["html"]), color='primary'),
+        put_button("💾 Download profiel (.prof)", onclick=lambda: download_file(paths["prof"]), color='secondary'),
+    ], size='40% 40%')
 
 def open_file_location(file_path):
     """Open the folder containing the specified file."""
@@ -342,20 +555,37 @@ def download_file(file_path):
     else:
         put_error("Bestand niet gevonden om te downloaden.")
 
+def ui_queue_position(position: int) -> None:
+    """Show the place in the queue while other users' jobs occupy all slots of the server."""
+    with use_scope('wachtrij', clear=True):
+        put_warning(f"De server is bezig met de verwerking van andere gebruikers. "
+                    f"Uw positie in de wachtrij: {position}. De verwerking start automatisch.")
+
 def main():
     """Main application flow."""
+    from classes import KRO_Tree
+    from profiling import ProfileSession, ProfileBusy
+    from memory_budget import MemoryBudget
+    
     try:
         ui_header()
         
+        # Timings of this session's run
+        tracer = Tracer()
+        
         # Step 1: File Upload
-        df_aanzien, df_gebruik = ui_file_upload()
+        df_aanzien, df_gebruik, fingerprint = ui_file_upload(tracer)
         if df_aanzien is None or df_gebruik is None:
             put_text("Probeer het opnieuw met geldige CSV-bestanden.")
             return
         
         # Initialize KRO Tree
         try:
-            tree = KRO_Tree(df_aanzien, df_gebruik)
+            tree = KRO_Tree(df_aanzien, df_gebruik, tracer=tracer, fingerprint=fingerprint,
+                            backend=APP_SETTINGS["backend"],
+                            memory_budget=MemoryBudget(APP_SETTINGS["memory_budget"])
+                            if APP_SETTINGS["memory_budget"] else None,
+                            enriched_view=APP_SETTINGS["enriched_view"] or None)
         except Exception as e:
             put_error(f"Fout bij het initialiseren van de gegevensverwerker: {str(e)}")
             put_text("Er kan een probleem zijn met de structuur van uw CSV-bestanden.")
@@ -363,7 +593,7 @@ def main():
         
         # Step 2: Filter Selection
         try:
-            selected_filters = ui_filter_selection()
+            selected_filters = ui_filter_selection(tree)
             if not selected_filters:
                 put_warning("Er zijn geen filters geselecteerd. De uitvoer kan leeg zijn.")
         except Exception as e:
@@ -377,8 +607,29 @@ def main():
             put_error(f"Fout bij het configureren van uitvoeropties: {str(e)}")
             return
         
-        # Step 4: Processing and Export
-        ui_process_and_export(tree, selected_filters, export_options)
+        # Step 4: Processing and Export, once the server has a free slot for a heavy job
+        put_scope('wachtrij')
+        try:
+            with admitted(on_wait=ui_queue_position):
+                clear('wachtrij')
+                profiler = None
+                with contextlib.ExitStack() as stack:
+                    if "profile" in export_options.get("show_timings", []):
+                        try:
+                            profiler = stack.enter_context(ProfileSession())
+                        except ProfileBusy as e:
+                            put_warning(f"Geen profielrapport voor deze verwerking: {str(e)} "
+                                        f"Probeer het later opnieuw.")
+                    ui_process_and_export(tree, selected_filters, export_options)
+                if profiler is not None:
+                    ui_profile_report(profiler)
+        finally:
+            # The uploaded previous HUP is only needed for this export
+            if export_options.get("previous_hup_path"):
+                try:
+                    os.remove(export_options["previous_hup_path"])
+                except OSError as e:
+                    logging.warning("Could not remove %s: %s", export_options["previous_hup_path"], e)
         
         # Completion
         put_markdown("## Verwerking Voltooid")
@@ -405,24 +656,104 @@ def setup_app_launcher():
     parser.add_argument("--port", type=int, default=8080, help="Port voor de webserver")
     parser.add_argument("--no-browser", action="store_true", help="Browser niet automatisch openen")
     parser.add_argument("--server", action="store_true", help="Als server draaien in plaats van standalone app")
+    parser.add_argument("--profile", action="store_true", help="Profielrapport (CPU en geheugen) standaard aanzetten")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="xlsx",
+                        help="Standaard uitvoerformaat (xlsx, parquet, feather, csv of geojson)")
+    parser.add_argument("--startup-report", metavar="PAD", help="Opstarttijden per fase als JSON opslaan")
+    parser.add_argument("--backend", choices=["pandas", "duckdb", "numpy"], default="pandas",
+                        help="Uitvoering van de filters: pandas (standaard), duckdb (vereist duckdb) of numpy "
+                             "(compact kernmodel)")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="Geheugenbudget per verwerking; daarboven worden tussenresultaten tijdelijk naar schijf "
+                             "geschreven")
+    parser.add_argument("--no-enriched-view", action="store_true",
+                        help="Afgeleide HUP-kolommen niet per KRO-release op schijf bewaren, maar bij elke export "
+                             "opnieuw afleiden")
+    parser.add_argument("--parallel-filters", type=int, default=1, metavar="N",
+                        help="Filterdefinities verdeeld over N processen uitvoeren (zelfde HUP als met 1 proces)")
+    parser.add_argument("--partition", choices=["rows", "gemnaam"], default="rows",
+                        help="Verdeling van de objecten over de processen: op volgorde van de rijen of per gemeente")
+    parser.add_argument("--output-cache", type=float, default=500, metavar="MB",
+                        help="Grootte van de cache met eerder gemaakte HUP-bestanden (0 schakelt de cache uit)")
+    parser.add_argument("--api-port", type=int, metavar="PORT",
+                        help="JSON-API voor het aanvragen van HUP's door andere systemen op deze poort starten")
+    parser.add_argument("--api-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Aantal werkprocessen van de API (gelijktijdige opdrachten)")
+    parser.add_argument("--api-per-client", type=int, default=1,
+                        help="Maximaal aantal gelijktijdig lopende API-opdrachten per client")
+    parser.add_argument("--api-host", default="127.0.0.1",
+                        help="Adres waarop de API luistert (standaard alleen localhost; de API heeft geen "
+                             "authenticatie, dus alleen openstellen binnen een vertrouwd netwerk)")
+    parser.add_argument("--api-trusted-proxy", action="append", default=[], metavar="IP",
+                        help="IP-adres van een proxy waarvan de header X-Client-Id de client aangeeft (herhaalbaar); "
+                             "anders telt het IP-adres als client")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Aantal werkprocessen in servermodus (meer dan 1 start een proxy met sessie-affiniteit)")
+    parser.add_argument("--max-jobs", type=int, default=None,
+                        help="Maximaal aantal gelijktijdige verwerkingen in servermodus; de rest wacht in een wachtrij")
     args = parser.parse_args()
     
+    APP_SETTINGS["profile"] = args.profile
+    APP_SETTINGS["format"] = args.format
+    APP_SETTINGS["backend"] = args.backend
+    APP_SETTINGS["memory_budget"] = args.memory_budget
+    APP_SETTINGS["enriched_view"] = not args.no_enriched_view
+    APP_SETTINGS["parallel_filters"] = args.parallel_filters
+    APP_SETTINGS["partition"] = args.partition
+    APP_SETTINGS["output_cache"] = args.output_cache
+    
+    # Pipeline progress is reported through logging; show it on the console
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
+    STARTUP.mark("argumenten en logging")
+    
     is_frozen = getattr(sys, 'frozen', False)
     
     # Determine if we should run as a server or standalone app
     run_as_server = args.server and not is_frozen
+    multi_process = run_as_server and args.workers > 1
     
-    if not run_as_server:
-        # We're running as a standalone app - open browser automatically
-        if not args.no_browser:
-            def open_browser():
-                time.sleep(1.5)  # Wait a bit for the server to start
-                url = f"http://localhost:{args.port}"
-                print(f"HUP Generator openen in uw webbrowser: {url}")
-                webbrowser.open(url)
-            
-            threading.Thread(target=open_browser).start()
+    # JSON API for other systems, served from a thread next to the UI; jobs run in their own processes
+    if args.api_port:
+        from job_api import JobQueue, start_api_server
+        job_queue = JobQueue(workers=args.api_workers, per_client=args.api_per_client,
+                             output_cache_mb=args.output_cache)
+        start_api_server(job_queue, args.api_port, address=args.api_host, trusted_proxies=args.api_trusted_proxy)
+        print(f"HUP API op http://{args.api_host}:{args.api_port}/api ({job_queue.workers} werkprocessen)")
+    
+    # Once the server is listening: open the browser, load the data stack and report the startup times
+    def after_server_start():
+        if not wait_for_port(args.port):
+            logging.warning("De webserver reageert niet op poort %s.", args.port)
+            return
+        STARTUP.mark("webserver luistert")
+        
+        if not run_as_server and not args.no_browser:
+            url = f"http://localhost:{args.port}"
+            print(f"HUP Generator openen in uw webbrowser: {url}")
+            webbrowser.open(url)
+            STARTUP.mark("browser geopend")
+        
+        # With several workers the data stack is loaded by the workers, not by the proxy process
+        if not multi_process:
+            warm_up()
+            STARTUP.mark("gegevensmodules geladen (achtergrond)")
+        
+        # Remove custom templates uploaded in earlier sessions that are no longer used
+        from template_cache import cleanup_uploaded_templates
+        cleanup_uploaded_templates()
+        if APP_SETTINGS["output_cache"]:
+            from output_cache import OUTPUT_CACHE
+            OUTPUT_CACHE.max_bytes = APP_SETTINGS["output_cache"] * 2 ** 20
+            OUTPUT_CACHE.evict()
         
+        logging.info(STARTUP.report())
+        if args.startup_report:
+            STARTUP.to_json(args.startup_report)
+    
+    threading.Thread(target=after_server_start, daemon=True).start()
+    
+    if not run_as_server:
         # Print instructions to console for clarity
         print("="*50)
         print("HUP Generator Tool")
@@ -446,7 +777,17 @@ def setup_app_launcher():
     else:
         # We're running as a server
         print(f"HUP Generator server starten op poort {args.port}")
-        start_server(main, port=args.port, debug=False)
+        if multi_process:
+            from server import run_multi_process
+            run_multi_process(main, port=args.port, workers=args.workers, max_jobs=args.max_jobs,
+                              settings=APP_SETTINGS)
+        else:
+            from pywebio.platform.flask import start_server
+            if args.max_jobs:
+                configure_admission(AdmissionController(args.max_jobs))
+            start_server(main, port=args.port, debug=False)
 
 if __name__ == "__main__":
+    # Worker processes of the API in the standalone executable
+    multiprocessing.freeze_support()
     setup_app_launcher()
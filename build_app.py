@@ -95,6 +95,11 @@ def build_executable(target_platform=None, clean=True, console=True):
     
     # Add hidden imports that might be needed
     cmd.extend(["--hidden-import=pandas", "--hidden-import=openpyxl"])
+    # Modules imported by name in startup.warm_up or inside functions of app.py
+    for module in ["data_management", "classes", "exporters", "template_cache", "profiling", "mask_cache",
+                   "memory_budget", "enriched_view", "job_api", "parallel_filters", "output_cache",
+                   "pywebio.platform.flask"]:
+        cmd.append(f"--hidden-import={module}")
     
     # Add the main script
     cmd.append("app.py")
@@ -1,83 +1,488 @@
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
 from datetime import datetime
 from data_management import get_executable_relative_path
+from instrumentation import NULL_TRACER, traced
+from mask_cache import MASK_CACHE, dataset_fingerprint, content_fingerprint, predicate_spec
+from filter_plan import Predicate, SPATIAL_KINDS
+from query_backend import create_backend
+from gebruik_aggregates import GebruikAggregates, AGGREGATE_COLUMNS, AGGREGATE_OPERATORS
+from spatial_index import GridIndex, load_polygon
+from template_cache import TEMPLATE_CACHE
+from exporters import EXPORT_FORMATS, CHUNK_WRITERS, write_dataframe, write_chunks
+from memory_budget import MemoryBudget, ChunkStore
+from enriched_view import EnrichedView, VIEW_DIR
+from functie_bitmap import FunctieBitmap, functie_columns
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Column of the HUP sheet holding the object id (bronsleutel)
+OBJECT_ID_COLUMN = 'Object ID'
+
+# Column of the HUP sheet that marks new, changed and removed objects after an update
+STATUS_COLUMN = 'Status HUP'
+
+# Comparison operators usable in filters, as functions from (series, value) to a boolean series
+MASK_FUNCTIONS = {
+    ">": lambda series, value: series > value,
+    "<": lambda series, value: series < value,
+    "==": lambda series, value: series == value,
+    "!=": lambda series, value: series != value,
+    ">=": lambda series, value: series >= value,
+    "<=": lambda series, value: series <= value,
+    "in": lambda series, value: series.isin(value)
+}
+
+# Columns of the HUP sheet that inspectors fill in; these are never overwritten by an update
+MANUAL_COLUMNS = ['Wijziging Naam', 'Checklist verstuurd?', 'Checklist uitgevoerd?', 'Datum uitgevoerd']
+
+
+def _cell_value(value):
+    """Normalizes a dataframe value the way it reads back from an Excel cell."""
+    if value is None or value == '' or (isinstance(value, float) and pd.isna(value)) or value is pd.NA:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _row_filter(mask_function):
+    """Turns a mask function into a function that filters the rows of a dataframe on a column."""
+    return lambda df, column, value: df[mask_function(df[column], value)]
+
 
 class KRO_Tree:
-    def __init__(self, dataframe_aanzien: pd.DataFrame, dataframe_gebruik: pd.DataFrame):
-        self.data_aanzien = dataframe_aanzien
-        self.data_aanzien['risico_classificatie'] = 'A'  # Add new column with all rows 'A'
-        self.original_data = dataframe_aanzien.copy()
+    def __init__(self, dataframe_aanzien: pd.DataFrame, dataframe_gebruik: pd.DataFrame, tracer=None,
+                 fingerprint=None, mask_cache=MASK_CACHE, aggregates=None, backend=None, memory_budget=None,
+                 enriched_view=None):
+        self.tracer = tracer or NULL_TRACER
+        # With a MemoryBudget the HUP is prepared and exported in chunks that can be written to disk
+        self.memory_budget = memory_budget
+        # Stored per release view of the derived HUP columns: True (in enriched_view.VIEW_DIR), a directory,
+        # an EnrichedView, or None to derive the columns on every export
+        self._enriched_view = enriched_view
+        if not dataframe_aanzien.index.is_unique:
+            dataframe_aanzien = dataframe_aanzien.reset_index(drop=True)
+        dataframe_aanzien['risico_classificatie'] = 'A'  # Add new column with all rows 'A'
         self.data_gebruik = dataframe_gebruik
-        self.HUP = pd.DataFrame(columns=dataframe_aanzien.columns)
+
+        # Aggregate KRO-gebruik per object once and join the aggregates onto the objects as plain columns
+        with self.tracer.span("gebruik aggregaten", rows_in=len(dataframe_gebruik)) as span:
+            self.gebruik_aggregates = aggregates if aggregates is not None else GebruikAggregates(dataframe_gebruik)
+            keys = dataframe_aanzien['bronsleutel']
+            aggregate_columns = self.gebruik_aggregates.columns_for(keys).set_axis(dataframe_aanzien.index)
+            self.original_data = pd.concat([dataframe_aanzien, aggregate_columns], axis=1)
+            self._gebruik_key_rows = self.gebruik_aggregates.keys.get_indexer(keys)
+            span.rows_out = len(self.gebruik_aggregates.keys)
+
+        # Pack the 0/1 *functie flags into one integer per object; the flag columns themselves shrink to uint8
+        with self.tracer.span("functie bitmap", rows_in=len(self.original_data)) as span:
+            self.functie_bitmap = FunctieBitmap.from_frame(self.original_data)
+            self.original_data = self.original_data.astype(
+                {column: np.uint8 for column in self.functie_bitmap.columns})
+            span.rows_out = len(self.functie_bitmap.columns)
+        logger.info("Function bitmap: %d flags in %.1f MB.", len(self.functie_bitmap.columns),
+                    self.functie_bitmap.nbytes / 2 ** 20)
         self.history = []
-        self.filter_functions = {
-            ">": lambda df, column, value: df[df[column] > value],
-            "<": lambda df, column, value: df[df[column] < value],
-            "==": lambda df, column, value: df[df[column] == value],
-            "!=": lambda df, column, value: df[df[column] != value],
-            ">=": lambda df, column, value: df[df[column] >= value],
-            "<=": lambda df, column, value: df[df[column] <= value],
-            "in": lambda df, column, value: df[df[column].isin(value)]
+        self.mask_cache = mask_cache
+        self._fingerprint = fingerprint
+        self._spatial_index = None
+        self._polygons = {}
+        self.filter_functions = {operator: _row_filter(function) for operator, function in MASK_FUNCTIONS.items()}
+
+        # Engine that runs the filter plan: 'pandas' (default), 'duckdb' or a backend instance
+        self.backend = create_backend(backend)
+
+        # The current selection is kept as positions in original_data (None means all rows) plus
+        # the risk class set on it; filter steps are collected in a plan and only run when needed
+        self._plan = []
+        self._positions = None
+        self._risk = None
+        self._frame = None
+
+        # Stored selections, materialized into the HUP dataframe on first access
+        self._hup_frame = pd.DataFrame(columns=self.original_data.columns)
+        self._hup_parts = []
+        # The selections the rows of _hup_frame come from; None once the HUP is set directly
+        self._hup_sources = []
+
+    @property
+    def fingerprint(self):
+        """
+        Fingerprint of the dataset, used as the key for cached predicate masks.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = dataset_fingerprint(self.original_data, self.data_gebruik)
+        return self._fingerprint
+
+    @property
+    def enriched_view(self):
+        """
+        The stored view of the derived HUP columns of this dataset, opened (and built when this release has
+        none yet) on first use; None when the tree has no view.
+        """
+        if self._enriched_view is True or isinstance(self._enriched_view, str):
+            directory = VIEW_DIR if self._enriched_view is True else self._enriched_view
+            with self.tracer.span("verrijkte objecten", rows_in=len(self.original_data)) as span:
+                self._enriched_view = EnrichedView.open(self.fingerprint, len(self.original_data),
+                                                        self._enriched_columns, directory)
+                span.rows_out = self._enriched_view.rows
+        if self._enriched_view is not None and self._enriched_view.rows != len(self.original_data):
+            raise ValueError(f"The enriched view has {self._enriched_view.rows} objects, "
+                             f"the data {len(self.original_data)}.")
+        return self._enriched_view
+
+    def _enriched_columns(self):
+        """
+        The columns of the enriched view: per object the HUP columns that only depend on the release.
+
+        The kept 'functie' label also depends on the other rows of the HUP (see prepare_dataframe), so the view
+        holds the label with the highest value and whether that value is truthy, and the label is checked
+        against the rows of the HUP when it is prepared.
+        """
+        df = self.original_data
+        columns = functie_columns(df.columns)
+        if columns and self.functie_bitmap.covers(columns):
+            # idxmax over 0/1 flags is the first set flag, which the bitmap gives without a pass over the columns
+            index, has_flag = self.functie_bitmap.dominant()
+            labels = pd.Series(np.asarray(self.functie_bitmap.columns, dtype=object)[index], index=df.index)
+            functie_ok = pd.Series(has_flag, index=df.index)
+        else:
+            functie = df[columns].apply(pd.to_numeric, errors='coerce')
+            values = functie.to_numpy(dtype=float, na_value=np.nan)
+            # Objects without any function value get no label (idxmax refuses them)
+            labelled = ~np.isnan(values).all(axis=1)
+            labels = pd.Series(np.nan, index=df.index, dtype=object)
+            labels[labelled] = functie[labelled].idxmax(axis=1)
+            label_columns = functie.columns.get_indexer(labels.fillna(functie.columns[0]))
+            functie_ok = pd.Series(values[np.arange(len(functie)), label_columns] != 0, index=df.index)
+        return {
+            'functie': labels,
+            'functie_ok': functie_ok,
+            'Adres': self._adres(df),
+            'Naam Bouwwerk': df[AGGREGATE_COLUMNS["naam_vol"]],
+            'Personen': df[AGGREGATE_COLUMNS["personen"]],
+            'SBI1': df[AGGREGATE_COLUMNS["act1code"]],
+            'SBI Omschrijving': df[AGGREGATE_COLUMNS["act1omschr"]],
         }
 
+    @property
+    def data_aanzien(self):
+        """
+        The current selection of objects as a dataframe; runs the pending filter plan first.
+        """
+        self.execute()
+        if self._frame is None:
+            if self._positions is None:
+                frame = self.original_data.copy()
+            else:
+                frame = self.original_data.iloc[self._positions]
+            if self._risk is not None:
+                frame = frame.assign(risico_classificatie=self._risk)
+            self._frame = frame
+        return self._frame
+
+    @data_aanzien.setter
+    def data_aanzien(self, dataframe):
+        """
+        Replaces the current selection by the rows of original_data with the index of the given dataframe.
+        """
+        self._plan = []
+        self._positions = self.original_data.index.get_indexer(dataframe.index)
+        self._frame = None
+
+    @property
+    def HUP(self):
+        """
+        All stored selections as one dataframe.
+        """
+        if self._hup_parts:
+            frames = []
+            for positions, risk in self._hup_parts:
+                frame = self.original_data.iloc[positions]
+                frames.append(frame.assign(risico_classificatie=risk) if risk is not None else frame)
+            self._hup_frame = pd.concat([self._hup_frame] + frames)
+            if self._hup_sources is not None:
+                self._hup_sources.extend(self._hup_parts)
+            self._hup_parts = []
+        return self._hup_frame
+
+    @HUP.setter
+    def HUP(self, dataframe):
+        self._hup_frame = dataframe
+        self._hup_parts = []
+        self._hup_sources = None
+
+    @property
+    def hup_rows(self):
+        """
+        Number of rows in the HUP, without materializing it.
+        """
+        return len(self._hup_frame) + sum(len(positions) for positions, _ in self._hup_parts)
+
+    def count(self):
+        """
+        Number of objects in the current selection; runs the pending filter plan first.
+        """
+        self.execute()
+        return len(self.original_data) if self._positions is None else len(self._positions)
+
+    def collect_predicates(self, add_steps):
+        """
+        Returns the filter steps that add_steps() adds to the plan, without running them or changing the selection.
+        """
+        plan = self._plan
+        self._plan = []
+        try:
+            add_steps()
+            return self._plan
+        finally:
+            self._plan = plan
+
+    def selection_mask(self, predicates):
+        """
+        Mask over all objects in original_data of the conjunction of the predicates (all objects if empty).
+        """
+        mask = np.ones(len(self.original_data), dtype=bool)
+        for predicate in predicates:
+            mask &= self.predicate_mask(predicate)
+        return mask
+
+    def count_preview(self, definitions):
+        """
+        Counts what storing each definition in the HUP would give, without building any dataframe.
+
+        The predicate masks over all objects are cached, so after the first call a new combination of
+        definitions only combines boolean arrays. Like prepare_dataframe, an object that matches several
+        definitions is counted once, with the risk class of the first definition it matches.
+
+        Args:
+            definitions: List of (key, predicates, risk class) in the order in which they would be applied
+
+        Returns:
+            Dictionary with 'definitions' (objects per key), 'total' (distinct objects), 'overlap' (objects
+            matching more than one definition) and 'risk' (objects per risk class)
+        """
+        counts, risk_counts = {}, {}
+        matched = np.zeros(len(self.original_data), dtype=np.int16)
+        for key, predicates, risk in definitions:
+            mask = self.selection_mask(predicates)
+            counts[key] = int(mask.sum())
+            risk_counts[risk] = risk_counts.get(risk, 0) + int((mask & (matched == 0)).sum())
+            matched += mask
+        return {"definitions": counts, "total": int((matched > 0).sum()), "overlap": int((matched > 1).sum()),
+                "risk": risk_counts}
+
+    def _mask(self, spec, compute):
+        """
+        Returns the mask of a predicate over original_data, from the cache when possible.
+        """
+        if self.mask_cache is None:
+            return np.asarray(compute(), dtype=bool)
+        return self.mask_cache.get_or_compute(self.fingerprint, spec, compute)
+
+    def _current_positions(self):
+        return np.arange(len(self.original_data)) if self._positions is None else self._positions
+
+    def _select(self, mask):
+        """
+        Returns the rows of data_aanzien for which the mask over original_data is true.
+        """
+        return self.data_aanzien[mask[self._current_positions()]]
+
+    def _log_step(self, action, span, rows_before, rows_remaining=None):
+        """
+        Records a filter step in the history, its span and the log.
+        """
+        if rows_remaining is None:
+            rows_remaining = len(self._current_positions())
+        rows_removed = rows_before - rows_remaining
+        if span is not None:
+            span.rows_out = rows_remaining
+        self.history.append({"action": action, "rows_removed": rows_removed, "rows_remaining": rows_remaining})
+        logger.info("%s: removed %d rows, %d rows remaining.", action, rows_removed, rows_remaining)
+
+    def column_mask(self, column, operator, value):
+        """
+        Mask of the objects in original_data for which 'column operator value' holds.
+        """
+        return self._mask(predicate_spec("column", column, operator, value),
+                          lambda: self.evaluate(Predicate("column", column, operator, value)))
+
+    def personen_mask(self, operator, value):
+        """
+        Mask of the objects that have at least one gebruik row with 'personen operator value',
+        or no gebruik rows at all.
+        """
+        return self._mask(predicate_spec("personen", operator, value),
+                          lambda: self.evaluate(Predicate("personen", operator, value)))
+
+    def sbi_mask(self, start_nums):
+        """
+        Mask of the objects that have a gebruik row whose 'act1code' starts with one of start_nums.
+        """
+        if isinstance(start_nums, int):
+            start_nums = [start_nums]
+        return self._mask(predicate_spec("sbi", sorted(start_nums)),
+                          lambda: self.evaluate(Predicate("sbi", start_nums)))
+
+    def predicate_mask(self, predicate):
+        """
+        Mask of a predicate over all objects in original_data.
+        """
+        if predicate.kind == "sbi":
+            return self.sbi_mask(*predicate.args)
+        if predicate.kind == "personen":
+            return self.personen_mask(*predicate.args)
+        if predicate.kind == "column":
+            return self.column_mask(*predicate.args)
+        return self._mask(predicate_spec(predicate.kind, *predicate.args), lambda: self.evaluate(predicate))
+
+    @property
+    def spatial_index(self):
+        """
+        Grid index over the x/y coordinates of original_data, built on first use.
+        """
+        if self._spatial_index is None:
+            with self.tracer.span("ruimtelijke index", rows_in=len(self.original_data)):
+                self._spatial_index = GridIndex(self.original_data['x'].to_numpy(dtype=float),
+                                                self.original_data['y'].to_numpy(dtype=float))
+        return self._spatial_index
+
+    def _polygon(self, path, digest):
+        """
+        Polygon rings of a GeoJSON file, read once per file content.
+        """
+        if digest not in self._polygons:
+            self._polygons[digest] = load_polygon(path)
+        return self._polygons[digest]
+
+    def cached_mask(self, predicate):
+        """
+        Returns the cached mask of a predicate, or None if it has not been computed for this dataset.
+        """
+        if self.mask_cache is None:
+            return None
+        args = (sorted(predicate.args[0]),) if predicate.kind == "sbi" else predicate.args
+        return self.mask_cache.peek(self.fingerprint, predicate_spec(predicate.kind, *args))
+
+    def evaluate(self, predicate, positions=None):
+        """
+        Evaluates a predicate for the objects at the given positions of original_data (all objects if None).
+
+        SBI codes and personen comparisons with >, >=, < and <= are answered from the gebruik aggregates;
+        other personen comparisons only look at the gebruik rows of the given objects.
+        """
+        def objects(column):
+            series = self.original_data[column]
+            return series if positions is None else series.iloc[positions]
+
+        if predicate.kind == "column":
+            column, operator, value = predicate.args
+            if column in self.functie_bitmap:
+                # A flag is 0 or 1, so the outcome for both values decides the mask
+                passes = MASK_FUNCTIONS[operator](pd.Series([1, 0], dtype=np.uint8), value).to_numpy(dtype=bool)
+                return self.functie_bitmap.flag_mask(column, passes[0], passes[1], positions)
+            return MASK_FUNCTIONS[operator](objects(column), value).to_numpy(dtype=bool)
+
+        if predicate.kind == "functie":
+            all_of, none_of, any_of = predicate.args
+            if self.functie_bitmap.covers(all_of + none_of + any_of):
+                return self.functie_bitmap.combination_mask(all_of, none_of, any_of, positions)
+            # Flag columns that could not be packed: a function counts when its column equals 1
+            is_set = {column: (objects(column) == 1).to_numpy(dtype=bool) for column in all_of + none_of + any_of}
+            mask = np.ones(len(self.original_data) if positions is None else len(positions), dtype=bool)
+            for column in all_of:
+                mask &= is_set[column]
+            for column in none_of:
+                mask &= ~is_set[column]
+            if any_of:
+                mask &= np.logical_or.reduce([is_set[column] for column in any_of])
+            return mask
+
+        if predicate.kind in SPATIAL_KINDS:
+            # Spatial predicates are defined over the whole dataset, so the full mask is sliced
+            if predicate.kind == "radius":
+                mask = self.spatial_index.within_radius(*predicate.args)
+            elif predicate.kind == "nearest":
+                mask = self.spatial_index.nearest(*predicate.args)
+            else:
+                mask = self.spatial_index.within_polygon(self._polygon(*predicate.args))
+            return mask if positions is None else mask[positions]
+
+        if predicate.kind == "sbi":
+            # Prefix match on the sorted code vocabulary, then on the code set of each object
+            start_nums = predicate.args[0]
+            hit = self.gebruik_aggregates.matching_codes(start_nums)
+            if positions is None:
+                for start_num in start_nums:
+                    if not self.gebruik_aggregates.matching_codes([start_num]).any():
+                        logger.info("No act1code starting with %s was found in the data_gebruik dataframe.",
+                                    start_num)
+            key_mask = self.gebruik_aggregates.sbi_key_mask(start_nums, hit)
+            key_rows = self._gebruik_key_rows if positions is None else self._gebruik_key_rows[positions]
+            return (key_rows >= 0) & key_mask[np.maximum(key_rows, 0)]
+
+        operator, value = predicate.args
+        if operator in AGGREGATE_OPERATORS:
+            # Some gebruik row passes exactly when the highest (for > and >=) or lowest (for < and <=) does
+            aggregate = AGGREGATE_COLUMNS["personen_max" if operator.startswith(">") else "personen_min"]
+            matching = MASK_FUNCTIONS[operator](objects(aggregate), float(value)).to_numpy(dtype=bool)
+            return (objects(AGGREGATE_COLUMNS["rows"]) == 0).to_numpy() | matching
+
+        # Other operators still need the gebruik rows of the objects
+        keys = objects('bronsleutel')
+        gebruik = self.data_gebruik
+        if positions is not None:
+            gebruik = gebruik[gebruik['aanzien_id'].isin(keys)]
+        matching = MASK_FUNCTIONS[operator](gebruik['personen'], float(value)).to_numpy(dtype=bool)
+        return (~keys.isin(gebruik['aanzien_id']) | keys.isin(gebruik['aanzien_id'][matching])).to_numpy()
+
+    def execute(self):
+        """
+        Runs the pending filter plan on the current selection with the backend of the tree.
+        """
+        if not self._plan:
+            return
+        plan = self._plan
+        self._plan = []
+        self.backend.execute(self, plan)
+
     def filter(self, column, operator, value):
         if column == "personen":
             self.filter_personen(operator, value)
-        elif operator in self.filter_functions:
-            df_filtered = self.filter_functions[operator](self.data_aanzien, column, value)
-            rows_removed = len(self.data_aanzien) - len(df_filtered)
-            rows_remaining = len(df_filtered)
-            print("")
-            print(f"Filtering on {column} {operator} {value}")
-            print(f"Removed {rows_removed} rows, {rows_remaining} rows remaining.")
-            self.data_aanzien = df_filtered
-            self.history.append({"action": f"filter {column} {operator} {value}", "rows_removed": rows_removed,
-                                 "rows_remaining": rows_remaining})
+        elif operator in MASK_FUNCTIONS:
+            self._plan.append(Predicate("column", column, operator, value))
         else:
-            print("Please provide a valid operator.")
+            logger.warning("Please provide a valid operator.")
 
     def filter_personen(self, operator, value):
-        # List to store the bronsleutel that satisfy the filter condition
-        valid_bronsleutel = []
-
-        # Iterate over each row in 'data_aanzien'
-        for index, row in self.data_aanzien.iterrows():
-            bronsleutel = row['bronsleutel']  # Get the corresponding 'bronsleutel'
-
-            # Check if 'bronsleutel' exists as 'aanzien_id' in 'data_gebruik'
-            matched_rows = self.data_gebruik[self.data_gebruik['aanzien_id'] == bronsleutel]
-            # If 'bronsleutel' exists in 'data_gebruik', check if any of the 'personen' values satisfy the filter condition
-            if not matched_rows.empty:
-                if not self.filter_functions[operator](matched_rows, 'personen', float(value)).empty:
-                    valid_bronsleutel.append(bronsleutel)
-                    # print(f"bronsleutel: {bronsleutel} satisfies the filter condition.")
-                else:
-                    pass
-                    # print(f"bronsleutel: {bronsleutel} does not satisfy the filter condition.")
-            else:
-                # If there are zero matches for a bronsleutel -> aanzien_id the filter is true
-                valid_bronsleutel.append(bronsleutel)
-                # print(
-                #    f"bronsleutel: {bronsleutel} does not have a match in data_gebruik, so the filter condition is deemed true.")
-
-        # Log the filter operation in history - FIX: use dictionary format like other methods
-        original_rows = len(self.data_aanzien)
-        self.data_aanzien = self.data_aanzien[self.data_aanzien['bronsleutel'].isin(valid_bronsleutel)]
-        filtered_rows = len(self.data_aanzien)
-        removed_rows = original_rows - filtered_rows
-        print("")
-        print(f"Filtering on Personen {operator} {value}")
-        
-        # Fix: use dictionary format for history
-        self.history.append({"action": f"filter Personen {operator} {value}", 
-                            "rows_removed": removed_rows, 
-                            "rows_remaining": filtered_rows})
+        self._plan.append(Predicate("personen", operator, value))
+
+    def filter_functie(self, all_of=(), none_of=(), any_of=()):
+        """
+        Keeps the objects with all functions of all_of, none of none_of and, if given, at least one of any_of,
+        e.g. filter_functie(['kantoorfunctie'], none_of=['winkelfunctie']) for 'kantoor and not winkel'.
 
-        print(f"Removed {removed_rows} rows, {filtered_rows} rows remaining.")
+        Args:
+            all_of: Flag columns (ending with 'functie') that must be set
+            none_of: Flag columns that must not be set
+            any_of: Flag columns of which at least one must be set
+        """
+        all_of, none_of, any_of = (tuple([columns] if isinstance(columns, str) else columns)
+                                   for columns in (all_of, none_of, any_of))
+        unknown = [column for column in all_of + none_of + any_of if column not in self.original_data.columns]
+        if unknown:
+            logger.warning("Unknown function columns: %s", ", ".join(unknown))
+            return
+        self._plan.append(Predicate("functie", all_of, none_of, any_of))
 
     def filter_or(self, filter1, filter2):
         column1, operator1, value1 = filter1
@@ -85,17 +490,17 @@ class KRO_Tree:
 
         # Check if the operators provided are valid
         if operator1 not in self.filter_functions or operator2 not in self.filter_functions:
-            print("Please provide valid operators.")
+            logger.warning("Please provide valid operators.")
             return
 
         # Apply the filters based on the column and operator
         if column1 == "personen":
-            df_filtered1 = self.filter_persons(operator1, value1)
+            df_filtered1 = self._select(self.personen_mask(operator1, value1))
         else:
             df_filtered1 = self.filter_functions[operator1](self.data_aanzien, column1, value1)
 
         if column2 == "personen":
-            df_filtered2 = self.filter_persons(operator2, value2)
+            df_filtered2 = self._select(self.personen_mask(operator2, value2))
         else:
             df_filtered2 = self.filter_functions[operator2](self.data_aanzien, column2, value2)
 
@@ -106,9 +511,8 @@ class KRO_Tree:
         rows_removed = len(self.data_aanzien) - len(df_filtered)
         rows_remaining = len(df_filtered)
 
-        print("")
-        print(f"Filtering on {column1} {operator1} {value1} OR {column2} {operator2} {value2}")
-        print(f"Removed {rows_removed} rows, {rows_remaining} rows remaining.")
+        logger.info("filter %s %s %s OR %s %s %s: removed %d rows, %d rows remaining.",
+                    column1, operator1, value1, column2, operator2, value2, rows_removed, rows_remaining)
 
         # Update the data_aanzien attribute with the filtered DataFrame
         self.data_aanzien = df_filtered
@@ -127,30 +531,33 @@ class KRO_Tree:
         elif 0 <= index < len(self.history):
             return self.history[index]
         else:
-            print("Please provide a valid index.")
+            logger.warning("Please provide a valid index.")
             return None
 
     def store_results(self):
         """
         Stores the remaining rows of the current DataFrame in the HUP DataFrame.
         """
-        self.HUP = pd.concat([self.HUP, self.data_aanzien])
+        rows_remaining = self.count()
+        self._hup_parts.append((self._current_positions(), self._risk))
         self.history.append(
-            {"action": "store results into HUP", "rows_removed": 0, "rows_remaining": len(self.data_aanzien)})
+            {"action": "store results into HUP", "rows_removed": 0, "rows_remaining": rows_remaining})
 
     def reset(self):
         """
-        Resets the DataFrame to its original state, keeping the 'risico_classificatie' column.
+        Resets the selection to all objects and drops any pending filter steps.
         """
-        risico_classificatie = self.data_aanzien['risico_classificatie'].copy()
-        self.data_aanzien = self.original_data.copy()
-        self.data_aanzien['risico_classificatie'] = risico_classificatie
+        self._plan = []
+        self._positions = None
+        self._risk = None
+        self._frame = None
 
     def save_hup(self):
         """
-        Saves the HUP DataFrame to a csv file.
+        Saves the HUP DataFrame to a csv file, with the KRO columns only.
         """
-        self.HUP.to_csv(get_executable_relative_path("data", "HUP-all_data.csv"), index=False)
+        hup = self.HUP.drop(columns=list(AGGREGATE_COLUMNS.values()), errors='ignore')
+        hup.to_csv(get_executable_relative_path("data", "HUP-all_data.csv"), index=False)
         self.history.append({"action": "save HUP to csv", "rows_removed": 0, "rows_remaining": 0})
 
     def set_risk(self, risk_class):
@@ -159,97 +566,236 @@ class KRO_Tree:
         """
         valid_classes = ["A", "B", "C"]
         if risk_class not in valid_classes:
-            print(f"Invalid risk classification. Please provide one of the following: {valid_classes}")
+            logger.warning("Invalid risk classification. Please provide one of the following: %s", valid_classes)
             return
 
-        self.data_aanzien['risico_classificatie'] = risk_class
+        rows_remaining = self.count()
+        self._risk = risk_class
+        self._frame = None
         self.history.append({"action": f"Set risk classification to {risk_class}",
-                             "rows_remaining": len(self.data_aanzien)})
-        print(f"Set risk classification to {risk_class}")
+                             "rows_remaining": rows_remaining})
+        logger.info("Set risk classification to %s", risk_class)
 
     def filter_SBI(self, start_nums):
         # Ensure start_nums is a list
         if isinstance(start_nums, int):
             start_nums = [start_nums]
 
-        temp_rows_list = []  # New list to hold temporary DataFrames
-
-        # Iterate over each number in start_nums and apply the filter
-        for start_num in start_nums:
-            # Get the rows in 'data_gebruik' where 'act1code' starts with 'start_num'
-            temp_rows = self.data_gebruik[self.data_gebruik['act1code'].astype(str).str.startswith(str(start_num))]
-
-            if not temp_rows.empty:
-                temp_rows_list.append(temp_rows)  # Add the DataFrame to the list
-            else:
-                print(f"No act1code starting with {start_num} was found in the data_gebruik dataframe.")
-
-        # Concatenate all temporary DataFrames in the list
-        matched_rows_gebruik = pd.concat(temp_rows_list) if temp_rows_list else pd.DataFrame()
+        self._plan.append(Predicate("sbi", start_nums))
 
-        if not matched_rows_gebruik.empty:
-            # Get the unique 'aanzien_id' from the matched rows
-            valid_aanzien_id = matched_rows_gebruik['aanzien_id'].unique()
+    def filter_radius(self, x, y, radius):
+        """
+        Keeps the objects within radius metres of the point (x, y) in RD coordinates.
+        """
+        self._plan.append(Predicate("radius", float(x), float(y), float(radius)))
 
-            # Filter 'data_aanzien' for rows whose 'bronsleutel' is in 'valid_aanzien_id'
-            original_rows = len(self.data_aanzien)
-            self.data_aanzien = self.data_aanzien[self.data_aanzien['bronsleutel'].isin(valid_aanzien_id)]
-            filtered_rows = len(self.data_aanzien)
-            removed_rows = original_rows - filtered_rows
-            
-            # Fix: use dictionary format for consistency
-            self.history.append({"action": f"filter SBI starting with {start_nums}", 
-                                "rows_removed": removed_rows, 
-                                "rows_remaining": filtered_rows})
+    def filter_polygon(self, path):
+        """
+        Keeps the objects inside the polygon(s) of a GeoJSON file with RD coordinates.
+        """
+        with open(path, 'rb') as f:
+            digest = content_fingerprint(f.read())
+        self._plan.append(Predicate("polygon", path, digest))
 
-            print(f"Filtering on act1code starting with {start_nums}")
-            print(f"Removed {removed_rows} rows, {filtered_rows} rows remaining.")
+    def filter_nearest(self, x, y, count):
+        """
+        Keeps the objects among the count objects of the whole dataset nearest to (x, y) in RD coordinates.
+        """
+        self._plan.append(Predicate("nearest", float(x), float(y), int(count)))
 
+    @traced("prepare")
     def prepare_dataframe(self, add_A=False):
+        if self.memory_budget is not None:
+            return self.prepared_chunks(add_A).concat()
+        view_rows = self._view_positions(add_A)
+        if view_rows is not None:
+            return self._hup_columns(self._view_rows(*view_rows))
+
         # Copy the dataframe to avoid modifying the original data
         df = self.HUP.copy()
 
         if add_A:
             df = pd.concat([df, self.original_data[self.original_data['risico_classificatie'] == 'A']])
 
+        self._add_functie(df)
+        df['functie'] = df['functie'].apply(lambda x: x if pd.notna(x) and df.loc[df['functie'] == x, x].all() else '')
+        return self._prepare_rows(df)
+
+    @staticmethod
+    def _add_functie(df):
+        """
+        Adds the 'functie' column: the name of the column ending with 'functie' with the highest value.
+        """
         # Find the column name where value is 1 among the columns ending with 'functie'
         func_cols = [col for col in df.columns if col.endswith('functie')]
         df[func_cols] = df[func_cols].apply(pd.to_numeric, errors='coerce')
 
         # Get the column name which has maximum value in each row among the columns ending with 'functie'
         df['functie'] = df[func_cols].idxmax(axis=1)
-        df['functie'] = df['functie'].apply(lambda x: x if pd.notna(x) and df.loc[df['functie'] == x, x].all() else '')
 
-        # Combine straatnaam, huisnr and huistoevg columns into a single column
-        df['adres'] = df['straatnaam'] + ' ' + df['huisnr'].apply(lambda x: str(int(x)) if pd.notna(x) else '') + df[
-            'huisletter'].apply(
-            lambda x: f'-{x}' if pd.notna(x) else '') + df['huistoevg'].apply(lambda x: f'{x}' if pd.notna(x) else '')
+    def _hup_chunks(self, add_A, chunk_rows):
+        """
+        Yields the rows that prepare_dataframe starts from (the HUP, then the class A objects) in chunks,
+        with the dtypes they get in the concatenated HUP.
+        """
+        template = self._hup_frame.iloc[:0]
+        pieces = [(positions, risk) for positions, risk in self._hup_parts]
+        if add_A:
+            pieces.append((np.flatnonzero((self.original_data['risico_classificatie'] == 'A').to_numpy()), None))
+
+        yielded = False
+        for start in range(0, len(self._hup_frame), chunk_rows):
+            yielded = True
+            yield self._hup_frame.iloc[start:start + chunk_rows].copy()
+        for positions, risk in pieces:
+            for start in range(0, len(positions), chunk_rows):
+                frame = self.original_data.iloc[positions[start:start + chunk_rows]]
+                if risk is not None:
+                    frame = frame.assign(risico_classificatie=risk)
+                yielded = True
+                yield pd.concat([template, frame])
+        if not yielded:
+            yield self._hup_frame.copy()
+
+    def _view_positions(self, add_A):
+        """
+        The rows prepare_dataframe starts from when they can be taken from the enriched view.
+
+        Returns:
+            None when the tree has no view, the HUP holds rows that were not selected from original_data or
+            there are no rows; otherwise per row, after removing duplicate ids, its position in original_data,
+            its risk class and its 'functie' label
+        """
+        if self._hup_sources is None or self.enriched_view is None:
+            return None
+        pieces = self._hup_sources + self._hup_parts
+        if add_A:
+            pieces = pieces + [(np.flatnonzero((self.original_data['risico_classificatie'] == 'A').to_numpy()), None)]
+        if not sum(len(positions) for positions, _ in pieces):
+            return None
+        positions = np.concatenate([np.asarray(positions, dtype=np.int64) for positions, _ in pieces])
+        original_risks = self.original_data['risico_classificatie'].to_numpy(dtype=object)
+        risks = np.concatenate([np.full(len(part), risk, dtype=object) if risk is not None
+                                else original_risks[part] for part, risk in pieces])
+
+        # A label is kept when its column is truthy on every row of the HUP with that label
+        view = self.enriched_view
+        codes = view.codes('functie', positions)
+        failing = np.unique(codes[~view.take('functie_ok', positions)])
+        kept = (codes >= 0) & ~np.isin(codes, failing)
+        functie = np.full(len(positions), '', dtype=object)
+        functie[kept] = view.labels('functie')[codes[kept]]
 
-        # Filter self.data_gebruik for non-empty 'naam_vol' and take the first occurrence for each 'aanzien_id'
-        data_gebruik_filtered = self.data_gebruik.loc[self.data_gebruik['naam_vol'].notna()].drop_duplicates(
-            'aanzien_id', keep='first')
+        first = ~pd.Series(self.original_data['id'].to_numpy()[positions]).duplicated(keep='first').to_numpy()
+        return positions[first], risks[first], functie[first]
 
-        # Map 'bronsleutel' from df to 'naam_vol' from data_gebruik_filtered
-        df['Bouwwerk'] = df['bronsleutel'].map(data_gebruik_filtered.set_index('aanzien_id')['naam_vol'])
+    def _view_rows(self, positions, risks, functie):
+        """
+        Rows of the HUP with the columns _hup_columns reads, taken from original_data and the enriched view.
+        """
+        view = self.enriched_view
+        columns = ['pc6', 'gemnaam', 'bouwjaar', 'bouwlagen', 'pandhoogte', 'x', 'y', 'bronsleutel']
+        rows = self.original_data[columns].iloc[positions].assign(risico_classificatie=risks)
+        # Concatenated to the (empty) HUP frame, the rows get the dtypes they have in the HUP
+        df = pd.concat([self._hup_frame[columns + ['risico_classificatie']].iloc[:0], rows])
+        df['functie'] = functie
+        df['adres'] = np.asarray(view.take('Adres', positions), dtype=object)
+        df['Bouwwerk'] = view.take('Naam Bouwwerk', positions)
+        df['personen'] = view.take('Personen', positions)
+        df['SBI1'] = view.take('SBI1', positions)
+        df['act1omschr'] = view.take('SBI Omschrijving', positions)
+        return df
 
-        # Filter self.data_gebruik for non-empty 'personen' and take the first occurrence for each 'aanzien_id'
-        data_gebruik_filtered_personen = self.data_gebruik.loc[self.data_gebruik['personen'].notna()].drop_duplicates(
-            'aanzien_id', keep='first')
+    def prepared_chunks(self, add_A=False, remove_no_name=False):
+        """
+        Prepares the HUP in chunks of memory_budget.chunk_rows rows, without building the whole HUP.
 
-        # Map 'bronsleutel' from df to 'personen' from data_gebruik_filtered_personen
-        df['personen'] = df['bronsleutel'].map(data_gebruik_filtered_personen.set_index('aanzien_id')['personen'])
+        Gives the same rows as prepare_dataframe. A first pass over the chunks collects what depends on
+        all rows (which 'functie' labels are kept and the first row of every object id); the second pass
+        prepares each chunk and keeps it in a ChunkStore, which writes the chunks to disk once the memory
+        budget is exceeded.
 
-        # Filter self.data_gebruik for non-empty 'act1code' and take the first occurrence for each 'aanzien_id'
-        data_gebruik_filtered_act1code = self.data_gebruik.loc[self.data_gebruik['act1code'].notna()].drop_duplicates(
-            'aanzien_id', keep='first')
+        Args:
+            add_A: Whether to include risk class A items
+            remove_no_name: Whether to remove items without a name
 
-        # Map 'bronsleutel' from df to 'act1code' and 'act1omschr' from data_gebruik_filtered_act1code
-        df['SBI1'] = df['bronsleutel'].map(data_gebruik_filtered_act1code.set_index('aanzien_id')['act1code'])
-        df['act1omschr'] = df['bronsleutel'].map(data_gebruik_filtered_act1code.set_index('aanzien_id')['act1omschr'])
+        Returns:
+            ChunkStore with the prepared chunks in order
+        """
+        budget = self.memory_budget if self.memory_budget is not None else MemoryBudget(None)
+        view_rows = self._view_positions(add_A)
+        if view_rows is not None:
+            # All rows come from the enriched view: prepare them in slices
+            store = ChunkStore(budget)
+            with self.tracer.span("prepare (verrijkte objecten)", rows_in=len(view_rows[0])) as span:
+                for start in range(0, len(view_rows[0]), budget.chunk_rows):
+                    prepared = self._hup_columns(self._view_rows(*(values[start:start + budget.chunk_rows]
+                                                                   for values in view_rows)))
+                    if remove_no_name:
+                        prepared = prepared.dropna(subset=['Naam Bouwwerk'])
+                    store.append(prepared)
+                span.rows_out = len(store)
+            return store
+
+        with self.tracer.span("prepare (deel 1)", rows_in=self.hup_rows):
+            functie_kept, ids = {}, []
+            for chunk in self._hup_chunks(add_A, budget.chunk_rows):
+                self._add_functie(chunk)
+                for label in chunk['functie'].dropna().unique():
+                    kept = bool(chunk.loc[chunk['functie'] == label, label].all())
+                    functie_kept[label] = functie_kept.get(label, True) and kept
+                ids.append(chunk['id'].to_numpy())
+                budget.check()
+            first_rows = ~pd.Series(np.concatenate(ids)).duplicated(keep='first').to_numpy()
+
+        store = ChunkStore(budget)
+        with self.tracer.span("prepare (deel 2)", rows_in=len(first_rows)) as span:
+            offset = 0
+            for chunk in self._hup_chunks(add_A, budget.chunk_rows):
+                self._add_functie(chunk)
+                chunk['functie'] = chunk['functie'].apply(lambda x: x if pd.notna(x) and functie_kept[x] else '')
+                keep = first_rows[offset:offset + len(chunk)]
+                offset += len(chunk)
+                prepared = self._prepare_rows(chunk[keep])
+                if remove_no_name:
+                    prepared = prepared.dropna(subset=['Naam Bouwwerk'])
+                store.append(prepared)
+            span.rows_out = len(store)
+        return store
+
+    def _prepare_rows(self, df):
+        """
+        Builds the HUP columns from the rows of the HUP with their 'functie' column.
+        """
+        df['adres'] = self._adres(df)
+
+        # Take the name, personen and SBI code of each object from the gebruik aggregates; looked up
+        # by key rather than read from the HUP rows, which lose their dtypes in the concatenation
+        aggregates = self.gebruik_aggregates.columns_for(df['bronsleutel']).set_axis(df.index)
+        df['Bouwwerk'] = aggregates[AGGREGATE_COLUMNS["naam_vol"]]
+        df['personen'] = aggregates[AGGREGATE_COLUMNS["personen"]]
+        df['SBI1'] = aggregates[AGGREGATE_COLUMNS["act1code"]]
+        df['act1omschr'] = aggregates[AGGREGATE_COLUMNS["act1omschr"]]
 
         # Check for duplicates.
         df.drop_duplicates(subset=['id'], keep='first', inplace=True)
+        return self._hup_columns(df)
 
+    @staticmethod
+    def _adres(df):
+        """
+        The address of every row: straatnaam, huisnr, huisletter and huistoevg combined.
+        """
+        # Combine straatnaam, huisnr and huistoevg columns into a single column
+        return df['straatnaam'] + ' ' + df['huisnr'].apply(lambda x: str(int(x)) if pd.notna(x) else '') + df[
+            'huisletter'].apply(
+            lambda x: f'-{x}' if pd.notna(x) else '') + df['huistoevg'].apply(lambda x: f'{x}' if pd.notna(x) else '')
+
+    @staticmethod
+    def _hup_columns(df):
+        """
+        Builds the HUP sheet columns from prepared rows, in the order of the sheet.
+        """
         # Create new dataframe with selected and new columns
         new_df = pd.DataFrame()
         # New column order as specified
@@ -272,8 +818,65 @@ class KRO_Tree:
         new_df['x'] = df['x']
         new_df['y'] = df['y']
         # New columns can be added here
+        new_df[OBJECT_ID_COLUMN] = df['bronsleutel']  # Used to match rows when updating an existing HUP
         return new_df
 
+    def export_dataframe(self, add_A=False, remove_no_name=False):
+        """
+        Returns the prepared HUP dataframe with the export options applied.
+        """
+        df = self.prepare_dataframe(add_A)
+
+        if remove_no_name:
+            df = df.dropna(subset=['Naam Bouwwerk'])
+
+        return df
+
+    def export_chunks(self, add_A=False, remove_no_name=False):
+        """
+        Returns the prepared HUP with the export options applied as a ChunkStore; without a memory budget
+        it holds the whole dataframe as one chunk.
+        """
+        if self.memory_budget is not None:
+            return self.prepared_chunks(add_A, remove_no_name)
+        store = ChunkStore(MemoryBudget(None))
+        store.append(self.export_dataframe(add_A, remove_no_name))
+        return store
+
+    def export_file(self, output_format, output_path=None, add_A=False, remove_no_name=False):
+        """
+        Write the HUP in a non-Excel format (see exporters.EXPORT_FORMATS), with the same columns as the sheet.
+
+        Args:
+            output_format: 'parquet', 'feather', 'csv' (gzip) or 'geojson'
+            output_path: Optional path for the output file, if None a path will be generated
+            add_A: Whether to include risk class A items
+            remove_no_name: Whether to remove items without a name
+
+        Returns:
+            Path to the saved file
+        """
+        # Under a memory budget, CSV and GeoJSON are written chunk by chunk instead of from one dataframe
+        if self.memory_budget is not None and output_format in CHUNK_WRITERS:
+            df = self.export_chunks(add_A, remove_no_name)
+        else:
+            df = self.export_dataframe(add_A, remove_no_name)
+
+        with self.tracer.span(f"export ({output_format})", rows_in=len(df)) as span:
+            if output_path is None:
+                datetime_string = datetime.now().strftime("%d-%m-%Y_%H-%M")
+                output_path = get_executable_relative_path(
+                    "HUP", f"HUP-{datetime_string}{EXPORT_FORMATS[output_format]['extension']}")
+            if isinstance(df, ChunkStore):
+                write_chunks(df, df.columns, output_format, output_path)
+            else:
+                write_dataframe(df, output_format, output_path)
+            span.rows_out = len(df)
+
+        logger.info("Saved to %s", output_path)
+        return output_path
+
+    @traced("export")
     def insert_dataframe_into_excel(self, template_path, sheet_name, start_row, output_path=None, add_A=False, remove_no_name=False):
         """
         Insert dataframe into excel template at specified location.
@@ -289,29 +892,38 @@ class KRO_Tree:
         Returns:
             Path to the saved Excel file
         """
-        df = self.prepare_dataframe(add_A)
+        # Under a memory budget the chunks are read back from disk one at a time while writing
+        chunks = self.export_chunks(add_A, remove_no_name)
 
-        if remove_no_name:
-            df = df.dropna(subset=['Bouwwerk'])
-
-        # Load the workbook and select the specified worksheet
-        workbook = load_workbook(filename=template_path)
+        # Get a fresh copy of the parsed template and select the specified worksheet
+        workbook = TEMPLATE_CACHE.load(template_path)
         if sheet_name not in workbook.sheetnames:
             raise ValueError(f"{sheet_name} not in workbook. Available sheets are: {workbook.sheetnames}")
 
         sheet = workbook[sheet_name]
 
         # Insert blank rows to make space for DataFrame
-        num_rows_df = len(df)
+        num_rows_df = len(chunks)
         sheet.insert_rows(start_row, num_rows_df)
 
         # Convert the dataframe to a list of rows and insert into Excel
-        rows = dataframe_to_rows(df, index=False, header=False)
-        for r_idx, row in enumerate(rows, start_row):
-            # Iterate over all cells in the row
-            for c_idx, value in enumerate(row, 1):
-                # Insert the value into the cell
-                sheet.cell(row=r_idx, column=c_idx, value=value)
+        r_idx = start_row
+        for df in chunks:
+            for row in dataframe_to_rows(df, index=False, header=False):
+                # Iterate over all cells in the row
+                for c_idx, value in enumerate(row, 1):
+                    # Insert the value into the cell
+                    sheet.cell(row=r_idx, column=c_idx, value=value)
+                r_idx += 1
+            if self.memory_budget is not None:
+                self.memory_budget.check()
+
+        # Add a hidden header for the object id column so the HUP can be updated later
+        if start_row > 1:
+            id_column = chunks.columns.get_loc(OBJECT_ID_COLUMN) + 1
+            if sheet.cell(row=start_row - 1, column=id_column).value is None:
+                sheet.cell(row=start_row - 1, column=id_column, value=OBJECT_ID_COLUMN)
+            sheet.column_dimensions[get_column_letter(id_column)].hidden = True
 
         # Use the provided output_path if given, otherwise create one
         if output_path is None:
@@ -324,5 +936,111 @@ class KRO_Tree:
         
         # Save the workbook
         workbook.save(output_path)
-        print(f"Saved to {output_path}")
+        logger.info("Saved to %s", output_path)
+        return output_path
+
+    @traced("export (update)")
+    def update_excel(self, previous_path, sheet_name, start_row, output_path=None, add_A=False, remove_no_name=False):
+        """
+        Update an existing HUP workbook in place instead of building a new one from the template.
+
+        Rows are matched on the object id column. Only the generated columns of changed rows are
+        rewritten, new objects are appended and objects that are no longer in the HUP are flagged
+        in the status column. The columns that inspectors fill in are left untouched.
+
+        Args:
+            previous_path: Path to the previously generated HUP workbook
+            sheet_name: Name of the sheet holding the HUP
+            start_row: Row number of the first data row
+            output_path: Optional path for the output file, if None a path will be generated
+            add_A: Whether to include risk class A items
+            remove_no_name: Whether to remove items without a name
+
+        Returns:
+            Path to the saved Excel file
+        """
+        df = self.export_dataframe(add_A, remove_no_name)
+
+        workbook = load_workbook(filename=previous_path)
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"{sheet_name} not in workbook. Available sheets are: {workbook.sheetnames}")
+
+        sheet = workbook[sheet_name]
+        header_row = start_row - 1
+        if header_row < 1:
+            raise ValueError("Updating a HUP requires a header row above the data.")
+
+        # Map header names to column numbers
+        header = {}
+        for c_idx in range(1, sheet.max_column + 1):
+            name = sheet.cell(row=header_row, column=c_idx).value
+            if name is not None:
+                header[name] = c_idx
+
+        if OBJECT_ID_COLUMN not in header:
+            raise ValueError(f"Column '{OBJECT_ID_COLUMN}' not found in {previous_path}. "
+                             f"Only HUP files generated by this version can be updated.")
+
+        if STATUS_COLUMN not in header:
+            header[STATUS_COLUMN] = max(header.values()) + 1
+            sheet.cell(row=header_row, column=header[STATUS_COLUMN], value=STATUS_COLUMN)
+
+        generated_columns = [col for col in df.columns if col not in MANUAL_COLUMNS and col in header]
+        id_column = header[OBJECT_ID_COLUMN]
+        status_column = header[STATUS_COLUMN]
+
+        # Read the existing rows once, keyed by object id
+        existing_rows = {}
+        last_row = start_row - 1
+        for r_idx, row in enumerate(sheet.iter_rows(min_row=start_row, max_col=max(header.values()),
+                                                    values_only=True), start_row):
+            object_id = row[id_column - 1]
+            if object_id is None:
+                continue
+            existing_rows[object_id] = (r_idx, row)
+            last_row = r_idx
+
+        new_ids = set()
+        changed = 0
+        added = 0
+        for record in df.to_dict('records'):
+            object_id = _cell_value(record[OBJECT_ID_COLUMN])
+            new_ids.add(object_id)
+            values = {col: _cell_value(record[col]) for col in generated_columns}
+
+            if object_id in existing_rows:
+                r_idx, row = existing_rows[object_id]
+                differences = [col for col in generated_columns if values[col] != _cell_value(row[header[col] - 1])]
+                if differences:
+                    for col in differences:
+                        sheet.cell(row=r_idx, column=header[col], value=values[col])
+                    sheet.cell(row=r_idx, column=status_column, value="Gewijzigd")
+                    changed += 1
+                elif row[status_column - 1] is not None:
+                    sheet.cell(row=r_idx, column=status_column, value=None)
+            else:
+                last_row += 1
+                for col in generated_columns:
+                    sheet.cell(row=last_row, column=header[col], value=values[col])
+                sheet.cell(row=last_row, column=status_column, value="Nieuw")
+                added += 1
+
+        removed = 0
+        for object_id, (r_idx, row) in existing_rows.items():
+            if object_id not in new_ids and row[status_column - 1] != "Vervallen":
+                sheet.cell(row=r_idx, column=status_column, value="Vervallen")
+                removed += 1
+
+        logger.info("Updated HUP: %d changed, %d new, %d removed objects.", changed, added, removed)
+        self.history.append({"action": "update existing HUP workbook", "rows_removed": removed,
+                             "rows_remaining": len(df)})
+
+        if output_path is None:
+            datetime_string = datetime.now().strftime("%d-%m-%Y_%H-%M")
+            output_path = get_executable_relative_path("HUP", f"HUP-{datetime_string}.xlsx")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        workbook.save(output_path)
+        logger.info("Saved to %s", output_path)
         return output_path
@@ -4,8 +4,11 @@ import sys
 import tempfile
 import io
 import csv
+import logging
 from typing import Tuple, Dict, List, Any, Optional
 
+logger = logging.getLogger(__name__)
+
 def load_data_from_file(file_path: str) -> pd.DataFrame:
     """Load data from a CSV file with semicolon delimiter."""
     try:
@@ -141,8 +144,9 @@ def get_executable_relative_path(*path_parts):
         else:
             base_dir = os.path.dirname(os.path.abspath(__file__))
         
-        # Test if we can write to this directory
-        test_path = os.path.join(base_dir, "write_test.tmp")
+        # Test if we can write to this directory; the name is per process, so processes starting
+        # together do not remove each other's test file and end up in different directories
+        test_path = os.path.join(base_dir, f"write_test-{os.getpid()}.tmp")
         try:
             with open(test_path, 'w') as f:
                 f.write("test")
@@ -157,7 +161,7 @@ def get_executable_relative_path(*path_parts):
         if _output_base_dir is None:
             docs_dir = os.path.join(os.path.expanduser("~"), "Documents", "HUP Generator")
             os.makedirs(docs_dir, exist_ok=True)
-            test_path = os.path.join(docs_dir, "write_test.tmp")
+            test_path = os.path.join(docs_dir, f"write_test-{os.getpid()}.tmp")
             try:
                 with open(test_path, 'w') as f:
                     f.write("test")
@@ -193,7 +197,25 @@ def get_executable_relative_path(*path_parts):
         os.makedirs(temp_dir, exist_ok=True)
         return os.path.join(temp_dir, *path_parts)
 
-# Filter definitions for the application
+def resolve_data_path(path):
+    """
+    Resolve a path from a filter definition: absolute, relative to the working directory,
+    next to the executable, or a bundled resource, in that order.
+    """
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    base_dir = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else \
+        os.path.dirname(os.path.abspath(__file__))
+    candidate = os.path.join(base_dir, path)
+    if os.path.exists(candidate):
+        return candidate
+    return get_resource_path(path)
+
+# Filter definitions for the application.
+# Filter types: "sbi" (codes), "column" (column, operator, value), "functie" (lists "all", "none" and "any" of
+# *functie columns, e.g. {"type": "functie", "all": ["kantoorfunctie"], "none": ["winkelfunctie"]}) and the spatial types
+# "radius" (x, y, radius in metres), "polygon" (path to a GeoJSON file) and "nearest" (x, y, count),
+# all in RD coordinates (EPSG:28992).
 FILTER_DEFINITIONS = {
     "kdv": {
         "name": "Kinderdagverblijven",
@@ -289,22 +311,56 @@ FILTER_DEFINITIONS = {
     }
 }
 
+def add_definition_filters(tree, filter_def):
+    """Add the filter steps of a filter definition to the plan of a KRO_Tree."""
+    for filter_item in filter_def["filters"]:
+        if filter_item["type"] == "sbi":
+            tree.filter_SBI(filter_item["codes"])
+        elif filter_item["type"] == "column":
+            tree.filter(filter_item["column"], filter_item["operator"], filter_item["value"])
+        elif filter_item["type"] == "functie":
+            tree.filter_functie(filter_item.get("all", ()), filter_item.get("none", ()), filter_item.get("any", ()))
+        elif filter_item["type"] == "radius":
+            tree.filter_radius(filter_item["x"], filter_item["y"], filter_item["radius"])
+        elif filter_item["type"] == "polygon":
+            tree.filter_polygon(resolve_data_path(filter_item["path"]))
+        elif filter_item["type"] == "nearest":
+            tree.filter_nearest(filter_item["x"], filter_item["y"], filter_item["count"])
+
 def apply_filter_to_tree(tree, filter_key):
     """Apply a predefined filter to a KRO_Tree instance."""
     if filter_key not in FILTER_DEFINITIONS:
-        print(f"Unknown filter: {filter_key}")
+        logger.warning("Unknown filter: %s", filter_key)
         return False
         
     filter_def = FILTER_DEFINITIONS[filter_key]
-    print(f"Applying filter: {filter_def['name']} ({filter_def['description']})")
+    logger.info("Applying filter: %s (%s)", filter_def['name'], filter_def['description'])
     
-    for filter_item in filter_def["filters"]:
-        if filter_item["type"] == "sbi":
-            tree.filter_SBI(filter_item["codes"])
-        elif filter_item["type"] == "column":
-            tree.filter(filter_item["column"], filter_item["operator"], filter_item["value"])
-    
-    tree.set_risk(filter_def["risk"])
-    tree.store_results()
-    tree.reset()
+    with tree.tracer.span(f"definitie {filter_key}", rows_in=tree.count(), definition=filter_key) as span:
+        add_definition_filters(tree, filter_def)
+        span.rows_out = tree.count()
+        tree.set_risk(filter_def["risk"])
+        tree.store_results()
+        tree.reset()
     return True
+
+def preview_filters(tree, filter_keys):
+    """
+    Object counts of the given filter definitions without running them on the tree (see KRO_Tree.count_preview).
+
+    Args:
+        tree: KRO_Tree with the loaded data
+        filter_keys: Keys of FILTER_DEFINITIONS, in the order in which they would be applied
+
+    Returns:
+        Dictionary with the counts per definition, the total, the overlap and the totals per risk class
+    """
+    definitions = []
+    for filter_key in filter_keys:
+        if filter_key not in FILTER_DEFINITIONS:
+            logger.warning("Unknown filter: %s", filter_key)
+            continue
+        filter_def = FILTER_DEFINITIONS[filter_key]
+        predicates = tree.collect_predicates(lambda: add_definition_filters(tree, filter_def))
+        definitions.append((filter_key, predicates, filter_def["risk"]))
+    return tree.count_preview(definitions)
@@ -0,0 +1,260 @@
+"""
+Materialized view of the enriched KRO objects, stored on disk per KRO release.
+
+prepare_dataframe derives per object the function label, the address and the
+name, personen and SBI columns taken from KRO-gebruik. None of that depends on
+the filters, only on the release, so KRO_Tree can build these columns once and
+keep them in a directory named after the fingerprint of the data (see
+KRO_Tree.enriched_view):
+
+- numeric and boolean columns as one .npy file each;
+- text columns dictionary-encoded as int32 codes, offsets and the UTF-8
+  encoded distinct values (three .npy files);
+- other columns (e.g. object columns mixing numbers and text) pickled into
+  one .npy file and unpickled on first use;
+- manifest.json with the fingerprint, the number of rows and per column its
+  kind and dtype.
+
+Opening a view memory-maps the files, so it costs next to nothing until rows
+are taken, and only the text values of the rows taken are decoded. Other data
+has another fingerprint and gets a view of its own, built on first use; only
+the KEEP_RELEASES most recently used views are kept.
+"""
+
+import os
+import json
+import pickle
+import time
+import shutil
+import logging
+import tempfile
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Default directory of the views, one subdirectory per fingerprint
+VIEW_DIR = os.path.join(tempfile.gettempdir(), "HUP Generator", "verrijkt")
+
+# Number of views kept in a directory
+KEEP_RELEASES = 3
+
+# Stored in the manifest; views written with another version are built again
+FORMAT_VERSION = 2
+
+MANIFEST = "manifest.json"
+
+
+def _file_name(column: str, part: str = "") -> str:
+    """File name of a column array; column names may contain spaces, but not slashes."""
+    return column.replace(os.sep, "_") + (f".{part}" if part else "") + ".npy"
+
+
+def _is_string_column(series: pd.Series) -> bool:
+    if not (pd.api.types.is_string_dtype(series.dtype) or series.dtype == object):
+        return False
+    values = series.dropna()
+    return values.map(type).eq(str).all() if series.dtype == object else True
+
+
+def _write_column(path: str, name: str, series: pd.Series) -> dict:
+    """Writes the arrays of a column and returns its manifest entry."""
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+        np.save(os.path.join(path, _file_name(name)), np.ascontiguousarray(series.to_numpy()))
+        return {"kind": "numeric"}
+    if not _is_string_column(series):
+        # Decoding text would change the values, so the column is stored as it is
+        pickled = pickle.dumps(series.reset_index(drop=True), protocol=pickle.HIGHEST_PROTOCOL)
+        np.save(os.path.join(path, _file_name(name, "pickle")), np.frombuffer(pickled, dtype=np.uint8))
+        return {"kind": "pickle"}
+    codes, distinct = pd.factorize(series, use_na_sentinel=True)
+    encoded = [str(value).encode('utf-8') for value in distinct]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(path, _file_name(name, "codes")), codes.astype(np.int32))
+    np.save(os.path.join(path, _file_name(name, "offsets")), offsets)
+    np.save(os.path.join(path, _file_name(name, "text")), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    return {"kind": "string", "dtype": str(dtype)}
+
+
+class EnrichedView:
+    """
+    Columns derived per object, read from the files of a view directory.
+
+    Args:
+        path: Directory written by EnrichedView.write
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"View {path} has format version {manifest.get('version')}")
+        self.fingerprint = manifest["fingerprint"]
+        self.rows = manifest["rows"]
+        self.columns = manifest["columns"]
+        self._labels = {}
+        self._unpickled = {}
+        # Map all files at once, so the view stays readable when its directory is replaced or pruned meanwhile
+        self._arrays = {}
+        for name, entry in self.columns.items():
+            parts = {"numeric": [""], "pickle": ["pickle"]}.get(entry["kind"], ["codes", "offsets", "text"])
+            for part in parts:
+                file_name = _file_name(name, part)
+                self._arrays[file_name] = np.load(os.path.join(path, file_name), mmap_mode='r')
+
+    @classmethod
+    def write(cls, path: str, fingerprint: str, columns: Dict[str, pd.Series]) -> "EnrichedView":
+        """
+        Stores the columns as a view in path; the directory only appears once all files are written.
+
+        Args:
+            path: Directory of the view
+            fingerprint: Fingerprint of the data the columns are derived from
+            columns: Column name to a series with a value per object, all of the same length
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".bouw-", dir=parent)
+        try:
+            entries = {name: _write_column(staging, name, series) for name, series in columns.items()}
+            rows = len(next(iter(columns.values()))) if columns else 0
+            with open(os.path.join(staging, MANIFEST), "w", encoding='utf-8') as f:
+                json.dump({"version": FORMAT_VERSION, "fingerprint": fingerprint, "rows": rows,
+                           "columns": entries}, f)
+            try:
+                os.replace(staging, path)
+            except OSError:
+                # Another process stored this view first; only replace what is there if it is not a valid view
+                try:
+                    existing = cls(path)
+                    if existing.fingerprint == fingerprint and existing.rows == rows:
+                        shutil.rmtree(staging, ignore_errors=True)
+                        return existing
+                except (OSError, ValueError, KeyError):
+                    pass
+                shutil.rmtree(path, ignore_errors=True)
+                os.replace(staging, path)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls(path)
+
+    @classmethod
+    def open(cls, fingerprint: str, rows: int, build: Callable[[], Dict[str, pd.Series]],
+             directory: str = VIEW_DIR) -> "EnrichedView":
+        """
+        Opens the view of a release, building it first when it is missing, unreadable or of other data.
+
+        Args:
+            fingerprint: Fingerprint of the data
+            rows: Number of objects in the data
+            build: Returns the columns of the view; only called when the view has to be built
+            directory: Directory with a view per fingerprint
+
+        Returns:
+            The view, with its files memory-mapped
+        """
+        path = os.path.join(directory, fingerprint)
+        view = None
+        try:
+            view = cls(path)
+            if view.fingerprint != fingerprint or view.rows != rows:
+                view = None
+        except (OSError, ValueError, KeyError):
+            pass
+        if view is None:
+            logger.info("Building the enriched objects view in %s", path)
+            view = cls.write(path, fingerprint, build())
+        else:
+            # The modification time of the manifest marks when the view was last used
+            try:
+                os.utime(os.path.join(path, MANIFEST))
+            except OSError:
+                pass
+        prune_views(directory, keep=KEEP_RELEASES)
+        return view
+
+    def _array(self, file_name: str) -> np.ndarray:
+        return self._arrays[file_name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def labels(self, name: str) -> np.ndarray:
+        """The distinct values of a text column, indexed by its codes, as an object array."""
+        if name not in self._labels:
+            offsets = self._array(_file_name(name, "offsets"))
+            raw = self._array(_file_name(name, "text")).tobytes()
+            self._labels[name] = np.array([raw[start:end].decode('utf-8')
+                                           for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+        return self._labels[name]
+
+    def codes(self, name: str, positions: np.ndarray) -> np.ndarray:
+        """Codes of a text column at the given rows; -1 is a missing value."""
+        return np.asarray(self._array(_file_name(name, "codes"))[positions])
+
+    def take(self, name: str, positions: np.ndarray):
+        """
+        Values of a column at the given rows.
+
+        Returns:
+            A numpy array for numeric columns; for text columns an array of the stored dtype in which only
+            the distinct values of these rows are decoded; for pickled columns an array of the original dtype
+        """
+        entry = self.columns[name]
+        if entry["kind"] == "numeric":
+            return np.asarray(self._array(_file_name(name))[positions])
+        if entry["kind"] == "pickle":
+            if name not in self._unpickled:
+                self._unpickled[name] = pickle.loads(self._array(_file_name(name, "pickle")).tobytes()).array
+            return self._unpickled[name][positions]
+        codes = self.codes(name, positions)
+        used, inverse = np.unique(codes, return_inverse=True)
+        present = used[used >= 0]
+        offsets = self._array(_file_name(name, "offsets"))
+        # Slicing a plain memoryview of the mapped text is much cheaper than slicing the memmap per value
+        text = memoryview(np.asarray(self._array(_file_name(name, "text"))))
+        values = [str(text[start:end], 'utf-8')
+                  for start, end in zip(offsets[present].tolist(), offsets[present + 1].tolist())]
+        distinct = np.array([None] * (len(used) - len(present)) + values, dtype=object)
+        return pd.array(distinct[inverse], dtype=entry["dtype"])
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the view on disk."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+
+def prune_views(directory: str = VIEW_DIR, keep: int = KEEP_RELEASES) -> int:
+    """
+    Removes all but the keep most recently used views in directory, and builds interrupted over an hour ago.
+
+    Returns:
+        The number of directories removed
+    """
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_dir()]
+    except OSError:
+        return 0
+    views, removed = [], 0
+    for entry in entries:
+        if entry.name.startswith(".bouw-"):
+            if entry.stat().st_mtime < time.time() - 3600:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+            continue
+        try:
+            views.append((os.path.getmtime(os.path.join(entry.path, MANIFEST)), entry.path))
+        except OSError:
+            # Not a view
+            continue
+    for _, path in sorted(views, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
@@ -0,0 +1,174 @@
+"""
+Non-Excel outputs of the HUP.
+
+All formats write the dataframe from KRO_Tree.export_dataframe, so they have
+the same columns in the same order as the Excel sheet. Parquet and Feather
+need pyarrow (optional, not in requirements.txt); compressed CSV and GeoJSON
+only need pandas. pandas itself is only imported when a file is written, so the
+launcher can list the formats without loading the data stack.
+"""
+
+import os
+import json
+import math
+from typing import Dict, Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Export formats: name, label for the UI, file extension and whether pyarrow is needed
+EXPORT_FORMATS = {
+    "xlsx": {"name": "Excel", "label": "Excel (HUP-sjabloon)", "extension": ".xlsx", "pyarrow": False},
+    "parquet": {"name": "Parquet", "label": "Parquet", "extension": ".parquet", "pyarrow": True},
+    "feather": {"name": "Feather", "label": "Feather", "extension": ".feather", "pyarrow": True},
+    "csv": {"name": "CSV", "label": "CSV (gzip)", "extension": ".csv.gz", "pyarrow": False},
+    "geojson": {"name": "GeoJSON", "label": "GeoJSON (punten op x/y)", "extension": ".geojson", "pyarrow": False},
+}
+
+# Coordinate reference system of the x/y columns (RD New)
+GEOJSON_CRS = {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::28992"}}
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def available_formats() -> Dict[str, bool]:
+    """Return for each export format whether it can be written in this installation."""
+    has_pyarrow = pyarrow_available()
+    return {key: has_pyarrow or not spec["pyarrow"] for key, spec in EXPORT_FORMATS.items()}
+
+
+def _json_value(value, pd):
+    """Convert a dataframe value to something json can write; missing values become null."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value
+
+
+def write_parquet(df: 'pd.DataFrame', path: str) -> str:
+    df.reset_index(drop=True).to_parquet(path, engine='pyarrow', index=False, compression='zstd')
+    return path
+
+
+def write_feather(df: 'pd.DataFrame', path: str) -> str:
+    df.reset_index(drop=True).to_feather(path, compression='zstd')
+    return path
+
+
+def write_csv(df: 'pd.DataFrame', path: str) -> str:
+    # Same delimiter as the KRO files, so the result opens in Dutch Excel as well
+    df.to_csv(path, index=False, sep=';', compression='gzip')
+    return path
+
+
+def write_csv_chunks(chunks: Iterable['pd.DataFrame'], columns, path: str) -> str:
+    """Write the chunks of a prepared HUP one after the other into one compressed CSV file."""
+    import gzip
+    import pandas as pd
+
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        written = False
+        for df in chunks:
+            df.to_csv(f, index=False, sep=';', header=not written)
+            written = True
+        if not written:
+            pd.DataFrame(columns=columns).to_csv(f, index=False, sep=';')
+    return path
+
+
+def write_geojson(df: 'pd.DataFrame', path: str) -> str:
+    """
+    Write a FeatureCollection of points on x/y (RD); all columns, x and y included, become properties.
+
+    Features are written one at a time, so the whole collection is never held as one string.
+    """
+    return write_geojson_chunks([df], df.columns, path)
+
+
+def write_geojson_chunks(chunks: Iterable['pd.DataFrame'], columns, path: str) -> str:
+    """write_geojson for a prepared HUP given as consecutive dataframes with the same columns."""
+    import pandas as pd
+
+    columns = list(columns)
+    x_index, y_index = columns.index('x'), columns.index('y')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"type": "FeatureCollection", "crs": ' + json.dumps(GEOJSON_CRS) + ', "features": [\n')
+        number = 0
+        for df in chunks:
+            for row in df.itertuples(index=False, name=None):
+                values = [_json_value(value, pd) for value in row]
+                x, y = values[x_index], values[y_index]
+                feature = {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [x, y]} if x is not None and y is not None else None,
+                    "properties": dict(zip(columns, values))
+                }
+                f.write((",\n" if number else "") + json.dumps(feature, ensure_ascii=False, default=str))
+                number += 1
+        f.write('\n]}\n')
+    return path
+
+
+WRITERS = {
+    "parquet": write_parquet,
+    "feather": write_feather,
+    "csv": write_csv,
+    "geojson": write_geojson,
+}
+
+
+# Formats that can be written chunk by chunk, used when the HUP is prepared under a memory budget
+CHUNK_WRITERS = {
+    "csv": write_csv_chunks,
+    "geojson": write_geojson_chunks,
+}
+
+
+def write_dataframe(df: 'pd.DataFrame', output_format: str, path: str) -> str:
+    """
+    Write the prepared HUP dataframe in one of the non-Excel formats.
+
+    Args:
+        df: Result of KRO_Tree.export_dataframe
+        output_format: Key of EXPORT_FORMATS other than 'xlsx'
+        path: Output file path
+
+    Returns:
+        Path of the written file
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown export format: {output_format}. Available formats are: {list(WRITERS)}")
+    if EXPORT_FORMATS[output_format]["pyarrow"] and not pyarrow_available():
+        raise ImportError(f"Exporting to {output_format} requires pyarrow (pip install pyarrow).")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return WRITERS[output_format](df, path)
+
+
+def write_chunks(chunks: Iterable['pd.DataFrame'], columns, output_format: str, path: str) -> str:
+    """
+    Write a prepared HUP given as consecutive dataframes, e.g. a memory_budget.ChunkStore.
+
+    Args:
+        chunks: Dataframes with the columns of KRO_Tree.export_dataframe, in order
+        columns: The columns, also used when there are no chunks
+        output_format: Key of CHUNK_WRITERS
+        path: Output file path
+
+    Returns:
+        Path of the written file
+    """
+    if output_format not in CHUNK_WRITERS:
+        raise ValueError(f"{output_format} cannot be written in chunks. Chunked formats are: {list(CHUNK_WRITERS)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return CHUNK_WRITERS[output_format](chunks, columns, path)
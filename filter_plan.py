@@ -0,0 +1,114 @@
+"""
+Lazy filter plans for KRO_Tree.
+
+KRO_Tree.filter / filter_SBI / filter_personen only record a Predicate; the
+plan runs when the selection is needed (store_results, export or reading
+data_aanzien). Because the predicates of a definition are conjunctive, the
+planner may reorder them: cheap masks (columns and the gebruik aggregates) go
+before the predicates that still join with KRO-gebruik, and within each group
+the most selective predicate goes first, so the expensive steps only see the
+objects that are still left.
+"""
+
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from gebruik_aggregates import AGGREGATE_OPERATORS
+
+# Predicate kinds answered by the spatial index over x/y
+SPATIAL_KINDS = ("radius", "polygon", "nearest")
+
+# Number of objects used to estimate the selectivity of a predicate without a cached mask
+SAMPLE_SIZE = 2048
+
+
+class Predicate:
+    """
+    One conjunctive filter step: a column comparison, a personen check, an SBI code list, a combination
+    of functions (all_of, none_of, any_of) or a spatial selection (radius, polygon file or nearest-N).
+    """
+
+    __slots__ = ('kind', 'args')
+
+    def __init__(self, kind: str, *args):
+        self.kind = kind
+        self.args = args
+
+    @property
+    def expensive(self) -> bool:
+        """Whether the predicate joins with KRO-gebruik instead of using the per-object aggregates."""
+        return self.kind == "personen" and self.args[0] not in AGGREGATE_OPERATORS
+
+    @property
+    def span_name(self) -> str:
+        if self.kind in SPATIAL_KINDS:
+            return self.action
+        if self.kind == "sbi":
+            return f"filter SBI {self.args[0]}"
+        if self.kind == "personen":
+            return "filter personen {} {}".format(*self.args)
+        if self.kind == "functie":
+            return self.action
+        return "filter {} {} {}".format(*self.args)
+
+    @property
+    def action(self) -> str:
+        """Description used in KRO_Tree.history, the same as in the eager implementation."""
+        if self.kind == "radius":
+            return "filter within {2:g} m of ({0:g}, {1:g})".format(*self.args)
+        if self.kind == "polygon":
+            return f"filter within polygon {os.path.basename(self.args[0])}"
+        if self.kind == "nearest":
+            return "filter nearest {2} to ({0:g}, {1:g})".format(*self.args)
+        if self.kind == "sbi":
+            return f"filter SBI starting with {self.args[0]}"
+        if self.kind == "personen":
+            return "filter Personen {} {}".format(*self.args)
+        if self.kind == "functie":
+            all_of, none_of, any_of = self.args
+            terms = list(all_of) + [f"not {column}" for column in none_of]
+            if any_of:
+                terms.append("(" + " or ".join(any_of) + ")")
+            return "filter functie " + " and ".join(terms)
+        return "filter {} {} {}".format(*self.args)
+
+    def __repr__(self):
+        return f"Predicate({self.kind!r}, {', '.join(map(repr, self.args))})"
+
+
+def sample_positions(positions: Optional[np.ndarray], total: int, size: int = SAMPLE_SIZE) -> np.ndarray:
+    """Evenly spaced sample of the candidate positions (all objects if positions is None)."""
+    count = total if positions is None else len(positions)
+    if count <= size:
+        return np.arange(total) if positions is None else positions
+    picks = np.linspace(0, count - 1, size).astype(np.int64)
+    return picks if positions is None else positions[picks]
+
+
+def estimate_selectivity(tree, predicate: Predicate, positions: Optional[np.ndarray]) -> float:
+    """
+    Estimate the fraction of the candidate objects that pass a predicate.
+
+    Uses the cached mask when there is one, otherwise evaluates the predicate on a small sample.
+    """
+    mask = tree.cached_mask(predicate)
+    if mask is not None:
+        return float(mask.mean() if positions is None else mask[positions].mean()) if len(mask) else 0.0
+    sample = sample_positions(positions, len(tree.original_data))
+    if len(sample) == 0:
+        return 0.0
+    return float(tree.evaluate(predicate, sample).mean())
+
+
+def order_predicates(tree, predicates: List[Predicate], positions: Optional[np.ndarray]) -> List[Predicate]:
+    """
+    Order conjunctive predicates: column masks before gebruik joins, most selective first within each group.
+
+    The sort is stable, so predicates with equal estimates keep the order in which they were listed.
+    """
+    if len(predicates) < 2:
+        return list(predicates)
+    estimates = {id(predicate): estimate_selectivity(tree, predicate, positions) for predicate in predicates}
+    return sorted(predicates, key=lambda predicate: (predicate.expensive, estimates[id(predicate)]))
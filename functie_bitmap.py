@@ -0,0 +1,137 @@
+"""
+Bitmap index over the *functie flags of KRO-aanzien.
+
+KRO-aanzien has a 0/1 column per building function (woonfunctie,
+kantoorfunctie, ...). FunctieBitmap packs the flags of each object into one
+small unsigned integer, one bit per function in column order:
+
+- a comparison on a flag column ('kantoorfunctie == 1') becomes a bitwise AND
+  over that array;
+- combinations of functions ('kantoor and not winkel', see
+  KRO_Tree.filter_functie) are a single mask over the same array;
+- the dominant function that prepare_dataframe derives with idxmax is the
+  lowest set bit, as idxmax gives the first column on a tie.
+
+Only numeric columns that hold nothing but 0 and 1 are packed; other flag
+columns (with missing values, for example) are still filtered as columns.
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+FUNCTIE_SUFFIX = "functie"
+
+_BIT_DTYPES = (np.uint8, np.uint16, np.uint32)
+
+# Flag columns packed at most; KRO-aanzien has eleven
+MAX_FLAGS = 32
+
+
+def functie_columns(columns: Iterable[str]) -> List[str]:
+    """The flag columns among columns, in their order."""
+    return [column for column in columns if isinstance(column, str) and column.endswith(FUNCTIE_SUFFIX)]
+
+
+def _is_flag(series: pd.Series) -> bool:
+    """Whether a column holds only 0 and 1 (and no missing values)."""
+    if not (isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf"):
+        return False
+    values = series.to_numpy()
+    return bool(np.isin(values, (0, 1)).all())
+
+
+class FunctieBitmap:
+    """
+    The packed *functie flags of all objects.
+
+    Args:
+        columns: Flag columns, bit i is columns[i]
+        bits: Per object the packed flags
+    """
+
+    def __init__(self, columns: Sequence[str], bits: np.ndarray):
+        self.columns = list(columns)
+        self.bits = bits
+        self._bit = {column: index for index, column in enumerate(self.columns)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FunctieBitmap":
+        """Packs the 0/1 flag columns of a KRO-aanzien dataframe (the first MAX_FLAGS)."""
+        columns = [column for column in functie_columns(df.columns) if _is_flag(df[column])][:MAX_FLAGS]
+        dtype = next(dtype for dtype in _BIT_DTYPES if np.iinfo(dtype).bits >= max(len(columns), 1))
+        bits = np.zeros(len(df), dtype=dtype)
+        for index, column in enumerate(columns):
+            bits |= df[column].to_numpy().astype(dtype) << dtype(index)
+        return cls(columns, bits)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._bit
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    def covers(self, columns: Iterable[str]) -> bool:
+        """Whether all the given columns are packed."""
+        return all(column in self._bit for column in columns)
+
+    def _pattern(self, columns: Iterable[str]):
+        pattern = 0
+        for column in columns:
+            pattern |= 1 << self._bit[column]
+        return self.bits.dtype.type(pattern)
+
+    def _bits(self, positions: Optional[np.ndarray]) -> np.ndarray:
+        return self.bits if positions is None else self.bits[positions]
+
+    def flag_mask(self, column: str, when_set: bool, when_clear: bool,
+                  positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Mask of a comparison on one flag column, given its outcome for a set and for a clear flag.
+
+        Args:
+            column: Packed flag column
+            when_set: Outcome of the comparison for the value 1
+            when_clear: Outcome of the comparison for the value 0
+            positions: Objects to evaluate (all if None)
+        """
+        bits = self._bits(positions)
+        if when_set == when_clear:
+            return np.full(len(bits), bool(when_set))
+        is_set = (bits & self._pattern([column])) != 0
+        return is_set if when_set else ~is_set
+
+    def combination_mask(self, all_of: Sequence[str] = (), none_of: Sequence[str] = (),
+                         any_of: Sequence[str] = (), positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Mask of the objects with all functions of all_of, none of none_of and, if given, one of any_of.
+
+        Raises:
+            KeyError: For a column that is not packed
+        """
+        bits = self._bits(positions)
+        required, excluded = self._pattern(all_of), self._pattern(none_of)
+        mask = (bits & (required | excluded)) == required
+        if any_of:
+            mask &= (bits & self._pattern(any_of)) != 0
+        return mask
+
+    def dominant(self, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The first set flag of every object, as idxmax over the packed columns gives it.
+
+        Returns:
+            The index in columns of the first set flag (0 for objects without flags, as for idxmax) and whether
+            the object has any flag set
+        """
+        bits = self._bits(positions).astype(np.int64)
+        lowest = bits & -bits
+        has_flag = lowest != 0
+        index = np.zeros(len(bits), dtype=np.int64)
+        index[has_flag] = np.log2(lowest[has_flag]).round().astype(np.int64)
+        return index, has_flag
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
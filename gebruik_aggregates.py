@@ -0,0 +1,119 @@
+"""
+Per-object aggregates of KRO-gebruik.
+
+KRO-gebruik has any number of rows per object (aanzien_id). The aggregates
+below are computed once per dataset so the personen and SBI filters and
+prepare_dataframe no longer have to look through those rows:
+
+- the number of gebruik rows and the highest and lowest 'personen';
+- the first non-null 'naam_vol' and 'personen', and the first non-null
+  'act1code' with its 'act1omschr' (what the HUP shows);
+- the set of SBI codes per object, as a sorted vocabulary of code strings and
+  CSR arrays (indptr/codes) of vocabulary ids per object.
+
+The plain columns are joined onto KRO-aanzien with the AGGREGATE_COLUMNS names.
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Names of the aggregate columns joined onto KRO-aanzien
+AGGREGATE_COLUMNS = {
+    "rows": "gebruik_aantal",
+    "personen_max": "gebruik_personen_max",
+    "personen_min": "gebruik_personen_min",
+    "personen": "gebruik_personen",
+    "naam_vol": "gebruik_naam_vol",
+    "act1code": "gebruik_act1code",
+    "act1omschr": "gebruik_act1omschr",
+}
+
+# Operators on 'personen' that can be answered from the highest and lowest value of an object
+AGGREGATE_OPERATORS = (">", ">=", "<", "<=")
+
+# Sorts after every character, so prefix + PREFIX_END is an upper bound for all strings with that prefix
+PREFIX_END = chr(0x10FFFF)
+
+
+class GebruikAggregates:
+    """
+    Aggregates of KRO-gebruik per aanzien_id.
+
+    Args:
+        df_gebruik: KRO-gebruik dataframe with 'aanzien_id', 'naam_vol', 'personen', 'act1code' and 'act1omschr'
+    """
+
+    def __init__(self, df_gebruik: pd.DataFrame):
+        grouped = df_gebruik.groupby('aanzien_id', sort=False)
+        table = pd.DataFrame({
+            AGGREGATE_COLUMNS["rows"]: grouped.size(),
+            AGGREGATE_COLUMNS["personen_max"]: grouped['personen'].max(),
+            AGGREGATE_COLUMNS["personen_min"]: grouped['personen'].min(),
+            AGGREGATE_COLUMNS["personen"]: grouped['personen'].first(),
+            AGGREGATE_COLUMNS["naam_vol"]: grouped['naam_vol'].first(),
+        })
+
+        # 'act1omschr' comes from the same row as the first non-null 'act1code'
+        first_code = df_gebruik.loc[df_gebruik['act1code'].notna()].drop_duplicates('aanzien_id', keep='first')
+        first_code = first_code.set_index('aanzien_id')
+        table[AGGREGATE_COLUMNS["act1code"]] = first_code['act1code']
+        table[AGGREGATE_COLUMNS["act1omschr"]] = first_code['act1omschr']
+        self.table = table
+        self.keys = table.index
+
+        # SBI code sets: distinct (object, code) pairs sorted by object, then code
+        # Only the distinct codes are converted to strings (as astype(str) would) and sorted; the array is
+        # built from a list because to_numpy(dtype=str) on a pandas string column truncates to one character
+        code_ids, distinct = pd.factorize(df_gebruik['act1code'], use_na_sentinel=False)
+        distinct_strings = np.array(pd.Series(distinct).astype(str).tolist(), dtype=str)
+        order = np.argsort(distinct_strings, kind='stable')
+        self.sbi_vocabulary = distinct_strings[order]
+        code_ids = np.argsort(order)[code_ids]
+        key_ids = self.keys.get_indexer(df_gebruik['aanzien_id'])
+        valid = key_ids >= 0
+        pairs = np.sort(key_ids[valid].astype(np.int64) * len(self.sbi_vocabulary) + code_ids[valid])
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))] if len(pairs) else pairs
+        pair_keys = pairs // max(len(self.sbi_vocabulary), 1)
+        self.sbi_codes = (pairs - pair_keys * len(self.sbi_vocabulary)).astype(np.int32)
+        self.sbi_indptr = np.searchsorted(pair_keys, np.arange(len(self.keys) + 1))
+
+    def columns_for(self, object_keys: Iterable) -> pd.DataFrame:
+        """
+        Returns the aggregate columns for the given object keys (bronsleutel), in the same order.
+
+        Objects without gebruik rows get a row count of 0 and missing values elsewhere.
+        """
+        columns = self.table.reindex(pd.Index(object_keys))
+        columns[AGGREGATE_COLUMNS["rows"]] = columns[AGGREGATE_COLUMNS["rows"]].fillna(0).astype(np.int64)
+        return columns.reset_index(drop=True)
+
+    def matching_codes(self, start_nums) -> np.ndarray:
+        """
+        Returns a boolean array over the SBI vocabulary marking codes that start with one of start_nums.
+        """
+        hit = np.zeros(len(self.sbi_vocabulary), dtype=bool)
+        for start_num in start_nums:
+            prefix = str(start_num)
+            lo = np.searchsorted(self.sbi_vocabulary, prefix, side='left')
+            hi = np.searchsorted(self.sbi_vocabulary, prefix + PREFIX_END, side='left')
+            hit[lo:hi] = True
+        return hit
+
+    def sbi_key_mask(self, start_nums, hit: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns a boolean array over the aggregated keys marking objects with an SBI code starting with
+        one of start_nums.
+        """
+        if hit is None:
+            hit = self.matching_codes(start_nums)
+        if len(self.sbi_codes) == 0:
+            return np.zeros(len(self.keys), dtype=bool)
+        # Every aggregated key has at least one gebruik row, so no CSR segment is empty
+        return np.logical_or.reduceat(hit[self.sbi_codes], self.sbi_indptr[:-1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.table.memory_usage(deep=True).sum() + self.sbi_vocabulary.nbytes
+                   + self.sbi_codes.nbytes + self.sbi_indptr.nbytes)
@@ -0,0 +1,292 @@
+"""
+Incremental HUP recomputation between KRO releases.
+
+Compares a new KRO-aanzien/KRO-gebruik release against the previous one (or a
+snapshot of it) using per-object row hashes, re-runs the FILTER_DEFINITIONS
+only on the added and changed objects and merges the result with the
+unchanged part of the previous HUP. Definitions that rank objects across the
+whole dataset ("nearest") are re-run on the full release instead.
+"""
+
+import os
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from data_management import (
+    load_data_from_file,
+    get_executable_relative_path,
+    get_resource_path,
+    FILTER_DEFINITIONS,
+    apply_filter_to_tree
+)
+from classes import KRO_Tree
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Column in KRO-aanzien that identifies an object, and the matching column in KRO-gebruik
+OBJECT_KEY = "bronsleutel"
+GEBRUIK_KEY = "aanzien_id"
+
+# Filter types that rank the objects of the whole release, so whether an object passes depends on the others too
+WHOLE_DATASET_TYPES = ("nearest",)
+
+
+def hash_records(df: pd.DataFrame, key: str) -> pd.Series:
+    """
+    Compute one hash per object over all rows belonging to that object.
+
+    The position of a row within its object is part of the hash, so reordering
+    gebruik rows (which changes the first name/SBI used in the HUP) counts as a change.
+
+    Args:
+        df: KRO-aanzien or KRO-gebruik data
+        key: Column identifying the object the rows belong to
+
+    Returns:
+        pandas.Series of uint64 hashes indexed by object key
+    """
+    columns = sorted(col for col in df.columns if col != 'risico_classificatie')
+    if df.empty:
+        return pd.Series(dtype='uint64')
+
+    hashed = df[columns].assign(_volgnr=df.groupby(key, sort=False).cumcount())
+    row_hashes = pd.util.hash_pandas_object(hashed, index=False)
+    return pd.Series(row_hashes.values, index=df[key].values).groupby(level=0).sum()
+
+
+def _matches_per_filter(df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame,
+                        filter_keys: List[str]) -> Dict[str, List]:
+    """Run the given filters and return the matching object keys per filter."""
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik)
+    matches = {}
+    for filter_key in filter_keys:
+        rows_before = len(tree.HUP)
+        apply_filter_to_tree(tree, filter_key)
+        matches[filter_key] = list(tree.HUP[OBJECT_KEY].iloc[rows_before:].unique())
+    return matches
+
+
+def build_snapshot(df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame, filter_keys: List[str],
+                   matches: Optional[Dict[str, List]] = None) -> Dict:
+    """
+    Create a snapshot of a release that a later release can be compared against.
+
+    Args:
+        df_aanzien: KRO-aanzien data of the release
+        df_gebruik: KRO-gebruik data of the release
+        filter_keys: Keys of FILTER_DEFINITIONS used for the HUP
+        matches: Matching object keys per filter, computed with a full run if omitted
+
+    Returns:
+        Snapshot dictionary
+    """
+    if matches is None:
+        matches = _matches_per_filter(df_aanzien, df_gebruik, filter_keys)
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "filter_keys": list(filter_keys),
+        "filter_definitions": {key: FILTER_DEFINITIONS[key] for key in filter_keys},
+        "aanzien_hashes": hash_records(df_aanzien, OBJECT_KEY),
+        "gebruik_hashes": hash_records(df_gebruik, GEBRUIK_KEY),
+        "matches": matches
+    }
+
+
+def save_snapshot(snapshot: Dict, path: str) -> str:
+    """Save a snapshot to disk and return its path."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    pd.to_pickle(snapshot, path)
+    logger.info("Snapshot saved to %s", path)
+    return path
+
+
+def load_snapshot(path: str) -> Dict:
+    """Load a snapshot created by save_snapshot."""
+    snapshot = pd.read_pickle(path)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version in {path}: {snapshot.get('version')}")
+    return snapshot
+
+
+def detect_changes(snapshot: Dict, df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame) -> Dict[str, pd.Index]:
+    """
+    Determine which objects were added, changed or removed since the snapshot.
+
+    An object counts as changed when its KRO-aanzien row or any of its KRO-gebruik rows differ.
+
+    Returns:
+        Dictionary with 'added', 'changed' and 'removed' object keys
+    """
+    old_aanzien = snapshot["aanzien_hashes"]
+    new_aanzien = hash_records(df_aanzien, OBJECT_KEY)
+    old_gebruik = snapshot["gebruik_hashes"]
+    new_gebruik = hash_records(df_gebruik, GEBRUIK_KEY)
+
+    added = new_aanzien.index.difference(old_aanzien.index)
+    removed = old_aanzien.index.difference(new_aanzien.index)
+    common = new_aanzien.index.intersection(old_aanzien.index)
+
+    aanzien_changed = common[new_aanzien.loc[common].values != old_aanzien.loc[common].values]
+
+    # Gebruik rows that appeared, disappeared or changed for existing objects
+    gebruik_common = old_gebruik.index.intersection(new_gebruik.index)
+    gebruik_diff = gebruik_common[old_gebruik.loc[gebruik_common].values != new_gebruik.loc[gebruik_common].values]
+    gebruik_changed = common.intersection(
+        gebruik_diff.union(old_gebruik.index.symmetric_difference(new_gebruik.index)))
+
+    return {
+        "added": added,
+        "changed": aanzien_changed.union(gebruik_changed),
+        "removed": removed
+    }
+
+
+def _classification(matches: Dict[str, List], filter_keys: List[str]) -> Tuple[Dict, Dict]:
+    """Map each object to its risk class (first matching filter wins) and its matching filters."""
+    risk = {}
+    filters = {}
+    for filter_key in filter_keys:
+        for object_key in matches.get(filter_key, []):
+            risk.setdefault(object_key, FILTER_DEFINITIONS[filter_key]["risk"])
+            filters.setdefault(object_key, []).append(filter_key)
+    return risk, filters
+
+
+def incremental_update(snapshot: Dict, df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame,
+                       filter_keys: Optional[List[str]] = None) -> Tuple[KRO_Tree, pd.DataFrame, Dict]:
+    """
+    Recompute the HUP for a new release, re-filtering only the affected objects.
+
+    Falls back to a full run when the selected filters or their definitions differ from the snapshot. Definitions
+    with a "nearest" step rank the objects of the whole release and are always evaluated on all of it.
+
+    Args:
+        snapshot: Snapshot of the previous release
+        df_aanzien: KRO-aanzien data of the new release
+        df_gebruik: KRO-gebruik data of the new release
+        filter_keys: Keys of FILTER_DEFINITIONS to use, defaults to those of the snapshot
+
+    Returns:
+        Tuple of (KRO_Tree with the updated HUP, delta report, snapshot of the new release)
+    """
+    if filter_keys is None:
+        filter_keys = snapshot["filter_keys"]
+    filter_keys = list(filter_keys)
+
+    same_filters = (filter_keys == snapshot["filter_keys"] and
+                    all(FILTER_DEFINITIONS[key] == snapshot["filter_definitions"].get(key) for key in filter_keys))
+
+    changes = detect_changes(snapshot, df_aanzien, df_gebruik)
+    affected = changes["added"].union(changes["changed"])
+
+    if same_filters:
+        logger.info("Incremental update: %d added, %d changed, %d removed objects.",
+                    len(changes['added']), len(changes['changed']), len(changes['removed']))
+        whole_dataset = [key for key in filter_keys
+                         if any(item["type"] in WHOLE_DATASET_TYPES for item in FILTER_DEFINITIONS[key]["filters"])]
+        per_object = [key for key in filter_keys if key not in whole_dataset]
+
+        sub_aanzien = df_aanzien[df_aanzien[OBJECT_KEY].isin(affected)]
+        sub_gebruik = df_gebruik[df_gebruik[GEBRUIK_KEY].isin(affected)]
+        affected_matches = _matches_per_filter(sub_aanzien, sub_gebruik, per_object)
+        if whole_dataset:
+            logger.info("Recomputing %s on the full release.", ", ".join(whole_dataset))
+            affected_matches.update(_matches_per_filter(df_aanzien, df_gebruik, whole_dataset))
+
+        stale = set(affected).union(changes["removed"])
+        matches = {}
+        for filter_key in filter_keys:
+            if filter_key in whole_dataset:
+                matches[filter_key] = list(affected_matches[filter_key])
+                continue
+            kept = [key for key in snapshot["matches"].get(filter_key, []) if key not in stale]
+            matches[filter_key] = kept + list(affected_matches[filter_key])
+    else:
+        logger.info("Filter selection differs from the snapshot, recomputing the full HUP.")
+        matches = _matches_per_filter(df_aanzien, df_gebruik, filter_keys)
+
+    # Rebuild the HUP from the new release in the same order a full run would produce
+    tree = KRO_Tree(df_aanzien, df_gebruik)
+    parts = []
+    for filter_key in filter_keys:
+        rows = tree.original_data[tree.original_data[OBJECT_KEY].isin(matches[filter_key])].copy()
+        rows['risico_classificatie'] = FILTER_DEFINITIONS[filter_key]["risk"]
+        parts.append(rows)
+    if parts:
+        tree.HUP = pd.concat([tree.HUP] + parts)
+    tree.history.append({"action": "incremental update of HUP", "rows_removed": 0, "rows_remaining": len(tree.HUP)})
+
+    # Delta report for all objects whose data changed
+    old_risk, old_filters = _classification(snapshot["matches"], snapshot["filter_keys"])
+    new_risk, new_filters = _classification(matches, filter_keys)
+    report_rows = []
+    for change_type, label in (("added", "toegevoegd"), ("changed", "gewijzigd"), ("removed", "verwijderd")):
+        for object_key in changes[change_type]:
+            report_rows.append({
+                OBJECT_KEY: object_key,
+                "wijziging": label,
+                "risico_oud": old_risk.get(object_key, "A") if change_type != "added" else None,
+                "risico_nieuw": new_risk.get(object_key, "A") if change_type != "removed" else None,
+                "filters_oud": ", ".join(old_filters.get(object_key, [])),
+                "filters_nieuw": ", ".join(new_filters.get(object_key, []))
+            })
+    delta_report = pd.DataFrame(report_rows, columns=[OBJECT_KEY, "wijziging", "risico_oud", "risico_nieuw",
+                                                      "filters_oud", "filters_nieuw"])
+
+    new_snapshot = build_snapshot(df_aanzien, df_gebruik, filter_keys, matches=matches)
+    return tree, delta_report, new_snapshot
+
+
+def main():
+    """Command line entry point for an incremental HUP update."""
+    parser = argparse.ArgumentParser(description="Incrementele HUP-update tussen KRO-releases")
+    parser.add_argument("--aanzien", required=True, help="KRO-aanzien CSV van de nieuwe release")
+    parser.add_argument("--gebruik", required=True, help="KRO-gebruik CSV van de nieuwe release")
+    parser.add_argument("--snapshot", help="Snapshot van de vorige release")
+    parser.add_argument("--vorige-aanzien", help="KRO-aanzien CSV van de vorige release (als er geen snapshot is)")
+    parser.add_argument("--vorige-gebruik", help="KRO-gebruik CSV van de vorige release (als er geen snapshot is)")
+    parser.add_argument("--filters", help="Komma-gescheiden filtersleutels (standaard: die van de snapshot)")
+    parser.add_argument("--template", default=get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx")),
+                        help="Excel-sjabloon voor de HUP")
+    parser.add_argument("--nieuwe-snapshot", default=get_executable_relative_path("data", "HUP-snapshot.pkl"),
+                        help="Pad voor de snapshot van de nieuwe release")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    filter_keys = args.filters.split(",") if args.filters else None
+
+    if args.snapshot:
+        snapshot = load_snapshot(args.snapshot)
+    elif args.vorige_aanzien and args.vorige_gebruik:
+        previous_keys = filter_keys or list(FILTER_DEFINITIONS.keys())
+        snapshot = build_snapshot(load_data_from_file(args.vorige_aanzien),
+                                  load_data_from_file(args.vorige_gebruik), previous_keys)
+    else:
+        parser.error("Geef --snapshot of zowel --vorige-aanzien als --vorige-gebruik op.")
+
+    tree, delta_report, new_snapshot = incremental_update(
+        snapshot,
+        load_data_from_file(args.aanzien),
+        load_data_from_file(args.gebruik),
+        filter_keys
+    )
+
+    datetime_string = datetime.now().strftime("%d-%m-%Y_%H-%M")
+    tree.insert_dataframe_into_excel(args.template, "Online Checklist Bedrijven", 2,
+                                     output_path=get_executable_relative_path("HUP", f"HUP-{datetime_string}.xlsx"))
+    report_path = get_executable_relative_path("HUP", f"HUP-wijzigingen-{datetime_string}.csv")
+    delta_report.to_csv(report_path, index=False, sep=';')
+    logger.info("Delta report saved to %s", report_path)
+    save_snapshot(new_snapshot, args.nieuwe_snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Lightweight instrumentation for the HUP pipeline.
+
+A Tracer records nested, timed spans (load → definition → filter step →
+prepare → export) with row counts, selectivity and the change in resident
+memory. A disabled tracer hands out a shared no-op span, so instrumented code
+costs next to nothing when nobody is looking.
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+from typing import Any, Dict, List, Optional
+
+
+def current_rss() -> Optional[int]:
+    """Return the current resident memory of this process in bytes, or None if unavailable."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+    return None
+
+
+class Span:
+    """A timed section of the pipeline. Set rows_out (and optionally rows_in) inside the block."""
+
+    __slots__ = ('tracer', 'name', 'attrs', 'rows_in', 'rows_out', 'children',
+                 'start', 'seconds', 'rss_start', 'rss_delta')
+
+    def __init__(self, tracer, name, rows_in=None, attrs=None):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs or {}
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.children = []
+        self.start = None
+        self.seconds = None
+        self.rss_start = None
+        self.rss_delta = None
+
+    def __enter__(self):
+        stack = self.tracer._stack
+        (stack[-1].children if stack else self.tracer.spans).append(self)
+        stack.append(self)
+        self.rss_start = current_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        rss_end = current_rss()
+        if rss_end is not None and self.rss_start is not None:
+            self.rss_delta = rss_end - self.rss_start
+        if exc_type is not None:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        self.tracer._stack.pop()
+        return False
+
+    @property
+    def selectivity(self) -> Optional[float]:
+        if self.rows_in and self.rows_out is not None:
+            return self.rows_out / self.rows_in
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "selectivity": round(self.selectivity, 6) if self.selectivity is not None else None,
+            "rss_delta_bytes": self.rss_delta,
+            **({"attrs": self.attrs} if self.attrs else {}),
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+class _NullSpan:
+    """Span stand-in used when tracing is disabled; ignores everything."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects spans for one run of the pipeline. Not shared between threads."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+
+    def span(self, name: str, rows_in: Optional[int] = None, **attrs):
+        """
+        Open a timed span; use as a context manager.
+
+        Args:
+            name: Name of the pipeline stage
+            rows_in: Number of rows going into the stage
+            attrs: Extra attributes stored with the span (e.g. definition=key)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, rows_in, attrs)
+
+    def reset(self):
+        self.spans = []
+        self._stack = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(sum(span.seconds or 0 for span in self.spans), 6),
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+    def to_json(self, path: str) -> str:
+        """Write all spans to a JSON file and return its path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        return path
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Flatten the span tree into rows for display.
+
+        Returns:
+            List of dictionaries with depth, name, seconds, share of the total time,
+            rows in/out, selectivity and memory change in MB
+        """
+        total = sum(span.seconds or 0 for span in self.spans) or 1.0
+        rows = []
+
+        def visit(span, depth):
+            rows.append({
+                "depth": depth,
+                "name": span.name,
+                "seconds": span.seconds,
+                "share": (span.seconds or 0) / total,
+                "rows_in": span.rows_in,
+                "rows_out": span.rows_out,
+                "selectivity": span.selectivity,
+                "rss_delta_mb": span.rss_delta / (1024 * 1024) if span.rss_delta is not None else None
+            })
+            for child in span.children:
+                visit(child, depth + 1)
+
+        for span in self.spans:
+            visit(span, 0)
+        return rows
+
+
+def traced(name: str):
+    """
+    Decorator that runs a method inside a span of the tracer found on self.tracer.
+
+    The span's rows_in is the number of rows of self.HUP (from hup_rows when the object has it, which does
+    not build the HUP) and rows_out the length of the result, when available.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            rows_in = getattr(self, 'hup_rows', None)
+            if rows_in is None:
+                hup = getattr(self, 'HUP', None)
+                rows_in = len(hup) if hup is not None else None
+            with self.tracer.span(name, rows_in=rows_in) as span:
+                result = method(self, *args, **kwargs)
+                if hasattr(result, '__len__') and not isinstance(result, str):
+                    span.rows_out = len(result)
+            return result
+        return wrapper
+    return decorator
+
+
+# Shared disabled tracer for code that is run without instrumentation
+NULL_TRACER = Tracer(enabled=False)
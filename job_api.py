@@ -0,0 +1,540 @@
+"""
+JSON HTTP API for generating HUPs without the wizard.
+
+Planning systems submit a job (a stored KRO dataset, filter keys of
+FILTER_DEFINITIONS and export options), poll its status and progress and
+download the result:
+
+    POST   /api/datasets             Upload a KRO-aanzien/KRO-gebruik pair (multipart fields 'aanzien' and
+                                     'gebruik'); returns the dataset id, the fingerprint of the contents
+    GET    /api/datasets             Stored datasets
+    GET    /api/filters              Keys, names and risk classes of the filter definitions
+    POST   /api/jobs                 {"dataset": id, "filters": [keys], "format": "xlsx", "add_A": false,
+                                     "remove_no_name": false}; returns the job id (202)
+    GET    /api/jobs                 Jobs of the client
+    GET    /api/jobs/<id>            Status and progress of a job
+    GET    /api/jobs/<id>/result     The exported file of a finished job
+    DELETE /api/jobs/<id>            Cancel a waiting job, or remove a finished job and its file
+
+Jobs run in a pool of worker processes (JobQueue). A client, named by its IP
+address (or by the X-Client-Id header of a request from a trusted proxy), has
+at most `per_client` jobs running
+and `max_waiting` jobs waiting; when a worker is free the oldest waiting job
+of a client below its limit starts, so a client with many jobs does not hold
+up the others. Each worker keeps the last loaded datasets with their gebruik
+aggregates, so successive jobs on the same dataset skip parsing.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional
+
+import tornado.web
+import tornado.ioloop
+
+from data_management import FILTER_DEFINITIONS
+from exporters import EXPORT_FORMATS, available_formats
+from mask_cache import content_fingerprint
+from schema_scanner import check_upload
+
+logger = logging.getLogger(__name__)
+
+API_DIR = os.path.join(tempfile.gettempdir(), "HUP Generator", "api")
+
+# Largest upload accepted by the API, as for the PyWebIO server
+MAX_PAYLOAD_SIZE = 200 * 1024 * 1024
+
+# Seconds a finished job and its file are kept
+JOB_RETENTION = 24 * 3600
+
+# Datasets kept loaded per worker process
+WORKER_DATASETS = 2
+
+SHEET_NAME = "Online Checklist Bedrijven"
+
+WAITING, RUNNING, DONE, FAILED, CANCELLED = "waiting", "running", "done", "failed", "cancelled"
+
+
+class TooManyJobs(Exception):
+    """The client already has the maximum number of waiting jobs."""
+
+
+class Job:
+    """A submitted HUP job and its progress."""
+
+    def __init__(self, client: str, spec: dict):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.spec = spec
+        self.status = WAITING
+        self.progress = 0.0
+        self.step = None
+        self.error = None
+        self.output_path = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self, position: Optional[int] = None) -> dict:
+        result = {"job": self.id, "status": self.status, "progress": round(self.progress, 3), "step": self.step,
+                  "dataset": self.spec["dataset"], "filters": self.spec["filters"], "format": self.spec["format"],
+                  "submitted": self.submitted, "started": self.started, "finished": self.finished}
+        if position is not None:
+            result["position"] = position
+        if self.status == DONE:
+            result["result"] = f"/api/jobs/{self.id}/result"
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
+
+# Set in the worker processes: queue for progress messages, the loaded datasets and the output cache size
+_progress = None
+_datasets = {}
+_output_cache_mb = 0
+
+
+def _init_worker(progress, output_cache_mb) -> None:
+    from startup import warm_up
+    global _progress, _output_cache_mb
+    _progress = progress
+    _output_cache_mb = output_cache_mb
+    warm_up()
+
+
+def _report(job_id: str, progress: float, step: str) -> None:
+    if _progress is not None:
+        _progress.put((job_id, progress, step))
+
+
+def _load_dataset(dataset_dir: str):
+    """Returns the frames and gebruik aggregates of a stored dataset, keeping the last few loaded."""
+    from data_management import load_data_from_content
+    from gebruik_aggregates import GebruikAggregates
+
+    dataset_id = os.path.basename(dataset_dir)
+    if dataset_id not in _datasets:
+        frames = []
+        for kind in ("aanzien", "gebruik"):
+            with open(os.path.join(dataset_dir, f"{kind}.csv"), 'rb') as f:
+                frames.append(load_data_from_content(f.read(), f"{kind}.csv", delimiters=[',', ';']))
+        while len(_datasets) >= WORKER_DATASETS:
+            _datasets.pop(next(iter(_datasets)))
+        _datasets[dataset_id] = (frames[0], frames[1], GebruikAggregates(frames[1]))
+    return _datasets[dataset_id]
+
+
+def _run_job(job_id: str, dataset_dir: str, spec: dict, output_path: str) -> None:
+    """Runs a job in a worker process: load the dataset, apply the filters and export the HUP."""
+    from classes import KRO_Tree
+    from data_management import apply_filter_to_tree, get_resource_path
+    from output_cache import OUTPUT_CACHE, output_key
+
+    # Datasets are stored under the fingerprint of the uploads, so the cache is shared with the app
+    template = get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx"))
+    cache_key = None
+    if _output_cache_mb:
+        OUTPUT_CACHE.max_bytes = _output_cache_mb * 2 ** 20
+        cache_key = output_key(os.path.basename(dataset_dir), spec["filters"], spec["format"], add_A=spec["add_A"],
+                               remove_no_name=spec["remove_no_name"], template_path=template)
+    extension = EXPORT_FORMATS[spec["format"]]["extension"]
+    if cache_key and OUTPUT_CACHE.copy_to(cache_key, extension, output_path):
+        _report(job_id, 1.0, "eerder gemaakt")
+        return
+
+    steps = len(spec["filters"]) + 2
+    _report(job_id, 0.0, "gegevens laden")
+    df_aanzien, df_gebruik, aggregates = _load_dataset(dataset_dir)
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, fingerprint=os.path.basename(dataset_dir),
+                    aggregates=aggregates, enriched_view=True)
+    for done, filter_key in enumerate(spec["filters"], start=1):
+        _report(job_id, done / steps, f"filter {filter_key}")
+        apply_filter_to_tree(tree, filter_key)
+
+    _report(job_id, (steps - 1) / steps, "exporteren")
+    options = dict(add_A=spec["add_A"], remove_no_name=spec["remove_no_name"])
+    if spec["format"] == "xlsx":
+        tree.insert_dataframe_into_excel(template, SHEET_NAME, 2, output_path=output_path, **options)
+    else:
+        tree.export_file(spec["format"], output_path=output_path, **options)
+    if cache_key:
+        OUTPUT_CACHE.put(cache_key, output_path, extension)
+
+
+class JobQueue:
+    """
+    Waiting and running jobs on a bounded pool of worker processes.
+
+    Args:
+        workers: Number of worker processes, i.e. jobs running at the same time
+        per_client: Jobs of one client running at the same time
+        max_waiting: Jobs of one client waiting at the same time; more are refused
+        directory: Directory for the uploaded datasets and the results
+        output_cache_mb: Size of the cache of generated files shared with the app (see output_cache.py); 0 disables it
+    """
+
+    def __init__(self, workers: int = 2, per_client: int = 1, max_waiting: int = 20, directory: str = API_DIR,
+                 output_cache_mb: float = 500):
+        self.workers = max(1, int(workers))
+        self.output_cache_mb = output_cache_mb
+        self.per_client = max(1, int(per_client))
+        self.max_waiting = max(1, int(max_waiting))
+        self.dataset_dir = os.path.join(directory, "datasets")
+        self.result_dir = os.path.join(directory, "resultaten")
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        self.jobs: Dict[str, Job] = {}
+        self._waiting: List[str] = []
+        self._running = 0
+        # Reentrant: a future that is already done runs its callback (and _dispatch) inside _dispatch
+        self._lock = threading.RLock()
+        self._context = multiprocessing.get_context("spawn")
+        self._progress = self._context.Queue()
+        self._executor = self._new_executor()
+        threading.Thread(target=self._receive_progress, name="hup-api-voortgang", daemon=True).start()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self._progress, self.output_cache_mb))
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        """Starts a new pool in place of a broken one; only the first caller replaces it. Call with the lock held."""
+        if self._executor is broken:
+            self._executor = self._new_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def _receive_progress(self) -> None:
+        while True:
+            try:
+                job_id, progress, step = self._progress.get()
+            except (EOFError, OSError):
+                return
+            job = self.jobs.get(job_id)
+            if job is not None and job.status == RUNNING:
+                job.progress, job.step = progress, step
+
+    # Datasets
+
+    def store_dataset(self, aanzien: bytes, gebruik: bytes) -> str:
+        """
+        Stores an uploaded KRO-aanzien/KRO-gebruik pair after checking its columns.
+
+        Returns:
+            The dataset id; the same files give the same id
+        """
+        for content, kind in ((aanzien, "aanzien"), (gebruik, "gebruik")):
+            report = check_upload(content, f"{kind}.csv", kind)
+            if not report.ok:
+                raise ValueError(f"KRO-{kind} mist kolommen: {', '.join(report.missing)}")
+        dataset_id = content_fingerprint(aanzien, gebruik)
+        path = os.path.join(self.dataset_dir, dataset_id)
+        if not os.path.isdir(path):
+            staging = tempfile.mkdtemp(prefix=".upload-", dir=self.dataset_dir)
+            for content, kind in ((aanzien, "aanzien"), (gebruik, "gebruik")):
+                with open(os.path.join(staging, f"{kind}.csv"), 'wb') as f:
+                    f.write(content)
+            try:
+                os.replace(staging, path)
+            except OSError:
+                # Stored by another upload of the same files in the meantime
+                shutil.rmtree(staging, ignore_errors=True)
+        return dataset_id
+
+    def datasets(self) -> List[dict]:
+        result = []
+        for entry in os.scandir(self.dataset_dir):
+            if entry.is_dir() and not entry.name.startswith("."):
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                result.append({"dataset": entry.name, "bytes": size, "stored": entry.stat().st_mtime})
+        return result
+
+    # Jobs
+
+    def submit(self, client: str, request: dict) -> Job:
+        """
+        Validates a job request and puts the job in the queue.
+
+        Raises:
+            ValueError: For an unknown dataset, filter or format
+            TooManyJobs: When the client already has max_waiting jobs waiting
+        """
+        spec = self._job_spec(request)
+        self.expire()
+        job = Job(client, spec)
+        with self._lock:
+            waiting = sum(1 for job_id in self._waiting if self.jobs[job_id].client == client)
+            if waiting >= self.max_waiting:
+                raise TooManyJobs(f"Maximaal {self.max_waiting} wachtende opdrachten per client.")
+            self.jobs[job.id] = job
+            self._waiting.append(job.id)
+        self._dispatch()
+        return job
+
+    def _job_spec(self, request: dict) -> dict:
+        if not isinstance(request, dict):
+            raise ValueError("Verwacht een JSON-object.")
+        dataset = request.get("dataset")
+        if not isinstance(dataset, str) or not os.path.isdir(os.path.join(self.dataset_dir, os.path.basename(dataset))):
+            raise ValueError(f"Onbekende dataset: {dataset}")
+        filters = request.get("filters", list(FILTER_DEFINITIONS))
+        if not isinstance(filters, list) or not filters:
+            raise ValueError("'filters' moet een niet-lege lijst met filtersleutels zijn.")
+        unknown = [key for key in filters if not isinstance(key, str) or key not in FILTER_DEFINITIONS]
+        if unknown:
+            raise ValueError(f"Onbekende filtersleutel(s): {', '.join(map(str, unknown))}")
+        output_format = request.get("format", "xlsx")
+        if not available_formats().get(output_format):
+            raise ValueError(f"Uitvoerformaat niet beschikbaar: {output_format}")
+        return {"dataset": os.path.basename(dataset), "filters": filters, "format": output_format,
+                "add_A": bool(request.get("add_A", False)),
+                "remove_no_name": bool(request.get("remove_no_name", False))}
+
+    def _dispatch(self) -> None:
+        """Starts waiting jobs while workers are free, skipping clients at their limit."""
+        with self._lock:
+            while self._running < self.workers:
+                running = {}
+                for job in self.jobs.values():
+                    if job.status == RUNNING:
+                        running[job.client] = running.get(job.client, 0) + 1
+                job_id = next((job_id for job_id in self._waiting
+                               if running.get(self.jobs[job_id].client, 0) < self.per_client), None)
+                if job_id is None:
+                    return
+                self._waiting.remove(job_id)
+                job = self.jobs[job_id]
+                job.status, job.started, job.step = RUNNING, time.time(), "gestart"
+                extension = EXPORT_FORMATS[job.spec["format"]]["extension"]
+                job.output_path = os.path.join(self.result_dir, job.id + extension)
+                self._running += 1
+                arguments = (_run_job, job.id, os.path.join(self.dataset_dir, job.spec["dataset"]), job.spec,
+                             job.output_path)
+                executor = self._executor
+                try:
+                    future = executor.submit(*arguments)
+                except BrokenProcessPool:
+                    # The pool broke before the callbacks of its jobs replaced it
+                    self._replace_executor(executor)
+                    executor = self._executor
+                    future = executor.submit(*arguments)
+                future.add_done_callback(lambda future, job=job, executor=executor:
+                                         self._finished(job, future, executor))
+
+    def _finished(self, job: Job, future, executor: ProcessPoolExecutor) -> None:
+        try:
+            future.result()
+            job.status, job.progress, job.step = DONE, 1.0, None
+        except BrokenProcessPool as e:
+            job.status, job.error = FAILED, f"Werkproces gestopt: {e}"
+            # Every job of the broken pool ends up here; the pool is replaced once
+            with self._lock:
+                self._replace_executor(executor)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status, job.error = FAILED, str(e)
+        job.finished = time.time()
+        with self._lock:
+            self._running -= 1
+        self._dispatch()
+
+    def position(self, job: Job) -> Optional[int]:
+        """Place of a waiting job in the queue (1 is next)."""
+        with self._lock:
+            return self._waiting.index(job.id) + 1 if job.id in self._waiting else None
+
+    def cancel(self, job: Job) -> None:
+        """
+        Cancels a waiting job or removes a finished one with its file.
+
+        Raises:
+            RuntimeError: When the job is running
+        """
+        with self._lock:
+            if job.status == RUNNING:
+                raise RuntimeError("Een lopende opdracht kan niet worden geannuleerd.")
+            if job.id in self._waiting:
+                self._waiting.remove(job.id)
+                job.status, job.finished = CANCELLED, time.time()
+                return
+            self.jobs.pop(job.id, None)
+        if job.output_path and os.path.exists(job.output_path):
+            os.remove(job.output_path)
+
+    def expire(self, retention: float = JOB_RETENTION) -> int:
+        """Removes jobs that finished more than retention seconds ago, with their files."""
+        with self._lock:
+            expired = [job for job in self.jobs.values() if job.finished and job.finished < time.time() - retention]
+        for job in expired:
+            self.cancel(job)
+        return len(expired)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "running": self._running, "waiting": len(self._waiting),
+                    "per_client": self.per_client}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """Base handler: JSON responses and errors, and the name of the client."""
+
+    def initialize(self, queue: JobQueue, trusted_proxies: frozenset = frozenset()):
+        self.queue = queue
+        self.trusted_proxies = trusted_proxies
+
+    @property
+    def client(self) -> str:
+        """The IP address of the caller, or the X-Client-Id header of a request from a trusted proxy."""
+        client_id = self.request.headers.get("X-Client-Id")
+        if client_id and self.request.remote_ip in self.trusted_proxies:
+            return client_id
+        return self.request.remote_ip
+
+    def write_json(self, data, status: int = 200) -> None:
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data))
+
+    def write_error(self, status_code: int, **kwargs) -> None:
+        reason = self._reason
+        if "exc_info" in kwargs and isinstance(kwargs["exc_info"][1], tornado.web.HTTPError):
+            reason = kwargs["exc_info"][1].log_message or reason
+        self.write_json({"error": reason}, status_code)
+
+    def job(self, job_id: str) -> Job:
+        job = self.queue.jobs.get(job_id)
+        if job is None or job.client != self.client:
+            raise tornado.web.HTTPError(404, "Onbekende opdracht: %s", job_id)
+        return job
+
+
+class DatasetsHandler(ApiHandler):
+    def get(self):
+        self.write_json({"datasets": self.queue.datasets()})
+
+    def post(self):
+        files = self.request.files
+        if "aanzien" not in files or "gebruik" not in files:
+            raise tornado.web.HTTPError(400, "Verwacht de bestanden 'aanzien' en 'gebruik' (multipart/form-data).")
+        try:
+            dataset_id = self.queue.store_dataset(files["aanzien"][0]["body"], files["gebruik"][0]["body"])
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, str(e))
+        self.write_json({"dataset": dataset_id}, 201)
+
+
+class FiltersHandler(ApiHandler):
+    def get(self):
+        self.write_json({"filters": [{"key": key, "name": definition["name"], "risk": definition["risk"]}
+                                     for key, definition in FILTER_DEFINITIONS.items()],
+                         "formats": [key for key, available in available_formats().items() if available]})
+
+
+class JobsHandler(ApiHandler):
+    def get(self):
+        jobs = [job for job in self.queue.jobs.values() if job.client == self.client]
+        self.write_json({"jobs": [job.to_dict(self.queue.position(job)) for job in jobs],
+                         "queue": self.queue.status()})
+
+    def post(self):
+        try:
+            request = json.loads(self.request.body or b"{}")
+            job = self.queue.submit(self.client, request)
+        except (ValueError, json.JSONDecodeError) as e:
+            raise tornado.web.HTTPError(400, str(e))
+        except TooManyJobs as e:
+            raise tornado.web.HTTPError(429, str(e))
+        self.set_header("Location", f"/api/jobs/{job.id}")
+        self.write_json(job.to_dict(self.queue.position(job)), 202)
+
+
+class JobHandler(ApiHandler):
+    def get(self, job_id):
+        job = self.job(job_id)
+        self.write_json(job.to_dict(self.queue.position(job)))
+
+    def delete(self, job_id):
+        try:
+            self.queue.cancel(self.job(job_id))
+        except RuntimeError as e:
+            raise tornado.web.HTTPError(409, str(e))
+        self.set_status(204)
+        self.finish()
+
+
+class ResultHandler(ApiHandler):
+    async def get(self, job_id):
+        job = self.job(job_id)
+        if job.status != DONE or not os.path.exists(job.output_path):
+            raise tornado.web.HTTPError(409, "De opdracht is nog niet klaar (status %s).", job.status)
+        extension = EXPORT_FORMATS[job.spec["format"]]["extension"]
+        self.set_header("Content-Type", "application/octet-stream")
+        self.set_header("Content-Disposition", f'attachment; filename="HUP-{job.id[:8]}{extension}"')
+        with open(job.output_path, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.write(chunk)
+                await self.flush()
+        self.finish()
+
+
+def make_application(queue: JobQueue, trusted_proxies: Iterable[str] = ()) -> tornado.web.Application:
+    arguments = dict(queue=queue, trusted_proxies=frozenset(trusted_proxies))
+    return tornado.web.Application([
+        (r"/api/datasets", DatasetsHandler, arguments),
+        (r"/api/filters", FiltersHandler, arguments),
+        (r"/api/jobs", JobsHandler, arguments),
+        (r"/api/jobs/([0-9a-f]+)", JobHandler, arguments),
+        (r"/api/jobs/([0-9a-f]+)/result", ResultHandler, arguments),
+    ])
+
+
+def start_api_server(queue: JobQueue, port: int, address: str = "127.0.0.1",
+                     trusted_proxies: Iterable[str] = ()) -> threading.Thread:
+    """
+    Serves the API on its own port from a background thread with its own event loop.
+
+    Args:
+        queue: Queue the jobs are submitted to
+        port: Port of the API
+        address: Address to listen on; the API has no authentication, so only localhost by default
+        trusted_proxies: IP addresses of proxies whose X-Client-Id header names the client; other callers are
+            told apart by their IP address
+
+    Returns:
+        The (daemon) thread of the server
+    """
+    ready = threading.Event()
+    errors = []
+
+    def serve():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        try:
+            make_application(queue, trusted_proxies).listen(port, address=address, max_body_size=MAX_PAYLOAD_SIZE)
+        except OSError as e:
+            errors.append(e)
+            return
+        finally:
+            ready.set()
+        tornado.ioloop.IOLoop.current().start()
+
+    thread = threading.Thread(target=serve, name="hup-api", daemon=True)
+    thread.start()
+    ready.wait(timeout=10)
+    if errors:
+        raise errors[0]
+    return thread
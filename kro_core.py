@@ -0,0 +1,212 @@
+"""
+Compact NumPy copy of the KRO fields used by the filter predicates.
+
+KRO_Tree keeps KRO-aanzien and KRO-gebruik as general-purpose dataframes,
+which pay for index alignment and per-column objects on every comparison.
+The predicates only need a handful of fields, so ObjectStore keeps an extra
+copy of those in one contiguous NumPy structured array (one record per object,
+in the row order of KRO-aanzien) and of KRO-gebruik in GebruikColumns:
+key-sorted columnar arrays with CSR offsets per aanzien_id. The store is only
+used to evaluate column, personen and SBI predicates into masks; the selected
+positions are applied to the dataframes, which remain the source for the risk
+classes and the export.
+
+Every numeric field is stored in the smallest dtype that holds all of its
+values exactly (e.g. int8 for the function flags), and widened to int64 or
+float64 before a comparison, so results are the same as on the dataframes.
+"""
+
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from gebruik_aggregates import PREFIX_END
+
+# KRO-aanzien columns stored in the structured array; columns missing from the data are left out
+CORE_FIELDS = ('id', 'bronsleutel', 'celfunctie', 'industriefunctie', 'kantoorfunctie', 'onderwijsfunctie',
+               'sportfunctie', 'winkelfunctie', 'bag_oppvlk', 'woz_opp_nietwoon', 'bouwlagen', 'pandhoogte',
+               'bouwjaar', 'x', 'y')
+
+_INTEGER_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def _compact_dtype(values: np.ndarray) -> np.dtype:
+    """Smallest integer or float dtype that holds every value of the array exactly."""
+    if values.dtype.kind in "iu":
+        if len(values) == 0:
+            return np.dtype(np.int8)
+        low, high = values.min(), values.max()
+        for dtype in _INTEGER_DTYPES:
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                return np.dtype(dtype)
+        return values.dtype
+    if values.dtype.kind == "f":
+        with np.errstate(over='ignore'):
+            narrow = values.astype(np.float32)
+        if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+            return np.dtype(np.float32)
+        return np.dtype(np.float64)
+    return values.dtype
+
+
+def _numeric(series: pd.Series) -> np.ndarray:
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.hasnans:
+        return series.to_numpy(dtype=np.int64)
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _widen(values: np.ndarray) -> np.ndarray:
+    """Values as int64 or float64, so comparisons behave exactly as on the original column."""
+    return values.astype(np.int64 if values.dtype.kind in "iu" else np.float64)
+
+
+def _compare(values: np.ndarray, operator: str, value) -> np.ndarray:
+    """numpy counterpart of classes.MASK_FUNCTIONS; '!=' is true and the others false for NaN."""
+    if operator == "in":
+        return np.isin(values, list(value))
+    if operator == ">":
+        return values > value
+    if operator == "<":
+        return values < value
+    if operator == ">=":
+        return values >= value
+    if operator == "<=":
+        return values <= value
+    if operator == "==":
+        return values == value
+    if operator == "!=":
+        return values != value
+    raise ValueError(f"Unknown operator: {operator}")
+
+
+def _segments_any(row_mask: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Per CSR segment: whether any of its rows is set (False for empty segments)."""
+    result = np.zeros(len(indptr) - 1, dtype=bool)
+    if len(row_mask) == 0:
+        return result
+    starts = indptr[:-1]
+    filled = indptr[1:] > starts
+    result[filled] = np.logical_or.reduceat(row_mask, starts[filled])
+    return result
+
+
+class GebruikColumns:
+    """
+    KRO-gebruik as key-sorted columns: rows of aanzien_id keys[i] are rows indptr[i]:indptr[i + 1].
+
+    Args:
+        df_gebruik: KRO-gebruik dataframe with 'aanzien_id', 'personen' and 'act1code'
+    """
+
+    def __init__(self, df_gebruik: pd.DataFrame):
+        aanzien_ids = df_gebruik['aanzien_id'].to_numpy()
+        order = np.argsort(aanzien_ids, kind='stable')
+        sorted_ids = aanzien_ids[order]
+        first = np.concatenate(([True], sorted_ids[1:] != sorted_ids[:-1])) if len(sorted_ids) else \
+            np.zeros(0, dtype=bool)
+        self.keys = sorted_ids[first]
+        self.indptr = np.append(np.flatnonzero(first), len(sorted_ids)).astype(np.int64)
+        self.personen = df_gebruik['personen'].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+        # SBI codes as ids into a sorted vocabulary of the code strings (as act1code.astype(str) gives them)
+        code_ids, distinct = pd.factorize(df_gebruik['act1code'], use_na_sentinel=False)
+        distinct_strings = np.array(pd.Series(distinct).astype(str).tolist(), dtype=str)
+        vocabulary_order = np.argsort(distinct_strings, kind='stable')
+        self.sbi_vocabulary = distinct_strings[vocabulary_order]
+        self.sbi_codes = np.argsort(vocabulary_order).astype(np.int32)[code_ids][order]
+
+    def rows_of(self, object_keys: np.ndarray) -> np.ndarray:
+        """Returns the index into keys of every object key, or -1 for objects without gebruik rows."""
+        if len(self.keys) == 0:
+            return np.full(len(object_keys), -1, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.keys, object_keys), len(self.keys) - 1)
+        return np.where(self.keys[found] == object_keys, found, -1)
+
+    def personen_key_mask(self, operator: str, value) -> np.ndarray:
+        """Per key: whether any of its gebruik rows has a 'personen' value passing the comparison."""
+        value = [float(item) for item in value] if operator == "in" else float(value)
+        return _segments_any(_compare(self.personen, operator, value), self.indptr)
+
+    def matching_codes(self, start_nums: Iterable) -> np.ndarray:
+        """Returns a boolean array over the SBI vocabulary marking codes that start with one of start_nums."""
+        hit = np.zeros(len(self.sbi_vocabulary), dtype=bool)
+        for start_num in start_nums:
+            prefix = str(start_num)
+            lo = np.searchsorted(self.sbi_vocabulary, prefix, side='left')
+            hi = np.searchsorted(self.sbi_vocabulary, prefix + PREFIX_END, side='left')
+            hit[lo:hi] = True
+        return hit
+
+    def sbi_key_mask(self, start_nums: Iterable) -> np.ndarray:
+        """Per key: whether any of its gebruik rows has an SBI code starting with one of start_nums."""
+        return _segments_any(self.matching_codes(start_nums)[self.sbi_codes], self.indptr)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes + self.indptr.nbytes + self.personen.nbytes + self.sbi_vocabulary.nbytes
+                   + self.sbi_codes.nbytes)
+
+
+class ObjectStore:
+    """
+    Filter fields of KRO-aanzien in one structured array, plus KRO-gebruik as GebruikColumns.
+
+    Args:
+        records: Structured array with one record per object, in the row order of KRO-aanzien
+        gebruik: Key-sorted KRO-gebruik columns
+        object_key: Field of the records that matches aanzien_id in KRO-gebruik
+    """
+
+    def __init__(self, records: np.ndarray, gebruik: GebruikColumns, object_key: str = 'bronsleutel'):
+        self.records = records
+        self.gebruik = gebruik
+        self.key_rows = gebruik.rows_of(records[object_key])
+
+    @classmethod
+    def from_frames(cls, df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame,
+                    fields: Sequence[str] = CORE_FIELDS) -> "ObjectStore":
+        """
+        Build the core model from loaded KRO dataframes.
+
+        Args:
+            df_aanzien: KRO-aanzien dataframe
+            df_gebruik: KRO-gebruik dataframe
+            fields: KRO-aanzien columns to store; they must be numeric
+
+        Returns:
+            ObjectStore over the objects of df_aanzien, in the same order
+        """
+        columns = {field: _numeric(df_aanzien[field]) for field in fields if field in df_aanzien}
+        dtype = [(field, _compact_dtype(values)) for field, values in columns.items()]
+        records = np.zeros(len(df_aanzien), dtype=dtype)
+        for field, values in columns.items():
+            records[field] = values
+        return cls(records, GebruikColumns(df_gebruik))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.records.dtype.names
+
+    def column_mask(self, column: str, operator: str, value, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Mask of 'column operator value' for the objects at positions (all objects if None)."""
+        values = self.records[column] if positions is None else self.records[column][positions]
+        return _compare(_widen(values), operator, value)
+
+    def personen_mask(self, operator: str, value, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Objects without gebruik rows pass, others when any of their rows passes the comparison."""
+        key_rows = self.key_rows if positions is None else self.key_rows[positions]
+        key_mask = self.gebruik.personen_key_mask(operator, value)
+        return (key_rows < 0) | key_mask[np.maximum(key_rows, 0)]
+
+    def sbi_mask(self, start_nums: Iterable, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """Objects with a gebruik row whose SBI code starts with one of start_nums."""
+        key_rows = self.key_rows if positions is None else self.key_rows[positions]
+        key_mask = self.gebruik.sbi_key_mask(start_nums)
+        return (key_rows >= 0) & key_mask[np.maximum(key_rows, 0)]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.records.nbytes + self.key_rows.nbytes + self.gebruik.nbytes)
@@ -0,0 +1,118 @@
+"""
+Memoized predicate masks for KRO_Tree.
+
+Each filter predicate (a column comparison, an SBI code list or a personen
+check) is evaluated once over the full KRO-aanzien dataset into a boolean
+mask. Masks are cached per dataset fingerprint and predicate spec, so a repeat
+run on the same upload only evaluates predicates it has not seen yet. The cache
+is shared by all sessions and evicts least recently used masks above a memory cap.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def dataset_fingerprint(df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame) -> str:
+    """Fingerprint the contents of a KRO-aanzien/KRO-gebruik pair (ignoring 'risico_classificatie')."""
+    digest = hashlib.sha1()
+    for df in (df_aanzien, df_gebruik):
+        df = df.drop(columns=['risico_classificatie'], errors='ignore')
+        digest.update(",".join(map(str, df.columns)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def content_fingerprint(*contents: bytes) -> str:
+    """Fingerprint raw uploaded file contents; cheaper than hashing the parsed frames."""
+    digest = hashlib.sha1()
+    for content in contents:
+        digest.update(hashlib.sha1(content).digest())
+    return digest.hexdigest()
+
+
+def predicate_spec(kind: str, *args) -> Tuple:
+    """Build a hashable cache key for a predicate, normalizing list values to tuples."""
+    def normalize(value):
+        if isinstance(value, (list, tuple, set)):
+            return tuple(normalize(v) for v in value)
+        return value
+    return (kind,) + tuple(normalize(arg) for arg in args)
+
+
+class MaskCache:
+    """
+    Thread-safe LRU cache of boolean predicate masks with a memory cap.
+
+    Args:
+        max_bytes: Total size of the cached masks before the least recently used ones are evicted
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._masks = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str, spec: Hashable) -> Optional[np.ndarray]:
+        key = (fingerprint, spec)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is None:
+                self.misses += 1
+                return None
+            self._masks.move_to_end(key)
+            self.hits += 1
+            return mask
+
+    def peek(self, fingerprint: str, spec: Hashable) -> Optional[np.ndarray]:
+        """Return the cached mask without counting a hit or miss or changing the eviction order."""
+        with self._lock:
+            return self._masks.get((fingerprint, spec))
+
+    def put(self, fingerprint: str, spec: Hashable, mask: np.ndarray) -> None:
+        key = (fingerprint, spec)
+        mask = np.asarray(mask, dtype=bool)
+        mask.flags.writeable = False
+        with self._lock:
+            if key in self._masks:
+                self._bytes -= self._masks.pop(key).nbytes
+            if mask.nbytes > self.max_bytes:
+                return
+            self._masks[key] = mask
+            self._bytes += mask.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._masks.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get_or_compute(self, fingerprint: str, spec: Hashable, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Return the cached mask for a predicate, computing and storing it on a miss."""
+        mask = self.get(fingerprint, spec)
+        if mask is None:
+            mask = np.asarray(compute(), dtype=bool)
+            self.put(fingerprint, spec, mask)
+        return mask
+
+    def clear(self) -> None:
+        with self._lock:
+            self._masks.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+
+# Process-wide cache shared by all KRO_Tree instances
+MASK_CACHE = MaskCache()
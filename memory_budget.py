@@ -0,0 +1,212 @@
+"""
+Memory budget for large runs.
+
+With large regional files and class A objects included, the accumulated HUP,
+the copies made by prepare_dataframe and the openpyxl workbook can together
+exhaust the memory of an ordinary laptop. A KRO_Tree with a MemoryBudget
+prepares the HUP in chunks instead (see KRO_Tree.prepared_chunks) and keeps
+the prepared chunks in a ChunkStore: once the resident memory of the process
+exceeds the budget, the chunks are written to temporary columnar files
+(Parquet when pyarrow is installed, pickle otherwise) and read back one at a
+time while exporting. The run gets slower, but it finishes.
+
+The budget also records the peak memory of the run for the report at the end.
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import weakref
+from typing import Iterator, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk when the HUP is prepared under a memory budget
+DEFAULT_CHUNK_ROWS = 50_000
+
+
+def current_memory_mb() -> Optional[float]:
+    """Return the resident memory of this process in MB, or None if it cannot be measured."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Return the peak resident memory of this process in MB, or None if unavailable."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def _parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class MemoryBudget:
+    """
+    Resident memory limit above which intermediate results are written to disk.
+
+    Args:
+        limit_mb: Budget in MB; None only records the peak memory and never spills
+        chunk_rows: Rows per chunk when the HUP is prepared
+        directory: Directory for the temporary files (default: the system temp directory)
+    """
+
+    def __init__(self, limit_mb: Optional[float], chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 directory: Optional[str] = None):
+        self.limit_mb = limit_mb
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.directory = directory
+        self.spilled_files = 0
+        self.spilled_bytes = 0
+        self._peak_mb = None
+        self._spill_dir = None
+        self._finalizer = None
+        self._use_parquet = _parquet_available()
+        self._warned = False
+
+    def check(self) -> Optional[float]:
+        """Sample the resident memory and return it in MB."""
+        memory = current_memory_mb()
+        if memory is not None and (self._peak_mb is None or memory > self._peak_mb):
+            self._peak_mb = memory
+        return memory
+
+    def exceeded(self) -> bool:
+        """Whether the budget is exceeded; without a way to measure memory it always counts as exceeded."""
+        memory = self.check()
+        if self.limit_mb is None:
+            return False
+        if memory is None:
+            if not self._warned:
+                logger.warning("Cannot measure memory use (install psutil); writing intermediate results to disk.")
+                self._warned = True
+            return True
+        return memory > self.limit_mb
+
+    def _directory(self) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="hup-spill-", dir=self.directory)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+    def spill(self, frame: pd.DataFrame) -> str:
+        """Write a dataframe to a temporary file and return its path."""
+        extension = ".parquet" if self._use_parquet else ".pkl"
+        path = os.path.join(self._directory(), f"deel-{self.spilled_files:05d}{extension}")
+        if self._use_parquet:
+            frame.to_parquet(path)
+        else:
+            frame.to_pickle(path)
+        self.spilled_files += 1
+        self.spilled_bytes += os.path.getsize(path)
+        return path
+
+    @staticmethod
+    def load(path: str) -> pd.DataFrame:
+        """Read a dataframe written by spill."""
+        return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+
+    @property
+    def peak_mb(self) -> Optional[float]:
+        """Highest resident memory of the process so far, as measured by the OS or sampled by check()."""
+        peaks = [peak for peak in (peak_memory_mb(), self._peak_mb) if peak is not None]
+        return max(peaks) if peaks else None
+
+    def report(self) -> str:
+        peak = self.peak_mb
+        text = f"Piekgeheugen: {peak:.0f} MB" if peak is not None else "Piekgeheugen: onbekend"
+        if self.limit_mb is not None:
+            text += f" (budget {self.limit_mb:.0f} MB)"
+        if self.spilled_files:
+            text += (f"; {self.spilled_files} tussenresultaten ({self.spilled_bytes / 2 ** 20:.0f} MB) "
+                     f"tijdelijk naar schijf geschreven")
+        return text
+
+    def close(self) -> None:
+        """Remove the temporary files."""
+        if self._finalizer is not None:
+            self._finalizer()
+        self._spill_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ChunkStore:
+    """
+    Dataframe chunks in order, kept in memory until the budget is exceeded and then written to disk.
+
+    Args:
+        budget: MemoryBudget that decides when to spill and holds the temporary files
+    """
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self.rows = 0
+        self._chunks = []
+        self._empty = None
+
+    def append(self, frame: pd.DataFrame) -> None:
+        if self._empty is None:
+            self._empty = frame.iloc[:0]
+        if len(frame) == 0:
+            # Empty chunks could change the dtypes of the concatenation, so only the first one is kept as template
+            return
+        self._chunks.append(frame)
+        self.rows += len(frame)
+        if self.budget.exceeded():
+            self._chunks = [self.budget.spill(chunk) if isinstance(chunk, pd.DataFrame) else chunk
+                            for chunk in self._chunks]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._empty.columns if self._empty is not None else pd.Index([])
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        """Yield the chunks; spilled chunks are read back one at a time."""
+        for chunk in self._chunks:
+            if isinstance(chunk, pd.DataFrame):
+                yield chunk
+            else:
+                # Parquet reads text columns back as the string dtype, so restore the dtypes of the chunks
+                yield self.budget.load(chunk).astype(self._empty.dtypes.to_dict())
+
+    def concat(self) -> pd.DataFrame:
+        """All chunks as one dataframe."""
+        frames = list(self)
+        if not frames:
+            return self._empty if self._empty is not None else pd.DataFrame()
+        return pd.concat(frames) if len(frames) > 1 else frames[0]
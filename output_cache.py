@@ -0,0 +1,229 @@
+"""
+Cache of generated HUP files, keyed by everything the file is made from.
+
+Users regenerate the same HUP when a file was misplaced or the session was
+reloaded. OutputCache keeps a copy of every generated file under a key that
+hashes the request:
+
+- the fingerprint of the uploaded KRO-aanzien and KRO-gebruik files;
+- the selected filter definitions in order, with their parameters (and the
+  content of the GeoJSON file of a polygon filter);
+- the content of the Excel template or of the previous HUP that is updated;
+- the export options (format, class A objects, objects without a name).
+
+A repeat request copies the stored file instead of running the filters and
+the export again. Files unused for MAX_AGE seconds are removed, and the least
+recently used files go once the cache exceeds MAX_BYTES.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from typing import List, Optional
+
+from data_management import FILTER_DEFINITIONS, get_executable_relative_path, resolve_data_path
+from template_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+# Part of every key; raise it when a change of the pipeline changes the generated files
+CACHE_VERSION = 1
+
+# Total size of the cached files before the least recently used ones are removed
+MAX_BYTES = 500 * 2 ** 20
+
+# Cached files that have not been used for this long are removed
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+def _definition(filter_key: str) -> dict:
+    """A filter definition with the content hash of the files it reads."""
+    definition = dict(FILTER_DEFINITIONS[filter_key])
+    filters = []
+    for item in definition["filters"]:
+        if item["type"] == "polygon":
+            item = dict(item, digest=file_digest(resolve_data_path(item["path"])))
+        filters.append(item)
+    definition["filters"] = filters
+    return definition
+
+
+def output_key(fingerprint: str, filter_keys: List[str], output_format: str, add_A: bool = False,
+               remove_no_name: bool = False, template_path: Optional[str] = None,
+               previous_hup_path: Optional[str] = None) -> str:
+    """
+    The cache key of a HUP request.
+
+    Args:
+        fingerprint: Fingerprint of the uploaded KRO files (mask_cache.content_fingerprint)
+        filter_keys: Keys of FILTER_DEFINITIONS in the order in which they are applied
+        output_format: Key of EXPORT_FORMATS
+        add_A: Whether class A objects are added
+        remove_no_name: Whether objects without a name are left out
+        template_path: Excel template the HUP is written into (xlsx only)
+        previous_hup_path: Previous HUP that is updated instead of filling the template (xlsx only)
+
+    Returns:
+        Hex digest identifying the generated file
+    """
+    if output_format != "xlsx":
+        template_path = previous_hup_path = None
+    elif previous_hup_path:
+        template_path = None
+    request = {
+        "version": CACHE_VERSION,
+        "data": fingerprint,
+        "filters": [[filter_key, _definition(filter_key)] for filter_key in filter_keys],
+        "format": output_format,
+        "add_A": bool(add_A),
+        "remove_no_name": bool(remove_no_name),
+        "template": file_digest(template_path) if template_path else None,
+        "previous_hup": file_digest(previous_hup_path) if previous_hup_path else None,
+    }
+    return hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class OutputCache:
+    """
+    Generated files stored by key in a directory, with age and size limits.
+
+    Args:
+        directory: Folder of the cached files (default: HUP/cache next to the executable, see
+            get_executable_relative_path)
+        max_bytes: Total size of the files before the least recently used ones are removed
+        max_age: Seconds after which an unused file is removed
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = MAX_BYTES, max_age: float = MAX_AGE):
+        self._directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = get_executable_relative_path("HUP", "cache")
+        os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """
+        Path of the cached file of a request, or None when there is none or it has expired.
+        """
+        path = self._path(key, extension)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                path = None
+            else:
+                os.utime(path)  # Mark as recently used
+        except OSError:
+            path = None
+        with self._lock:
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return path
+
+    def put(self, key: str, source_path: str, extension: str) -> Optional[str]:
+        """
+        Store a copy of a generated file under key and evict old files.
+
+        Args:
+            key: Key of the request (see output_key)
+            source_path: The generated file
+            extension: Extension of the format (EXPORT_FORMATS), e.g. '.csv.gz'
+
+        Returns:
+            Path of the cached copy, or None when it could not be written (the cache is then skipped)
+        """
+        try:
+            # Copy to a temporary name first so a concurrent request never reads a half-written file
+            path = self._path(key, extension)
+            temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("Could not cache %s: %s", source_path, e)
+            return None
+        self.evict()
+        return path
+
+    def copy_to(self, key: str, extension: str, output_path: str) -> bool:
+        """
+        Copy the cached file of a request to output_path.
+
+        Returns:
+            Whether a cached file was found and copied
+        """
+        path = self.get(key, extension)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, output_path)
+        except OSError as e:
+            logger.warning("Could not copy cached file %s: %s", path, e)
+            return False
+        return True
+
+    def evict(self) -> int:
+        """
+        Remove expired files, leftover partial writes and, above max_bytes, the least recently used files.
+
+        Returns:
+            Number of files removed
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        except OSError:
+            return 0
+        now = time.time()
+        files, removed = [], 0
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            expired = now - stat.st_mtime > (3600 if entry.name.endswith('.tmp') else self.max_age)
+            if expired:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+            elif not entry.name.endswith('.tmp'):
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                continue
+        return removed
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the cached files."""
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+        except OSError:
+            return 0
+
+
+# Process-wide cache shared by all sessions
+OUTPUT_CACHE = OutputCache()
@@ -0,0 +1,225 @@
+"""
+Chunk-parallel evaluation of filter definitions over several CPU cores.
+
+apply_filter_to_tree runs every definition on one core. apply_filters_parallel
+gives the tree the same HUP, but evaluates the definitions in a pool of
+worker processes:
+
+- the objects of the tree and KRO-gebruik are published once in shared memory
+  (see shared_dataset.py), so a worker only receives row numbers;
+- the objects are split into partitions of consecutive rows or of whole
+  municipalities (gemnaam); objects with the same bronsleutel always share a
+  partition, and each partition gets the gebruik rows of its objects, so
+  every filter sees the same rows per object as in the serial run;
+- every worker builds a KRO_Tree over its partition and returns per
+  definition the positions of the objects that pass;
+- the parent merges the positions per definition in ascending order, which
+  is the order of a serial run, and stores them in the HUP in the order of
+  the definitions.
+
+Definitions with a filter that depends on the whole dataset ("nearest") are
+still applied serially, in their place in the order.
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_management import FILTER_DEFINITIONS, add_definition_filters, apply_filter_to_tree
+from gebruik_aggregates import AGGREGATE_COLUMNS
+from shared_dataset import publish_kro, attach_kro
+
+logger = logging.getLogger(__name__)
+
+# Filter types decided per object, and thus per partition
+PARTITIONED_TYPES = ("sbi", "column", "functie", "radius", "polygon")
+
+# Ways to split the objects: consecutive rows, or whole municipalities
+PARTITION_MODES = ("rows", "gemnaam")
+
+OBJECT_KEY = 'bronsleutel'
+GEBRUIK_KEY = 'aanzien_id'
+
+# Dataset attached in a worker process, kept while the parent sends tasks on the same segment
+_attached = {}
+
+
+def partitionable(definition: dict) -> bool:
+    """Whether a filter definition gives the same objects when it is evaluated per partition."""
+    return all(item["type"] in PARTITIONED_TYPES for item in definition["filters"])
+
+
+def partition_objects(df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame, count: int,
+                      by: str = "rows") -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Split the objects into at most count partitions, each with the gebruik rows of its objects.
+
+    Args:
+        df_aanzien: KRO-aanzien objects
+        df_gebruik: KRO-gebruik rows
+        count: Number of partitions
+        by: "rows" for ranges of consecutive objects, "gemnaam" for whole municipalities, spread over the
+            partitions by number of objects
+
+    Returns:
+        Per non-empty partition the ascending positions of its objects and of its gebruik rows
+    """
+    if by not in PARTITION_MODES:
+        raise ValueError(f"Unknown partition mode {by}; choose one of {', '.join(PARTITION_MODES)}.")
+    rows = len(df_aanzien)
+    count = max(1, min(count, rows))
+    if by == "gemnaam":
+        groups, _ = pd.factorize(df_aanzien['gemnaam'], use_na_sentinel=False)
+        sizes = np.bincount(groups) if rows else np.zeros(0, dtype=np.int64)
+        # Largest municipality first, each into the partition with the fewest objects so far
+        loads = np.zeros(count, dtype=np.int64)
+        group_partition = np.zeros(len(sizes), dtype=np.int64)
+        for group in np.argsort(-sizes, kind='stable'):
+            group_partition[group] = np.argmin(loads)
+            loads[group_partition[group]] += sizes[group]
+        labels = group_partition[groups]
+    else:
+        labels = np.arange(rows, dtype=np.int64) * count // max(rows, 1)
+
+    # Every object goes to the partition of the first object with its key, so the gebruik rows of a key
+    # only have to be in one partition
+    key_codes, keys = pd.factorize(df_aanzien[OBJECT_KEY], use_na_sentinel=False)
+    _, first_rows = np.unique(key_codes, return_index=True)
+    key_partition = labels[first_rows]
+    labels = key_partition[key_codes]
+    gebruik_keys = pd.Index(keys).get_indexer(df_gebruik[GEBRUIK_KEY])
+    gebruik_labels = np.where(gebruik_keys >= 0, key_partition[np.maximum(gebruik_keys, 0)], -1)
+
+    partitions = []
+    for partition in range(count):
+        positions = np.flatnonzero(labels == partition)
+        if len(positions):
+            partitions.append((positions, np.flatnonzero(gebruik_labels == partition)))
+    return partitions
+
+
+def _evaluate_partition(dataset, positions: np.ndarray, gebruik_rows: np.ndarray,
+                        definitions: List[dict], backend: str) -> List[np.ndarray]:
+    """
+    Worker task: the positions in the full dataset of the objects of one partition that pass each definition.
+    """
+    from classes import KRO_Tree
+
+    if dataset.segment_name not in _attached:
+        for attached in _attached.values():
+            attached.close()
+        _attached.clear()
+        _attached[dataset.segment_name] = dataset
+    df_aanzien, df_gebruik = attach_kro(_attached[dataset.segment_name])
+    tree = KRO_Tree(df_aanzien.iloc[positions], df_gebruik.iloc[gebruik_rows], mask_cache=None,
+                    fingerprint=f"{dataset.segment_name}:{positions[0]}", backend=backend)
+    selected = []
+    for definition in definitions:
+        add_definition_filters(tree, definition)
+        tree.execute()
+        selected.append(positions[tree._current_positions()])
+        tree.reset()
+    return selected
+
+
+def evaluate_definitions(tree, definitions: List[dict], workers: int, by: str = "rows",
+                         partitions: Optional[int] = None, executor=None) -> List[np.ndarray]:
+    """
+    Evaluate filter definitions on the objects of a tree per partition in worker processes.
+
+    Args:
+        tree: KRO_Tree with the loaded data
+        definitions: Filter definitions (see FILTER_DEFINITIONS) that are partitionable
+        workers: Number of worker processes
+        by: Partition mode, see partition_objects
+        partitions: Number of partitions (default: workers)
+        executor: Process pool to use instead of starting one for this call
+
+    Returns:
+        Per definition the ascending positions in tree.original_data of the objects that pass it
+    """
+    aggregates = set(AGGREGATE_COLUMNS.values())
+    df_aanzien = tree.original_data[[column for column in tree.original_data.columns if column not in aggregates]]
+    parts = partition_objects(df_aanzien, tree.data_gebruik, partitions or workers, by)
+    if not parts:
+        return [np.zeros(0, dtype=np.int64) for _ in definitions]
+    backend = tree.backend.name if tree.backend.name in ("pandas", "numpy") else "pandas"
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(min(workers, len(parts)), mp_context=multiprocessing.get_context("spawn"))
+    try:
+        with tree.tracer.span("partities delen", rows_in=len(df_aanzien)) as span:
+            dataset = publish_kro(df_aanzien, tree.data_gebruik)
+            span.rows_out = len(parts)
+        with dataset:
+            with tree.tracer.span(f"filters ({len(parts)} partities)", rows_in=len(df_aanzien)):
+                futures = [executor.submit(_evaluate_partition, dataset, positions, gebruik_rows, definitions,
+                                           backend) for positions, gebruik_rows in parts]
+                results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    # Partitions of municipalities interleave, so the merged positions are sorted into the serial order
+    return [np.sort(np.concatenate([result[index] for result in results]))
+            for index in range(len(definitions))]
+
+
+def apply_filters_parallel(tree, filter_keys: List[str], workers: Optional[int] = None, by: str = "rows",
+                           partitions: Optional[int] = None, executor=None) -> int:
+    """
+    Apply filter definitions to a tree like apply_filter_to_tree does for each key in order, evaluating the
+    partitionable definitions in parallel.
+
+    The HUP of the tree is the same as after the serial run. The history gets one step per definition
+    evaluated in parallel instead of one per filter, because each partition may order the filters differently.
+
+    Args:
+        tree: KRO_Tree without a pending selection
+        filter_keys: Keys of the definitions, in the order in which they are stored in the HUP
+        workers: Number of worker processes (default: the number of CPU cores); 1 applies all serially
+        by: Partition mode, "rows" or "gemnaam"
+        partitions: Number of partitions (default: workers)
+        executor: Process pool to reuse across calls
+
+    Returns:
+        The number of definitions applied
+    """
+    workers = workers or os.cpu_count() or 1
+    definitions = FILTER_DEFINITIONS
+    known = []
+    for filter_key in filter_keys:
+        if filter_key in definitions:
+            known.append(filter_key)
+        else:
+            logger.warning("Unknown filter: %s", filter_key)
+    parallel = [key for key in known if partitionable(definitions[key])]
+    if workers < 2 or not parallel or tree._plan or tree._positions is not None:
+        for filter_key in known:
+            apply_filter_to_tree(tree, filter_key)
+        return len(known)
+
+    selections = dict(zip(parallel, evaluate_definitions(tree, [definitions[key] for key in parallel], workers,
+                                                         by, partitions, executor)))
+    for filter_key in known:
+        if filter_key not in selections:
+            apply_filter_to_tree(tree, filter_key)
+            continue
+        definition = definitions[filter_key]
+        logger.info("Applying filter: %s (%s)", definition['name'], definition['description'])
+        with tree.tracer.span(f"definitie {filter_key}", rows_in=tree.count(), definition=filter_key) as span:
+            rows_before = tree.count()
+            tree._positions = selections[filter_key]
+            tree._frame = None
+            tree._log_step(f"filter {filter_key} in parallel", None, rows_before)
+            span.rows_out = tree.count()
+            tree.set_risk(definition["risk"])
+            tree.store_results()
+            tree.reset()
+    return len(known)
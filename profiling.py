@@ -0,0 +1,222 @@
+"""
+On-demand deep profiling of a HUP run.
+
+ProfileSession captures a CPU profile (cProfile) of the current thread and
+allocation tracking (tracemalloc) for the duration of a with-block, then
+writes an HTML report with the hottest functions, the largest allocation sites
+and the time spent in the main pipeline stages, plus the raw .prof file for
+tools like snakeviz.
+
+cProfile and tracemalloc are process-wide, so only one session runs at a time
+per process; entering a second one raises ProfileBusy.
+"""
+
+import os
+import io
+import html
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from data_management import get_executable_relative_path
+
+# Pipeline functions that get their own line in the report, as label: (module file, function name). The filter
+# methods only add predicates to the plan; the filtering itself is done when the plan is executed.
+FOCUS_FUNCTIONS = {
+    "apply_filter_to_tree": ("data_management.py", "apply_filter_to_tree"),
+    "KRO_Tree.execute": ("classes.py", "execute"),
+    "KRO_Tree.evaluate": ("classes.py", "evaluate"),
+    "backend.execute": ("query_backend.py", "execute"),
+    "prepare_dataframe": ("classes.py", "prepare_dataframe"),
+    "insert_dataframe_into_excel": ("classes.py", "insert_dataframe_into_excel"),
+    "update_excel": ("classes.py", "update_excel"),
+}
+
+# Packages whose total time is reported separately
+FOCUS_PACKAGES = ["openpyxl", "pandas", "numpy"]
+
+# Held by the running session
+_PROFILE_LOCK = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Another profile is already running in this process."""
+
+
+class ProfileSession:
+    """
+    Context manager that profiles one run and builds a report afterwards.
+
+    Args:
+        top: Number of functions and allocation sites listed in the report
+        frames: Number of stack frames stored per allocation
+
+    Raises:
+        ProfileBusy: On entering while another session or profiler is active in the process
+    """
+
+    def __init__(self, top: int = 30, frames: int = 10):
+        self.top = top
+        self.frames = frames
+        self.profiler = cProfile.Profile()
+        self.stats: Optional[pstats.Stats] = None
+        self.snapshot = None
+        self.peak_memory = None
+        self.seconds = None
+        self.shared_tracing = False
+        self._start = None
+
+    def __enter__(self):
+        if not _PROFILE_LOCK.acquire(blocking=False):
+            raise ProfileBusy("Er loopt al een profielmeting in dit proces.")
+        # tracemalloc may also have been started outside the HUP Generator; leave it running then
+        self.shared_tracing = tracemalloc.is_tracing()
+        if not self.shared_tracing:
+            tracemalloc.start(self.frames)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except ValueError as e:
+            # Python 3.12+ allows one profiler per process, e.g. a debugger or coverage may hold it
+            self._release()
+            raise ProfileBusy(f"Er is al een andere profiler actief: {e}") from e
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        try:
+            self.seconds = time.perf_counter() - self._start
+            self.snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ])
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            self.stats = pstats.Stats(self.profiler)
+        finally:
+            self._release()
+        return False
+
+    def _release(self):
+        if not self.shared_tracing:
+            tracemalloc.stop()
+        _PROFILE_LOCK.release()
+
+    def hot_functions(self, sort_key: str = 'cumulative') -> List[Dict]:
+        """Return the top functions sorted by 'cumulative' or 'tottime'."""
+        rows = []
+        for (filename, line, name), (cc, ncalls, tottime, cumtime, _) in self.stats.stats.items():
+            rows.append({"function": name, "location": f"{filename}:{line}", "calls": ncalls,
+                         "tottime": tottime, "cumtime": cumtime})
+        rows.sort(key=lambda row: row[sort_key if sort_key == 'tottime' else 'cumtime'], reverse=True)
+        return rows[:self.top]
+
+    def focus_functions(self) -> List[Dict]:
+        """Return the cumulative time of the main pipeline functions and packages."""
+        rows = []
+        for label, (module, function) in FOCUS_FUNCTIONS.items():
+            cumtime = 0.0
+            calls = 0
+            for (filename, line, name), (cc, ncalls, tottime, ct, _) in self.stats.stats.items():
+                if name == function and os.path.basename(filename) == module:
+                    cumtime = max(cumtime, ct)
+                    calls += ncalls
+            if calls:
+                rows.append({"name": label, "calls": calls, "seconds": cumtime})
+        for package in FOCUS_PACKAGES:
+            marker = f"{os.sep}{package}{os.sep}"
+            seconds = sum(tottime for (filename, _, _), (_, _, tottime, _, _) in self.stats.stats.items()
+                          if marker in filename)
+            rows.append({"name": f"{package} (eigen tijd)", "calls": None, "seconds": seconds})
+        return rows
+
+    def allocation_sites(self) -> List[Dict]:
+        """Return the code locations with the most memory still allocated at the end of the run."""
+        rows = []
+        for stat in self.snapshot.statistics('traceback')[:self.top]:
+            frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+            rows.append({"size": stat.size, "count": stat.count, "location": frames[-1] if frames else "",
+                         "traceback": frames})
+        return rows
+
+    def text_report(self) -> str:
+        """Return the plain pstats output, sorted by cumulative time."""
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(self.top)
+        return output.getvalue()
+
+    def html_report(self, title: str = "HUP Generator profiel") -> str:
+        """Build a self-contained HTML report."""
+        def table(headers, rows):
+            head = "".join(f"<th>{html.escape(h)}</th>" for h in headers)
+            body = "".join("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>"
+                           for row in rows)
+            return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+        def fmt_seconds(value):
+            return f"{value:.3f}"
+
+        def fmt_bytes(value):
+            return f"{value / (1024 * 1024):.2f} MB"
+
+        sections = [
+            f"<h1>{html.escape(title)}</h1>",
+            f"<p>Gemaakt op {datetime.now().strftime('%d-%m-%Y %H:%M')}. "
+            f"Totale duur: {self.seconds:.2f} s. Piekgeheugen (Python): {fmt_bytes(self.peak_memory)}.</p>",
+        ]
+        if self.shared_tracing:
+            sections.append("<p><i>Geheugenregistratie was al actief; allocaties van andere sessies kunnen meetellen.</i></p>")
+
+        sections.append("<h2>Onderdelen van de pipeline</h2>")
+        sections.append(table(["Onderdeel", "Aanroepen", "Duur (s)"],
+                              [[row["name"], row["calls"] if row["calls"] is not None else "",
+                                fmt_seconds(row["seconds"])] for row in self.focus_functions()]))
+
+        sections.append("<h2>Functies met de meeste totale tijd (cumulatief)</h2>")
+        sections.append(table(["Functie", "Locatie", "Aanroepen", "Eigen tijd (s)", "Cumulatief (s)"],
+                              [[row["function"], row["location"], row["calls"], fmt_seconds(row["tottime"]),
+                                fmt_seconds(row["cumtime"])] for row in self.hot_functions('cumulative')]))
+
+        sections.append("<h2>Functies met de meeste eigen tijd</h2>")
+        sections.append(table(["Functie", "Locatie", "Aanroepen", "Eigen tijd (s)", "Cumulatief (s)"],
+                              [[row["function"], row["location"], row["calls"], fmt_seconds(row["tottime"]),
+                                fmt_seconds(row["cumtime"])] for row in self.hot_functions('tottime')]))
+
+        sections.append("<h2>Grootste allocaties (nog in gebruik aan het eind)</h2>")
+        sections.append(table(["Grootte", "Aantal blokken", "Locatie", "Aanroepketen"],
+                              [[fmt_bytes(row["size"]), row["count"], row["location"],
+                                " ← ".join(reversed(row["traceback"]))] for row in self.allocation_sites()]))
+
+        style = ("<style>body{font-family:sans-serif;margin:20px;}table{border-collapse:collapse;margin-bottom:20px;}"
+                 "td,th{border:1px solid #ccc;padding:4px 8px;font-size:0.85rem;text-align:left;}"
+                 "th{background:#f0f0f0;}</style>")
+        return f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>{style}</head>" \
+               f"<body>{''.join(sections)}</body></html>"
+
+    def save(self, base_path: Optional[str] = None) -> Dict[str, str]:
+        """
+        Write the HTML report and the raw profile to disk.
+
+        Args:
+            base_path: Path without extension; defaults to HUP/profiel-<datetime> in the output directory
+
+        Returns:
+            Dictionary with the paths of the 'html' and 'prof' files
+        """
+        if base_path is None:
+            datetime_string = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
+            base_path = get_executable_relative_path("HUP", f"profiel-{datetime_string}")
+        os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+
+        html_path = base_path + ".html"
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(self.html_report())
+
+        prof_path = base_path + ".prof"
+        self.stats.dump_stats(prof_path)
+        return {"html": html_path, "prof": prof_path}
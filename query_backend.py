@@ -0,0 +1,350 @@
+"""
+Execution backends for the filter plan of KRO_Tree.
+
+KRO_Tree collects filter steps as predicates and hands the pending plan to
+its backend when the selection is needed:
+
+- PandasBackend (default) reorders the steps by selectivity and evaluates
+  them as cached boolean masks over the loaded frames;
+- DuckDBBackend translates the column, personen and SBI steps into one SQL
+  query that the embedded DuckDB engine runs with multithreaded scans and
+  semi-joins on KRO-gebruik, and only returns the positions of the objects
+  that are left. It reads the loaded frames in place, or the KRO CSV/Parquet
+  files directly. Spatial steps are applied as masks afterwards;
+- NumpyBackend evaluates the column, personen and SBI steps on the compact
+  structured-array model of kro_core.ObjectStore instead of the dataframes.
+
+All backends produce the same selection, so the HUP is identical. DuckDB is
+optional (pip install duckdb); without it only the pandas backend is
+available.
+"""
+
+import os
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from filter_plan import Predicate, order_predicates, SPATIAL_KINDS
+from schema_scanner import read_header
+from kro_core import ObjectStore
+
+logger = logging.getLogger(__name__)
+
+# Object key in KRO-aanzien and the matching column in KRO-gebruik
+OBJECT_KEY = "bronsleutel"
+GEBRUIK_KEY = "aanzien_id"
+
+
+def duckdb_available() -> bool:
+    try:
+        import duckdb  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class PandasBackend:
+    """Evaluates the plan step by step with cached pandas/numpy masks."""
+
+    name = "pandas"
+
+    def execute(self, tree, plan: List[Predicate]) -> None:
+        """
+        Runs the plan on the current selection of the tree.
+
+        The steps are conjunctive, so they are reordered: column masks before the gebruik predicates
+        and the most selective predicate first. Column masks and predicates on the full dataset are
+        computed over all objects and cached; gebruik predicates on a selection are only evaluated
+        for the objects that are left.
+        """
+        for predicate in order_predicates(tree, plan, tree._positions):
+            rows_before = len(tree.original_data) if tree._positions is None else len(tree._positions)
+            with tree.tracer.span(predicate.span_name, rows_in=rows_before) as span:
+                mask = tree.cached_mask(predicate)
+                if mask is None and (tree._positions is None or not predicate.expensive):
+                    mask = tree.predicate_mask(predicate)
+                if mask is None:
+                    keep = tree.evaluate(predicate, tree._positions)
+                else:
+                    keep = mask if tree._positions is None else mask[tree._positions]
+                tree._positions = np.flatnonzero(keep) if tree._positions is None else tree._positions[keep]
+                tree._frame = None
+                tree._log_step(predicate.action, span, rows_before)
+
+
+class NumpyBackend:
+    """
+    Evaluates the plan in order on a kro_core.ObjectStore, built from the loaded frames on first use.
+
+    Args:
+        store: ObjectStore to use instead of building one, e.g. shared by several trees over the same data
+    """
+
+    name = "numpy"
+
+    def __init__(self, store=None):
+        self.store = store
+        self._tree = None
+
+    def bind(self, tree) -> None:
+        if self._tree is tree and self.store is not None:
+            return
+        if self.store is None or len(self.store) != len(tree.original_data):
+            with tree.tracer.span("kernmodel opbouwen", rows_in=len(tree.original_data)) as span:
+                self.store = ObjectStore.from_frames(tree.original_data, tree.data_gebruik)
+                span.rows_out = len(self.store)
+            logger.info("Core model: %.1f MB for %s objects.", self.store.nbytes / 2 ** 20, len(self.store))
+        self._tree = tree
+
+    def mask(self, tree, predicate: Predicate, positions: Optional[np.ndarray]) -> np.ndarray:
+        """Mask of a predicate for the objects at positions; steps the core model cannot answer go to the tree."""
+        store = self.store
+        if predicate.kind == "column" and predicate.args[0] in store:
+            return store.column_mask(*predicate.args, positions=positions)
+        if predicate.kind == "personen":
+            return store.personen_mask(*predicate.args, positions=positions)
+        if predicate.kind == "sbi":
+            if positions is None:
+                for start_num in predicate.args[0]:
+                    if not store.gebruik.matching_codes([start_num]).any():
+                        logger.info("No act1code starting with %s was found in the data_gebruik dataframe.",
+                                    start_num)
+            return store.sbi_mask(predicate.args[0], positions=positions)
+        return tree.evaluate(predicate, positions)
+
+    def execute(self, tree, plan: List[Predicate]) -> None:
+        """Runs the steps in the order of the plan, each only for the objects that are left."""
+        self.bind(tree)
+        for predicate in plan:
+            rows_before = len(tree.original_data) if tree._positions is None else len(tree._positions)
+            with tree.tracer.span(predicate.span_name, rows_in=rows_before) as span:
+                keep = self.mask(tree, predicate, tree._positions)
+                tree._positions = np.flatnonzero(keep) if tree._positions is None else tree._positions[keep]
+                tree._frame = None
+                tree._log_step(predicate.action, span, rows_before)
+
+
+# SQL for the comparison operators of classes.MASK_FUNCTIONS
+SQL_OPERATORS = {">": ">", "<": "<", ">=": ">=", "<=": "<=", "==": "="}
+
+
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE"
+    return "VARCHAR"
+
+
+def _quote(column: str) -> str:
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def _comparison(expression: str, operator: str, value) -> Tuple[str, list]:
+    """
+    SQL condition and parameters for 'expression operator value' with pandas semantics.
+
+    A NULL result counts as false (see DuckDBBackend.execute); '!=' is true for missing values.
+    """
+    if operator == "in":
+        values = list(value)
+        if not values:
+            return "FALSE", []
+        return f"{expression} IN ({', '.join('?' * len(values))})", values
+    if operator == "!=":
+        return f"({expression} IS NULL OR {expression} <> ?)", [value]
+    return f"{expression} {SQL_OPERATORS[operator]} ?", [value]
+
+
+class DuckDBBackend:
+    """
+    Runs the filter plan as SQL in an embedded DuckDB database.
+
+    Args:
+        aanzien_path: KRO-aanzien CSV or Parquet file to query directly; the loaded frame is used if None
+        gebruik_path: KRO-gebruik CSV or Parquet file to query directly; the loaded frame is used if None
+        threads: Number of DuckDB threads (default: all cores)
+        delimiter: Delimiter of the CSV files
+    """
+
+    name = "duckdb"
+
+    def __init__(self, aanzien_path: Optional[str] = None, gebruik_path: Optional[str] = None,
+                 threads: Optional[int] = None, delimiter: str = ';'):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("The duckdb backend requires duckdb (pip install duckdb).")
+        self.aanzien_path = aanzien_path
+        self.gebruik_path = gebruik_path
+        self.delimiter = delimiter
+        self.connection = duckdb.connect()
+        if threads:
+            self.connection.execute(f"SET threads TO {int(threads)}")
+        self._tree = None
+
+    def _source(self, path: str, frame: pd.DataFrame) -> str:
+        """SQL table function reading a file with the column types of the loaded frame."""
+        if os.path.splitext(path)[1].lower() == ".parquet":
+            return "read_parquet(?)"
+        # Parse every column the way pandas did, so comparisons and the SBI code strings are the same
+        columns = read_header(path).columns
+        types = ", ".join(f"'{column}': '{_sql_type(frame[column].dtype)}'" for column in columns if column in frame)
+        return f"read_csv(?, delim='{self.delimiter}', header=true, types={{{types}}})"
+
+    def bind(self, tree) -> None:
+        """
+        Load the tables 'aanzien' (with row position _pos) and 'gebruik' for a tree.
+
+        Files are read straight into DuckDB tables. Loaded frames are copied into DuckDB tables, because
+        its own columnar tables scan many times faster than a registered pandas frame; only the columns
+        that the filters use are copied (see _load_columns).
+        """
+        if self._tree is tree:
+            return
+        connection = self.connection
+        self._columns = None
+        data = tree.original_data
+        if self.aanzien_path:
+            source = self._source(self.aanzien_path, data)
+            # Tables keep the file order, so rowid is the position of the object in the loaded frame
+            connection.execute(f"CREATE OR REPLACE TABLE aanzien_file AS SELECT * FROM {source}", [self.aanzien_path])
+            connection.execute("CREATE OR REPLACE VIEW aanzien AS SELECT *, rowid AS _pos FROM aanzien_file")
+            keys = connection.execute(f"SELECT {_quote(OBJECT_KEY)} FROM aanzien ORDER BY _pos").fetchnumpy()
+            if not np.array_equal(np.asarray(keys[OBJECT_KEY], dtype=float),
+                                  data[OBJECT_KEY].to_numpy(dtype=float), equal_nan=True):
+                raise ValueError(f"{os.path.basename(self.aanzien_path)} does not match the loaded KRO-aanzien data.")
+        else:
+            self._columns = set()
+            self._load_columns(data, [OBJECT_KEY])
+
+        # The SBI filter matches on the code as text (as act1code.astype(str) does), so convert it once
+        if self.gebruik_path:
+            source = self._source(self.gebruik_path, tree.data_gebruik)
+            parameters = [self.gebruik_path]
+        else:
+            # Registering analyzes every column of a frame, so only the needed columns are registered
+            connection.register("gebruik_frame", tree.data_gebruik[[GEBRUIK_KEY, 'personen', 'act1code']])
+            source, parameters = "gebruik_frame", []
+        connection.execute(f"CREATE OR REPLACE TABLE gebruik AS SELECT {_quote(GEBRUIK_KEY)}, personen, "
+                           f"CAST(act1code AS VARCHAR) AS act1code_text FROM {source}", parameters)
+        if not self.gebruik_path:
+            connection.unregister("gebruik_frame")
+        self._tree = tree
+
+    def _load_columns(self, data: pd.DataFrame, columns) -> None:
+        """Copy columns of the registered KRO-aanzien frame into the 'aanzien' table if not there yet."""
+        if self._columns is None or set(columns) <= self._columns:
+            return
+        self._columns |= set(columns)
+        frame = data[sorted(self._columns)].assign(_pos=np.arange(len(data), dtype=np.int64))
+        self.connection.register("aanzien_frame", frame)
+        self.connection.execute("CREATE OR REPLACE TABLE aanzien AS SELECT * FROM aanzien_frame")
+        self.connection.unregister("aanzien_frame")
+
+    def condition(self, predicate: Predicate) -> Tuple[str, list]:
+        """SQL condition on the objects 'a' for a column, personen, SBI or functie predicate."""
+        key = f"a.{_quote(OBJECT_KEY)}"
+        gebruik_keys = f"SELECT {_quote(GEBRUIK_KEY)} FROM gebruik"
+        if predicate.kind == "column":
+            column, operator, value = predicate.args
+            return _comparison(f"a.{_quote(column)}", operator, value)
+        if predicate.kind == "personen":
+            # Objects without gebruik rows pass, like in KRO_Tree.evaluate
+            operator, value = predicate.args
+            values = [float(item) for item in value] if operator == "in" else float(value)
+            condition, parameters = _comparison("personen", operator, values)
+            # NOT EXISTS rather than NOT IN: a single NULL aanzien_id would make NOT IN false for every object
+            return (f"(NOT EXISTS (SELECT 1 FROM gebruik g WHERE g.{_quote(GEBRUIK_KEY)} = {key}) "
+                    f"OR {key} IN ({gebruik_keys} WHERE {condition}))", parameters)
+        if predicate.kind == "sbi":
+            start_nums = [str(start_num) for start_num in predicate.args[0]]
+            if not start_nums:
+                return "FALSE", []
+            prefixes = " OR ".join("starts_with(act1code_text, ?)" for _ in start_nums)
+            return f"{key} IN ({gebruik_keys} WHERE {prefixes})", start_nums
+        if predicate.kind == "functie":
+            # A function counts when its flag column equals 1, as in KRO_Tree.evaluate
+            all_of, none_of, any_of = predicate.args
+            is_set = lambda column: f"COALESCE(a.{_quote(column)} = 1, FALSE)"
+            terms = [is_set(column) for column in all_of] + [f"NOT {is_set(column)}" for column in none_of]
+            if any_of:
+                terms.append("(" + " OR ".join(is_set(column) for column in any_of) + ")")
+            return "(" + (" AND ".join(terms) or "TRUE") + ")", []
+        raise ValueError(f"Predicate kind {predicate.kind} cannot be translated to SQL")
+
+    def execute(self, tree, plan: List[Predicate]) -> None:
+        """Runs the SQL steps of the plan in one query, then the spatial steps as masks."""
+        self.bind(tree)
+        sql_steps = [predicate for predicate in plan if predicate.kind not in SPATIAL_KINDS]
+        mask_steps = [predicate for predicate in plan if predicate.kind in SPATIAL_KINDS]
+
+        if sql_steps:
+            columns = [predicate.args[0] for predicate in sql_steps if predicate.kind == "column"]
+            columns += [column for predicate in sql_steps if predicate.kind == "functie"
+                        for column in sum(predicate.args, ())]
+            self._load_columns(tree.original_data, columns)
+            connection = self.connection
+            rows_before = len(tree.original_data) if tree._positions is None else len(tree._positions)
+            selection = "TRUE"
+            if tree._positions is not None:
+                connection.register("selectie", pd.DataFrame({"pos": tree._positions}))
+                selection = "a._pos IN (SELECT pos FROM selectie)"
+            conditions = [self.condition(predicate) for predicate in sql_steps]
+            parameters = [parameter for _, step_parameters in conditions for parameter in step_parameters]
+            steps = ", ".join(f"COALESCE({condition}, FALSE) AS s{i}" for i, (condition, _) in enumerate(conditions))
+
+            with tree.tracer.span("filters (duckdb)", rows_in=rows_before) as span:
+                # Every step is evaluated once per object; the rows left after each step are counted for
+                # the history and only the positions left after all steps are returned
+                connection.execute(f"CREATE OR REPLACE TEMP TABLE stappen AS SELECT a._pos, {steps} "
+                                   f"FROM aanzien a WHERE {selection}", parameters)
+                all_steps = " AND ".join(f"s{i}" for i in range(len(conditions)))
+                counts = ", ".join(f"count(*) FILTER (WHERE {' AND '.join(f's{j}' for j in range(i + 1))})"
+                                   for i in range(len(conditions)))
+                remaining = connection.execute(f"SELECT {counts} FROM stappen").fetchone()
+                positions = connection.execute(f"SELECT _pos FROM stappen WHERE {all_steps} ORDER BY _pos"
+                                               ).fetchnumpy()["_pos"]
+                connection.execute("DROP TABLE stappen")
+                if tree._positions is not None:
+                    connection.unregister("selectie")
+                tree._positions = np.asarray(positions, dtype=np.int64)
+                tree._frame = None
+                span.rows_out = len(tree._positions)
+
+            for predicate, rows_remaining in zip(sql_steps, remaining):
+                tree._log_step(predicate.action, None, rows_before, rows_remaining)
+                rows_before = rows_remaining
+
+        for predicate in mask_steps:
+            rows_before = len(tree.original_data) if tree._positions is None else len(tree._positions)
+            with tree.tracer.span(predicate.span_name, rows_in=rows_before) as span:
+                mask = tree.predicate_mask(predicate)
+                keep = mask if tree._positions is None else mask[tree._positions]
+                tree._positions = np.flatnonzero(keep) if tree._positions is None else tree._positions[keep]
+                tree._frame = None
+                tree._log_step(predicate.action, span, rows_before)
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "duckdb": DuckDBBackend,
+    "numpy": NumpyBackend,
+}
+
+
+def create_backend(backend=None, **options):
+    """
+    Returns a backend instance from a name in BACKENDS, an instance, or None for the default (pandas).
+    """
+    if backend is None:
+        return PandasBackend()
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}. Available backends are: {list(BACKENDS)}")
+        return BACKENDS[backend](**options)
+    return backend
@@ -0,0 +1,152 @@
+"""
+Header-only schema checks for KRO CSV files.
+
+Only the first line of a file is read, so checking the columns of an upload or
+of a folder full of KRO releases takes milliseconds instead of a full CSV
+parse. Headers of files on disk are read concurrently and cached by path,
+modification time and size. The columns are compared with the schema
+registered for the release (KRO_SCHEMAS), falling back to the default schema.
+"""
+
+import os
+import re
+import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Delimiters recognized in a header line, in order of preference on a tie
+DELIMITERS = [';', ',', '\t', '|']
+
+# Bytes read from the start of a file to find the end of the header line
+HEADER_BLOCK = 64 * 1024
+
+DEFAULT_RELEASE = "standaard"
+
+# Columns the HUP pipeline needs, per KRO release. Extra columns are allowed.
+KRO_SCHEMAS = {
+    DEFAULT_RELEASE: {
+        "aanzien": ["id", "bronsleutel", "gemnaam", "pc6", "straatnaam", "huisnr", "huisletter", "huistoevg",
+                    "celfunctie", "industriefunctie", "kantoorfunctie", "onderwijsfunctie", "sportfunctie",
+                    "winkelfunctie", "bag_oppvlk", "woz_opp_nietwoon", "bouwlagen", "pandhoogte", "bouwjaar",
+                    "x", "y"],
+        "gebruik": ["aanzien_id", "naam_vol", "personen", "act1code", "act1omschr"],
+    }
+}
+
+# Release name in file names like KRO-aanzien-2024Q3.csv
+RELEASE_PATTERN = re.compile(r"(aanzien|gebruik)[-_ ](.+?)\.csv$", re.IGNORECASE)
+
+
+class Header(NamedTuple):
+    path: str
+    delimiter: str
+    columns: List[str]
+
+
+class SchemaReport(NamedTuple):
+    kind: str
+    release: str
+    missing: List[str]
+    extra: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing
+
+
+def register_schema(release: str, aanzien: Iterable[str], gebruik: Iterable[str]) -> None:
+    """Register the required columns of a KRO release."""
+    KRO_SCHEMAS[release] = {"aanzien": list(aanzien), "gebruik": list(gebruik)}
+
+
+def parse_header_line(line: str) -> Header:
+    """Split a header line on the delimiter that occurs most often in it."""
+    line = line.lstrip('\ufeff').rstrip('\r\n')
+    counts = {delimiter: line.count(delimiter) for delimiter in DELIMITERS}
+    delimiter = max(DELIMITERS, key=lambda d: counts[d])
+    if counts[delimiter] == 0:
+        delimiter = ','
+    columns = next(csv.reader([line], delimiter=delimiter), [])
+    return Header(None, delimiter, [column.strip() for column in columns])
+
+
+def header_from_content(content: bytes) -> Header:
+    """Read the header of an uploaded file from its first line only."""
+    end = content.find(b'\n', 0, HEADER_BLOCK)
+    first_line = content[:end if end >= 0 else HEADER_BLOCK]
+    return parse_header_line(first_line.decode('utf-8', errors='ignore'))
+
+
+_cache: Dict[tuple, Header] = {}
+_cache_lock = threading.Lock()
+
+
+def read_header(path: str) -> Header:
+    """Read the header of a file on disk, cached by path, modification time and size."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        header = _cache.get(key)
+    if header is None:
+        with open(path, 'rb') as f:
+            header = header_from_content(f.read(HEADER_BLOCK))._replace(path=path)
+        with _cache_lock:
+            _cache[key] = header
+    return header
+
+
+def scan_headers(paths: Iterable[str], max_workers: int = 8) -> Dict[str, Header]:
+    """
+    Read the headers of many files concurrently.
+
+    Returns:
+        Dictionary from path to Header; files that cannot be read are left out
+    """
+    paths = list(paths)
+
+    def read(path):
+        try:
+            return read_header(path)
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        headers = pool.map(read, paths)
+    return {path: header for path, header in zip(paths, headers) if header is not None}
+
+
+def release_from_filename(filename: str) -> Optional[str]:
+    match = RELEASE_PATTERN.search(os.path.basename(filename or ""))
+    return match.group(2) if match else None
+
+
+def guess_kind(columns: Iterable[str]) -> Optional[str]:
+    """Tell from the columns whether a file is KRO-aanzien or KRO-gebruik."""
+    columns = set(columns)
+    scores = {kind: len(columns & set(schema)) for kind, schema in KRO_SCHEMAS[DEFAULT_RELEASE].items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] else None
+
+
+def check_columns(columns: Iterable[str], kind: str, release: Optional[str] = None) -> SchemaReport:
+    """
+    Compare columns with the registered schema of a release.
+
+    Args:
+        columns: Column names from the header
+        kind: 'aanzien' or 'gebruik'
+        release: Release name; the default schema is used if it is not registered
+    """
+    release = release if release in KRO_SCHEMAS else DEFAULT_RELEASE
+    required = KRO_SCHEMAS[release][kind]
+    columns = list(columns)
+    present, known = set(columns), set(required)
+    return SchemaReport(kind, release,
+                        missing=[column for column in required if column not in present],
+                        extra=[column for column in columns if column not in known])
+
+
+def check_upload(content: bytes, filename: str, kind: str) -> SchemaReport:
+    """Check the header of an uploaded KRO file against the schema of its release."""
+    return check_columns(header_from_content(content).columns, kind, release_from_filename(filename))
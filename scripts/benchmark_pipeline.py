@@ -0,0 +1,187 @@
+"""
+Benchmark the HUP pipeline stage by stage.
+
+Times loading, every FILTER_DEFINITIONS entry, prepare_dataframe and the Excel
+export, records the peak memory of the process and writes the results as JSON
+so runs can be compared across versions.
+
+Usage:
+    python scripts/generate_synthetic_kro.py --objects 100000
+    python scripts/benchmark_pipeline.py --aanzien data/synthetic/KRO-aanzien-SYN.csv \\
+        --gebruik data/synthetic/KRO-gebruik-SYN.csv
+    python scripts/benchmark_pipeline.py ... --compare benchmarks/benchmark-<vorige>.json
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import platform
+import logging
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+
+from data_management import load_data_from_file, get_resource_path, FILTER_DEFINITIONS, apply_filter_to_tree
+from parallel_filters import apply_filters_parallel
+from classes import KRO_Tree
+from instrumentation import Tracer
+from query_backend import BACKENDS
+from memory_budget import MemoryBudget, peak_memory_mb
+
+
+def git_revision():
+    """Return the current git commit of the repository, if available."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+class StageTimer:
+    """Collects the duration, row count and peak memory of each benchmark stage."""
+
+    def __init__(self, quiet=True):
+        self.stages = []
+        self.quiet = quiet
+
+    @contextlib.contextmanager
+    def stage(self, name, **extra):
+        record = {"stage": name, **extra}
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output) if self.quiet else contextlib.nullcontext():
+            yield record
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        record["peak_memory_mb"] = peak_memory_mb()
+        self.stages.append(record)
+        print(f"{name:<40} {record['seconds']:>10.3f} s   rows: {record.get('rows', '')}")
+
+
+def run_benchmark(aanzien_path, gebruik_path, filter_keys, template_path, add_A=False, skip_export=False,
+                  quiet=True, backend="pandas", memory_budget_mb=None, processes=1, partition="rows"):
+    """Run the pipeline once and return the benchmark result dictionary."""
+    timer = StageTimer(quiet)
+    tracer = Tracer()
+
+    with timer.stage("load") as record:
+        df_aanzien = load_data_from_file(aanzien_path)
+        df_gebruik = load_data_from_file(gebruik_path)
+        record["rows"] = len(df_aanzien)
+        record["rows_gebruik"] = len(df_gebruik)
+
+    with timer.stage("init KRO_Tree") as record:
+        budget = MemoryBudget(memory_budget_mb) if memory_budget_mb else None
+        tree = KRO_Tree(df_aanzien, df_gebruik, tracer=tracer, backend=backend, memory_budget=budget)
+        record["rows"] = tree.count()
+
+    if processes > 1:
+        with timer.stage(f"filters ({processes} processen, {partition})", processes=processes) as record:
+            apply_filters_parallel(tree, filter_keys, workers=processes, by=partition)
+            record["rows"] = tree.hup_rows
+    else:
+        for filter_key in filter_keys:
+            with timer.stage(f"filter {filter_key}", filter=filter_key) as record:
+                rows_before = tree.hup_rows
+                apply_filter_to_tree(tree, filter_key)
+                record["rows"] = tree.hup_rows - rows_before
+
+    with timer.stage("prepare_dataframe", add_A=add_A) as record:
+        record["rows"] = len(tree.prepare_dataframe(add_A))
+
+    if not skip_export:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with timer.stage("excel export", add_A=add_A) as record:
+                output_path = tree.insert_dataframe_into_excel(template_path, "Online Checklist Bedrijven", 2,
+                                                               output_path=os.path.join(temp_dir, "HUP.xlsx"),
+                                                               add_A=add_A)
+                record["bytes"] = os.path.getsize(output_path)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "inputs": {"aanzien": os.path.abspath(aanzien_path), "gebruik": os.path.abspath(gebruik_path),
+                   "objects": len(df_aanzien), "gebruik_rows": len(df_gebruik)},
+        "filters": list(filter_keys),
+        "backend": backend,
+        "memory_budget_mb": memory_budget_mb,
+        "processes": processes,
+        "spilled_files": budget.spilled_files if budget else 0,
+        "total_seconds": round(sum(stage["seconds"] for stage in timer.stages), 4),
+        "peak_memory_mb": peak_memory_mb(),
+        "stages": timer.stages,
+        "spans": tracer.to_dict()["spans"]
+    }
+
+
+def compare(result, previous):
+    """Print the stage durations of two benchmark results side by side."""
+    previous_stages = {stage["stage"]: stage for stage in previous["stages"]}
+    print("")
+    print(f"{'stage':<40} {'vorige':>10} {'huidige':>10} {'factor':>8}")
+    for stage in result["stages"] + [{"stage": "total", "seconds": result["total_seconds"]}]:
+        old = previous_stages.get(stage["stage"], {"seconds": previous["total_seconds"]}
+                                  if stage["stage"] == "total" else None)
+        if old is None:
+            continue
+        factor = old["seconds"] / stage["seconds"] if stage["seconds"] else float('inf')
+        print(f"{stage['stage']:<40} {old['seconds']:>10.3f} {stage['seconds']:>10.3f} {factor:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark van de HUP-pipeline")
+    parser.add_argument("--aanzien", required=True, help="KRO-aanzien CSV")
+    parser.add_argument("--gebruik", required=True, help="KRO-gebruik CSV")
+    parser.add_argument("--filters", help="Komma-gescheiden filtersleutels (standaard: alle)")
+    parser.add_argument("--template", default=get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx")),
+                        help="Excel-sjabloon voor de export")
+    parser.add_argument("--add-A", action="store_true", help="Klasse A objecten meenemen in prepare en export")
+    parser.add_argument("--skip-export", action="store_true", help="Excel-export overslaan")
+    parser.add_argument("--output", help="Pad voor het JSON-resultaat (standaard: benchmarks/benchmark-<tijd>.json)")
+    parser.add_argument("--compare", help="Eerder JSON-resultaat om mee te vergelijken")
+    parser.add_argument("--verbose", action="store_true", help="Uitvoer van de pipeline tonen")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="pandas",
+                        help="Uitvoering van de filters: pandas (standaard) of duckdb")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="Geheugenbudget; daarboven worden tussenresultaten naar schijf geschreven")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Filterdefinities verdeeld over dit aantal processen uitvoeren")
+    parser.add_argument("--partition", choices=["rows", "gemnaam"], default="rows",
+                        help="Verdeling van de objecten over de processen: op rijen of per gemeente")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    filter_keys = args.filters.split(",") if args.filters else list(FILTER_DEFINITIONS.keys())
+    result = run_benchmark(args.aanzien, args.gebruik, filter_keys, args.template, args.add_A, args.skip_export,
+                           quiet=not args.verbose, backend=args.backend, memory_budget_mb=args.memory_budget,
+                           processes=args.processes, partition=args.partition)
+
+    output_path = args.output or os.path.join(ROOT_DIR, "benchmarks",
+                                              f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nTotal: {result['total_seconds']:.3f} s, peak memory: {result['peak_memory_mb']} MB")
+    print(f"Results saved to {output_path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
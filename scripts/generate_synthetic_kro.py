@@ -0,0 +1,186 @@
+"""
+Generate synthetic KRO-aanzien/KRO-gebruik file pairs for testing and benchmarking.
+
+The output has the columns the HUP pipeline uses, realistic *functie flag
+combinations, SBI codes that fit the object's function and a one-to-many
+gebruik fan-out. Files are written in chunks, so 5M objects fit in memory.
+
+Usage:
+    python scripts/generate_synthetic_kro.py --objects 100000
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Municipalities of the Veiligheidsregio Brabant-Zuidoost with an approximate RD centre
+GEMEENTEN = {
+    "Eindhoven": (161000, 383000), "Helmond": (173000, 386000), "Veldhoven": (155000, 377000),
+    "Best": (156000, 393000), "Geldrop-Mierlo": (168000, 380000), "Nuenen c.a.": (167000, 388000),
+    "Son en Breugel": (163000, 394000), "Waalre": (159000, 374000), "Valkenswaard": (159000, 367000),
+    "Heeze-Leende": (168000, 372000), "Cranendonck": (171000, 361000), "Someren": (181000, 375000),
+    "Asten": (184000, 380000), "Deurne": (185000, 388000), "Gemert-Bakel": (180000, 396000),
+    "Laarbeek": (174000, 393000), "Bergeijk": (149000, 368000), "Bladel": (146000, 372000),
+    "Eersel": (148000, 379000), "Reusel-De Mierden": (139000, 378000), "Oirschot": (152000, 395000),
+}
+GEMEENTE_WEIGHTS = np.array([30, 12, 6, 4, 5, 3, 2, 2, 4, 2, 3, 3, 2, 5, 4, 3, 2, 3, 3, 2, 3], dtype=float)
+
+STRAATNAMEN = ["Dorpsstraat", "Kerkstraat", "Molenstraat", "Stationsweg", "Markt", "Schoolstraat", "Hoofdstraat",
+               "Industrieweg", "Beukenlaan", "Eikenlaan", "Julianastraat", "Wilhelminalaan", "Parallelweg",
+               "Kanaaldijk", "De Run", "Torenallee", "Vestdijk", "Boschdijk", "Hastelweg", "Ekkersrijt"]
+
+# *functie columns with the probability that an object has that function
+FUNCTIES = {
+    "woonfunctie": 0.72, "bijeenkomstfunctie": 0.03, "celfunctie": 0.0005, "gezondheidszorgfunctie": 0.02,
+    "industriefunctie": 0.06, "kantoorfunctie": 0.05, "logiesfunctie": 0.01, "onderwijsfunctie": 0.01,
+    "sportfunctie": 0.01, "winkelfunctie": 0.05, "overigegebruiksfunctie": 0.12,
+}
+
+# SBI codes per function with their description; other objects draw from the general list
+SBI_CODES = {
+    "winkelfunctie": [(47110, "Supermarkten"), (47191, "Warenhuizen"), (47721, "Schoenenwinkels"),
+                      (47410, "Winkels in computers")],
+    "onderwijsfunctie": [(85201, "Basisonderwijs"), (85311, "Voortgezet onderwijs"), (85422, "Hoger onderwijs")],
+    "gezondheidszorgfunctie": [(86101, "Ziekenhuizen"), (86221, "Medisch specialistische praktijken"),
+                               (87101, "Verpleeghuizen"), (87301, "Verzorgingshuizen"),
+                               (88911, "Kinderopvang"), (86211, "Huisartsenpraktijken")],
+    "logiesfunctie": [(55101, "Hotels"), (55201, "Verhuur van vakantiehuisjes"), (55300, "Kampeerterreinen")],
+    "industriefunctie": [(10711, "Broodbakkerijen"), (25110, "Vervaardiging van metalen constructiewerken"),
+                         (28290, "Vervaardiging van overige machines"), (20130, "Vervaardiging van anorganische chemicalien")],
+    "kantoorfunctie": [(62010, "Ontwikkelen van software"), (69201, "Accountants"), (70221, "Organisatieadviesbureaus"),
+                       (84111, "Algemeen overheidsbestuur")],
+    "bijeenkomstfunctie": [(56101, "Restaurants"), (56302, "Cafes"), (88911, "Kinderopvang"), (94911, "Religieuze organisaties")],
+    "sportfunctie": [(93111, "Sportaccommodaties"), (93130, "Fitnesscentra")],
+    "celfunctie": [(84231, "Gevangenissen")],
+}
+SBI_GENERAL = [(41000, "Algemene burgerlijke en utiliteitsbouw"), (43221, "Installatiebedrijven"),
+               (46900, "Niet-gespecialiseerde groothandel"), (49410, "Goederenvervoer over de weg"),
+               (68203, "Verhuur van onroerend goed"), (96021, "Kappers"), (1130, "Teelt van groenten"),
+               (86911, "Praktijken van fysiotherapeuten")]
+
+
+def generate_chunk(rng, start, size):
+    """Generate one chunk of aanzien rows and the matching gebruik rows."""
+    index = np.arange(start, start + size)
+
+    gemeente_names = np.array(list(GEMEENTEN.keys()))
+    gemeente_idx = rng.choice(len(gemeente_names), size, p=GEMEENTE_WEIGHTS / GEMEENTE_WEIGHTS.sum())
+    centres = np.array(list(GEMEENTEN.values()), dtype=float)[gemeente_idx]
+
+    aanzien = pd.DataFrame({
+        "id": index + 1,
+        "bronsleutel": 772100000000000 + index,
+        "gemnaam": gemeente_names[gemeente_idx],
+        "pc6": [f"{pc}{a}{b}" for pc, a, b in zip(rng.integers(5500, 5760, size),
+                                                  rng.choice(list("ABCDEGHJKLMNPRSTVWXZ"), size),
+                                                  rng.choice(list("ABCDEGHJKLMNPRSTVWXZ"), size))],
+        "straatnaam": rng.choice(STRAATNAMEN, size),
+        "huisnr": rng.integers(1, 250, size).astype(float),
+        "huisletter": np.where(rng.random(size) < 0.07, rng.choice(list("ABCD"), size), None),
+        "huistoevg": np.where(rng.random(size) < 0.04, rng.choice(["1", "2", "bis", "rd"], size), None),
+    })
+
+    # Function flags; every object gets at least one function
+    flags = {name: rng.random(size) < p for name, p in FUNCTIES.items()}
+    no_function = ~np.logical_or.reduce(list(flags.values()))
+    flags["overigegebruiksfunctie"] |= no_function
+    for name, values in flags.items():
+        aanzien[name] = values.astype(int)
+
+    non_residential = ~flags["woonfunctie"] | (rng.random(size) < 0.05)
+    area = rng.lognormal(4.8, 1.0, size)
+    area[non_residential] = rng.lognormal(6.2, 1.4, non_residential.sum())
+    aanzien["bag_oppvlk"] = area.round()
+    aanzien["woz_opp_nietwoon"] = np.where(non_residential, (area * rng.uniform(0.5, 1.0, size)).round(), 0)
+    aanzien["bouwlagen"] = np.clip(rng.geometric(0.45, size), 1, 40)
+    aanzien["pandhoogte"] = (aanzien["bouwlagen"] * rng.uniform(2.8, 3.6, size) + rng.uniform(0, 3, size)).round(1)
+    aanzien["bouwjaar"] = np.clip(rng.normal(1975, 30, size).astype(int), 1600, 2024)
+    aanzien["x"] = (centres[:, 0] + rng.normal(0, 2500, size)).round(3)
+    aanzien["y"] = (centres[:, 1] + rng.normal(0, 2500, size)).round(3)
+
+    # One-to-many gebruik rows, more of them for larger non-residential objects
+    fan_out = np.where(rng.random(size) < 0.55, 0, rng.geometric(0.55, size))
+    fan_out[non_residential] += rng.geometric(0.35, non_residential.sum())
+    fan_out = np.minimum(fan_out, 200)
+    owner = np.repeat(np.arange(size), fan_out)
+    n_gebruik = len(owner)
+
+    # Pick the SBI code from the first non-residential function of the owner
+    codes = np.empty(n_gebruik, dtype=np.int64)
+    descriptions = np.empty(n_gebruik, dtype=object)
+    use_general = np.ones(n_gebruik, dtype=bool)
+    for name, options in SBI_CODES.items():
+        has_function = flags[name][owner] & use_general & (rng.random(n_gebruik) < 0.8)
+        picks = rng.integers(0, len(options), has_function.sum())
+        codes[has_function] = [options[i][0] for i in picks]
+        descriptions[has_function] = [options[i][1] for i in picks]
+        use_general &= ~has_function
+    picks = rng.integers(0, len(SBI_GENERAL), use_general.sum())
+    codes[use_general] = [SBI_GENERAL[i][0] for i in picks]
+    descriptions[use_general] = [SBI_GENERAL[i][1] for i in picks]
+
+    missing_code = rng.random(n_gebruik) < 0.08
+    personen = np.round(rng.lognormal(1.5, 1.3, n_gebruik))
+    personen[rng.random(n_gebruik) < 0.25] = np.nan
+
+    gebruik = pd.DataFrame({
+        "aanzien_id": aanzien["bronsleutel"].values[owner],
+        "naam_vol": np.where(rng.random(n_gebruik) < 0.7,
+                             np.char.add("Organisatie ", (start * 10 + np.arange(n_gebruik)).astype(str)), None),
+        "personen": personen,
+        "act1code": np.where(missing_code, np.nan, codes),
+        "act1omschr": np.where(missing_code, None, descriptions),
+    })
+    return aanzien, gebruik
+
+
+def generate(objects, output_dir, release="SYN", seed=0, chunk_size=250000):
+    """
+    Write a synthetic KRO-aanzien/KRO-gebruik pair.
+
+    Args:
+        objects: Number of aanzien objects to generate
+        output_dir: Directory for the CSV files
+        release: Release label used in the file names
+        seed: Random seed, the same seed gives the same files
+        chunk_size: Number of objects generated per chunk
+
+    Returns:
+        Tuple of (aanzien path, gebruik path)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    aanzien_path = os.path.join(output_dir, f"KRO-aanzien-{release}.csv")
+    gebruik_path = os.path.join(output_dir, f"KRO-gebruik-{release}.csv")
+
+    rng = np.random.default_rng(seed)
+    n_gebruik = 0
+    for start in range(0, objects, chunk_size):
+        aanzien, gebruik = generate_chunk(rng, start, min(chunk_size, objects - start))
+        first = start == 0
+        aanzien.to_csv(aanzien_path, sep=';', index=False, header=first, mode='w' if first else 'a')
+        gebruik.to_csv(gebruik_path, sep=';', index=False, header=first, mode='w' if first else 'a')
+        n_gebruik += len(gebruik)
+        print(f"Generated {start + len(aanzien)}/{objects} objects...")
+
+    print(f"Wrote {objects} aanzien rows to {aanzien_path}")
+    print(f"Wrote {n_gebruik} gebruik rows to {gebruik_path}")
+    return aanzien_path, gebruik_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genereer synthetische KRO-bestanden")
+    parser.add_argument("--objects", type=int, default=10000, help="Aantal KRO-aanzien objecten (10k tot 5M)")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                             "data", "synthetic"),
+                        help="Map voor de gegenereerde bestanden")
+    parser.add_argument("--release", default="SYN", help="Releaselabel in de bestandsnamen")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    generate(args.objects, args.output_dir, args.release, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Generate a separate HUP per municipality (gemnaam) with a pool of worker processes.
+
+The KRO files are loaded once and published in shared memory (see
+shared_dataset.py); every worker attaches to them without copying, aggregates
+KRO-gebruik once and then handles one municipality per task.
+
+Usage:
+    python scripts/hup_per_gemeente.py --aanzien data/KRO-aanzien.csv --gebruik data/KRO-gebruik.csv
+    python scripts/hup_per_gemeente.py ... --gemeenten Eindhoven,Helmond --format parquet --processes 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from data_management import (
+    load_data_from_file,
+    get_executable_relative_path,
+    get_resource_path,
+    FILTER_DEFINITIONS,
+    apply_filter_to_tree
+)
+from classes import KRO_Tree
+from gebruik_aggregates import GebruikAggregates
+from exporters import EXPORT_FORMATS
+from shared_dataset import publish_kro, attach_kro
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(dataset, filter_keys, output_format, output_dir, add_A):
+    df_aanzien, df_gebruik = attach_kro(dataset)
+    _worker.update(dataset=dataset, df_aanzien=df_aanzien, df_gebruik=df_gebruik,
+                   aggregates=GebruikAggregates(df_gebruik), filter_keys=filter_keys,
+                   output_format=output_format, output_dir=output_dir, add_A=add_A)
+
+
+def _safe_filename(name: str) -> str:
+    return "".join(character if character.isalnum() or character in " -_" else "_" for character in name).strip()
+
+
+def generate_for_gemeente(gemeente: str) -> dict:
+    """Apply the filters to the objects of one municipality and write its HUP."""
+    started = time.time()
+    df_aanzien = _worker["df_aanzien"]
+    tree = KRO_Tree(df_aanzien[df_aanzien['gemnaam'] == gemeente], _worker["df_gebruik"],
+                    aggregates=_worker["aggregates"])
+    for filter_key in _worker["filter_keys"]:
+        apply_filter_to_tree(tree, filter_key)
+
+    output_format = _worker["output_format"]
+    output_path = os.path.join(_worker["output_dir"],
+                               f"HUP-{_safe_filename(gemeente)}{EXPORT_FORMATS[output_format]['extension']}")
+    if output_format == "xlsx":
+        template_path = get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx"))
+        tree.insert_dataframe_into_excel(template_path, "Online Checklist Bedrijven", 2, output_path=output_path,
+                                         add_A=_worker["add_A"])
+    else:
+        tree.export_file(output_format, output_path, add_A=_worker["add_A"])
+    return {"gemeente": gemeente, "rows": tree.hup_rows, "path": output_path, "seconds": time.time() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per gemeente een HUP genereren met meerdere processen")
+    parser.add_argument("--aanzien", required=True, help="KRO-aanzien CSV")
+    parser.add_argument("--gebruik", required=True, help="KRO-gebruik CSV")
+    parser.add_argument("--gemeenten", help="Komma-gescheiden gemeentenamen (standaard: alle)")
+    parser.add_argument("--filters", help="Komma-gescheiden filtersleutels (standaard: alle)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="xlsx", help="Uitvoerformaat")
+    parser.add_argument("--add-A", action="store_true", help="Klasse A objecten meenemen")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Aantal werkprocessen")
+    parser.add_argument("--output-dir", default=get_executable_relative_path("HUP", "per gemeente"),
+                        help="Map voor de HUP-bestanden")
+    args = parser.parse_args()
+
+    filter_keys = args.filters.split(",") if args.filters else list(FILTER_DEFINITIONS)
+    unknown = [key for key in filter_keys if key not in FILTER_DEFINITIONS]
+    if unknown:
+        parser.error(f"Onbekende filtersleutel(s): {', '.join(unknown)}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    df_aanzien = load_data_from_file(args.aanzien)
+    df_gebruik = load_data_from_file(args.gebruik)
+    gemeenten = args.gemeenten.split(",") if args.gemeenten else sorted(df_aanzien['gemnaam'].dropna().unique())
+
+    started = time.time()
+    with publish_kro(df_aanzien, df_gebruik) as dataset:
+        print(f"{len(df_aanzien)} objecten gedeeld via gedeeld geheugen ({dataset.nbytes / 2 ** 20:.0f} MB), "
+              f"{len(gemeenten)} gemeenten met {args.processes} processen")
+        with multiprocessing.get_context("spawn").Pool(
+                args.processes, initializer=_init_worker,
+                initargs=(dataset, filter_keys, args.format, args.output_dir, args.add_A)) as pool:
+            for result in pool.imap_unordered(generate_for_gemeente, gemeenten):
+                print(f"{result['gemeente']:<30} {result['rows']:>7} objecten  {result['seconds']:6.1f} s  "
+                      f"{result['path']}")
+    print(f"Klaar in {time.time() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
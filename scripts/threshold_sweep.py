@@ -0,0 +1,80 @@
+"""
+Show how the HUP changes when one or two thresholds of a filter definition change.
+
+Counts the objects of the definition and of the whole HUP per risk class for
+every threshold value in one pass (see threshold_sweep.py), without running
+the filters again per value.
+
+Usage:
+    python scripts/threshold_sweep.py --aanzien data/KRO-aanzien.csv --gebruik data/KRO-gebruik.csv \\
+        --definitie winkel --drempel woz_opp_nietwoon=500:1500:100
+    python scripts/threshold_sweep.py ... --definitie kantoor_b --drempel pandhoogte=10:30:5 \\
+        --drempel woz_opp_nietwoon=800,1000,1200 --output sweep.csv
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pandas as pd
+
+from data_management import load_data_from_file, FILTER_DEFINITIONS
+from classes import KRO_Tree
+from mask_cache import content_fingerprint
+from threshold_sweep import sweep_definition, parse_sweep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gevoeligheid van de HUP voor drempelwaarden van een filterdefinitie")
+    parser.add_argument("--aanzien", required=True, help="KRO-aanzien CSV")
+    parser.add_argument("--gebruik", required=True, help="KRO-gebruik CSV")
+    parser.add_argument("--definitie", required=True, choices=list(FILTER_DEFINITIONS),
+                        help="Filterdefinitie waarvan de drempels variëren")
+    parser.add_argument("--drempel", action="append", required=True, metavar="KOLOM=START:STOP:STAP",
+                        help="Kolom en waarden, als start:stop:stap (stop inbegrepen) of komma-gescheiden; "
+                             "maximaal twee keer")
+    parser.add_argument("--filters", help="Komma-gescheiden filtersleutels die de HUP vormen (standaard: alle)")
+    parser.add_argument("--output", help="Tabel ook als CSV (puntkomma-gescheiden) opslaan")
+    args = parser.parse_args()
+
+    if len(args.drempel) > 2:
+        parser.error("Geef één of twee drempels op.")
+    try:
+        sweeps = [parse_sweep(text) for text in args.drempel]
+    except ValueError as e:
+        parser.error(str(e))
+    filter_keys = args.filters.split(",") if args.filters else None
+    unknown = [key for key in filter_keys or [] if key not in FILTER_DEFINITIONS]
+    if unknown:
+        parser.error(f"Onbekende filtersleutel(s): {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.WARNING)
+    # Key the cached masks by the file contents, as the app does, instead of hashing the loaded frames
+    contents = []
+    for path in (args.aanzien, args.gebruik):
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+    tree = KRO_Tree(load_data_from_file(args.aanzien), load_data_from_file(args.gebruik),
+                    fingerprint=content_fingerprint(*contents))
+
+    started = time.time()
+    try:
+        result = sweep_definition(tree, args.definitie, sweeps, filter_keys)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{len(result)} drempelcombinaties berekend in {time.time() - started:.2f} s\n")
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(result.to_string(index=False))
+
+    if args.output:
+        result.to_csv(args.output, index=False, sep=';')
+        print(f"\nOpgeslagen in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Multi-process server mode of the HUP Generator.
+
+A single PyWebIO process runs all sessions under one GIL, so one user's
+export stalls everybody else. run_multi_process starts several worker
+processes instead, each running its own PyWebIO (Tornado) server on a local
+port with pandas and openpyxl already imported. A small Tornado front
+process listens on the public port and forwards HTTP requests and the
+PyWebIO websocket to a worker:
+
+- session affinity: the first request of a browser gets a 'hup_worker' cookie
+  for the worker with the fewest open sessions, and all later requests (page,
+  static files, websocket, reconnects) go to that same worker;
+- admission control: heavy jobs are admitted by one AdmissionController in a
+  manager process shared by all workers (see admission.py), so the number of
+  concurrent filter/export jobs is limited server-wide and the rest queue;
+- supervision: a worker that exits is started again on the same port and its
+  admission tickets are released.
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import threading
+import multiprocessing
+from typing import Callable, List, Optional
+
+import tornado.web
+import tornado.ioloop
+import tornado.httpclient
+import tornado.websocket
+
+from admission import AdmissionManager, configure
+from startup import wait_for_port, warm_up
+
+logger = logging.getLogger(__name__)
+
+AFFINITY_COOKIE = "hup_worker"
+
+# Largest upload passed through the proxy; the same limit is used by the PyWebIO workers
+MAX_PAYLOAD_SIZE = 200 * 1024 * 1024
+
+# Seconds between checks whether all workers are still running
+SUPERVISE_INTERVAL = 2.0
+
+# Request headers that only apply to the connection between browser and proxy
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                      "transfer-encoding", "upgrade", "host", "content-length"}
+
+
+def _worker_main(target: Callable, port: int, controller, settings: Optional[dict] = None) -> None:
+    """Entry point of a worker process: import the data stack, then serve PyWebIO sessions on a local port."""
+    from pywebio import start_server
+
+    # A spawned worker imports the app module afresh, so the settings parsed from the command line are passed on
+    if settings:
+        sys.modules[target.__module__].APP_SETTINGS.update(settings)
+
+    # Exit together with the proxy process, also when it is killed without stopping the workers
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), os._exit(0)), daemon=True).start()
+
+    logging.basicConfig(level=logging.INFO, format=f"[werker {port}] %(message)s")
+    warm_up()
+    configure(controller)
+    start_server(target, port=port, host="127.0.0.1", debug=False, max_payload_size=MAX_PAYLOAD_SIZE)
+
+
+class WorkerPool:
+    """
+    Worker processes on consecutive local ports and the number of open websocket sessions per worker.
+
+    Args:
+        target: PyWebIO application function (must be importable by the worker processes)
+        ports: Local port per worker
+        controller: AdmissionController proxy shared by the workers
+        settings: Values for the APP_SETTINGS dict of the target's module in each worker
+    """
+
+    def __init__(self, target: Callable, ports: List[int], controller, settings: Optional[dict] = None):
+        self.target = target
+        self.ports = ports
+        self.controller = controller
+        self.settings = dict(settings or {})
+        self.sessions = [0] * len(ports)
+        self.assigned = [0] * len(ports)
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * len(ports)
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self, index: int) -> None:
+        process = self._context.Process(target=_worker_main, args=(self.target, self.ports[index], self.controller,
+                                                                      self.settings),
+                                        name=f"hup-werker-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    def start_all(self, timeout: float = 120.0) -> None:
+        for index in range(len(self.ports)):
+            self.start(index)
+        for port in self.ports:
+            if not wait_for_port(port, timeout=timeout):
+                raise RuntimeError(f"Worker on port {port} did not start within {timeout} seconds")
+
+    def supervise(self) -> None:
+        """Start workers that have exited again and release the admission tickets they held."""
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                released = self.controller.release_owner(process.pid)
+                logger.warning("Worker %s (pid %s) stopped with exit code %s; %s job(s) released, restarting.",
+                               index, process.pid, process.exitcode, released)
+                self.sessions[index] = 0
+                self.start(index)
+
+    def choose(self, cookie: Optional[str]) -> int:
+        """
+        Returns the worker of the cookie, or the worker with the fewest open sessions for a new browser
+        (ties go to the worker that was assigned the fewest browsers).
+        """
+        if cookie is not None and cookie.isdigit() and int(cookie) < len(self.ports):
+            return int(cookie)
+        index = min(range(len(self.ports)), key=lambda index: (self.sessions[index], self.assigned[index]))
+        self.assigned[index] += 1
+        return index
+
+    def stop(self) -> None:
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=5)
+
+
+class ProxyHandler(tornado.websocket.WebSocketHandler):
+    """Forwards plain HTTP requests and the PyWebIO websocket to the worker of the session."""
+
+    def initialize(self, pool: WorkerPool):
+        self.pool = pool
+        self.worker = None
+        self.upstream = None
+
+    def _select_worker(self) -> int:
+        if self.worker is None:
+            self.worker = self.pool.choose(self.get_cookie(AFFINITY_COOKIE))
+            self.set_cookie(AFFINITY_COOKIE, str(self.worker), httponly=True, samesite="Lax")
+        return self.worker
+
+    def _upstream_url(self, scheme: str) -> str:
+        return f"{scheme}://127.0.0.1:{self.pool.ports[self._select_worker()]}{self.request.uri}"
+
+    async def get(self, *args, **kwargs):
+        if self.request.headers.get("Upgrade", "").lower() == "websocket":
+            self._select_worker()
+            await super().get(*args, **kwargs)
+        else:
+            await self._forward()
+
+    async def post(self, *args, **kwargs):
+        await self._forward()
+
+    async def _forward(self):
+        headers = {name: value for name, value in self.request.headers.get_all()
+                   if name.lower() not in HOP_BY_HOP_HEADERS}
+        request = tornado.httpclient.HTTPRequest(
+            self._upstream_url("http"), method=self.request.method, headers=headers,
+            body=self.request.body if self.request.method == "POST" else None,
+            follow_redirects=False, decompress_response=False, request_timeout=600)
+        response = await tornado.httpclient.AsyncHTTPClient().fetch(request, raise_error=False)
+        if response.code == 599:
+            raise tornado.web.HTTPError(502, reason="Worker unavailable")
+
+        self.set_status(response.code, response.reason)
+        for name, value in response.headers.get_all():
+            if name.lower() not in HOP_BY_HOP_HEADERS:
+                self.add_header(name, value)
+        if response.body:
+            self.write(response.body)
+
+    async def open(self, *args, **kwargs):
+        # Open sessions count towards the worker's load for new browsers
+        self.pool.sessions[self.worker] += 1
+        try:
+            self.upstream = await tornado.websocket.websocket_connect(
+                self._upstream_url("ws"), max_message_size=MAX_PAYLOAD_SIZE)
+        except Exception as e:
+            logger.warning("Cannot reach worker %s: %s", self.worker, e)
+            self.close(1011, "Worker unavailable")
+            return
+        tornado.ioloop.IOLoop.current().spawn_callback(self._relay_upstream)
+
+    async def _relay_upstream(self):
+        """Copy messages from the worker to the browser until either side closes."""
+        upstream = self.upstream
+        while True:
+            message = await upstream.read_message()
+            if message is None:
+                break
+            try:
+                await self.write_message(message, binary=isinstance(message, bytes))
+            except tornado.websocket.WebSocketClosedError:
+                break
+        self.close()
+
+    async def on_message(self, message):
+        if self.upstream is not None:
+            await self.upstream.write_message(message, binary=isinstance(message, bytes))
+
+    def on_close(self):
+        if self.worker is not None:
+            self.pool.sessions[self.worker] = max(0, self.pool.sessions[self.worker] - 1)
+        if self.upstream is not None:
+            self.upstream.close()
+            self.upstream = None
+
+
+def _port_in_use(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        return probe.connect_ex(("127.0.0.1", port)) == 0
+
+
+def run_multi_process(target: Callable, port: int, workers: int, max_jobs: Optional[int] = None,
+                      worker_base_port: Optional[int] = None, settings: Optional[dict] = None) -> None:
+    """
+    Run the app with several worker processes behind a session-affine proxy on `port`.
+
+    Args:
+        target: PyWebIO application function
+        port: Public port of the proxy
+        workers: Number of worker processes
+        max_jobs: Heavy jobs that may run at the same time on the whole server (default: one per worker)
+        worker_base_port: Local port of the first worker; the next ports are used for the others
+        settings: Values for the APP_SETTINGS dict of the target's module in each worker
+    """
+    workers = max(1, int(workers))
+    worker_base_port = worker_base_port or port + 1
+    ports = [worker_base_port + index for index in range(workers)]
+    busy = [p for p in [port] + ports if _port_in_use(p)]
+    if busy:
+        raise RuntimeError(f"Port(s) already in use: {busy}")
+
+    manager = AdmissionManager(address=("127.0.0.1", 0))
+    manager.start()
+    controller = manager.AdmissionController(max_jobs or workers)
+
+    pool = WorkerPool(target, ports, controller, settings)
+    # Stop the workers on SIGTERM as well as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    started = time.time()
+    try:
+        pool.start_all()
+        logger.info("%s workers ready on ports %s-%s in %.1f s (max. %s jobs at once).",
+                    workers, ports[0], ports[-1], time.time() - started, max_jobs or workers)
+
+        application = tornado.web.Application([(r"/.*", ProxyHandler, dict(pool=pool))],
+                                              websocket_max_message_size=MAX_PAYLOAD_SIZE)
+        application.listen(port, max_body_size=MAX_PAYLOAD_SIZE)
+        tornado.ioloop.PeriodicCallback(pool.supervise, SUPERVISE_INTERVAL * 1000).start()
+        tornado.ioloop.IOLoop.current().start()
+    finally:
+        pool.stop()
+        manager.shutdown()
@@ -0,0 +1,259 @@
+"""
+Parsed KRO datasets shared between processes through OS shared memory.
+
+Pickling the KRO-aanzien and KRO-gebruik frames into every worker of a
+multiprocessing pool costs seconds and a full copy of the data per worker.
+SharedDataset.publish writes the typed columns once into a single shared
+memory segment; the handle that is passed to the workers only holds the
+segment name and a small manifest, and the workers attach to it read-only:
+
+- numeric, boolean and datetime columns are zero-copy views on the segment;
+- Arrow-backed string columns (the default 'str' dtype of pandas 3 when
+  pyarrow is installed) keep their Arrow buffers in the segment and are
+  zero-copy as well;
+- other string columns are stored dictionary-encoded (int32 codes plus the
+  UTF-8 encoded distinct values) and decoded when a worker attaches, so only
+  the distinct strings and a pointer per row are created in the worker;
+- remaining columns (mixed objects, other extension dtypes) are pickled into
+  the segment and unpickled on attach.
+
+The publishing process owns the segment and unlinks it when the dataset is
+closed, garbage collected or the process exits.
+"""
+
+import sys
+import pickle
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Column buffers start at multiples of this many bytes
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _is_string_column(series: pd.Series) -> bool:
+    if not (pd.api.types.is_string_dtype(series.dtype) or series.dtype == object):
+        return False
+    values = series.dropna()
+    return values.map(type).eq(str).all() if series.dtype == object else True
+
+
+def _encode_column(series: pd.Series) -> Tuple[dict, list]:
+    """Returns the manifest entry of a column and the arrays to store for it."""
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        values = np.ascontiguousarray(series.to_numpy())
+        return {"kind": "numeric", "dtype": values.dtype.str}, [values]
+    if isinstance(series.array, pd.arrays.ArrowStringArray):
+        import pyarrow as pa
+        values = pa.array(series.array)
+        buffers = values.buffers()
+        entry = {"kind": "arrow", "dtype": dtype, "arrow_type": str(values.type), "length": len(values),
+                 "null_count": values.null_count, "offset": values.offset,
+                 "present": [buffer is not None for buffer in buffers]}
+        return entry, [np.frombuffer(buffer, dtype=np.uint8) for buffer in buffers if buffer is not None]
+    if _is_string_column(series):
+        codes, distinct = pd.factorize(series, use_na_sentinel=True)
+        encoded = [str(value).encode('utf-8') for value in distinct]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        text = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return {"kind": "string", "dtype": dtype}, [codes.astype(np.int32), offsets, text]
+    return {"kind": "pickle"}, [np.frombuffer(pickle.dumps(series, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)]
+
+
+# Segments published by this process by name, so attaching in the owner reuses the owner's mapping
+_published: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _unlink(segment: shared_memory.SharedMemory) -> None:
+    _published.pop(segment.name, None)
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        segment.close()
+    except BufferError:
+        # Views on the segment are still in use; the mapping is released with them
+        pass
+
+
+class SharedDataset:
+    """
+    Named dataframes published once in shared memory and attached read-only by other processes.
+
+    Create it with SharedDataset.publish in the owning process and pass the object itself to the workers
+    (as a Pool initializer argument or task argument); only the segment name and manifest are pickled.
+    """
+
+    def __init__(self, segment_name: str, manifest: Dict[str, dict], size: int):
+        self.segment_name = segment_name
+        self.manifest = manifest
+        self.size = size
+        self._segment = None
+        self._frames = {}
+        self._owner = False
+        self._finalizer = None
+
+    @classmethod
+    def publish(cls, frames: Dict[str, pd.DataFrame]) -> "SharedDataset":
+        """
+        Copy dataframes into a new shared memory segment owned by this process.
+
+        Args:
+            frames: Dataframes by name, e.g. {"aanzien": df_aanzien, "gebruik": df_gebruik}
+
+        Returns:
+            SharedDataset that can be pickled to worker processes
+        """
+        manifest, buffers, offset = {}, [], 0
+        for name, df in frames.items():
+            columns = []
+            index = df.index
+            if isinstance(index, pd.RangeIndex):
+                index_entry = {"kind": "range", "start": index.start, "stop": index.stop, "step": index.step}
+            else:
+                index_entry, arrays = _encode_column(index.to_series(index=None))
+                index_entry["name"] = index.name
+                index_entry["buffers"], offset = cls._place(arrays, buffers, offset)
+            for column in df.columns:
+                entry, arrays = _encode_column(df[column])
+                entry["name"] = column
+                entry["buffers"], offset = cls._place(arrays, buffers, offset)
+                columns.append(entry)
+            manifest[name] = {"rows": len(df), "index": index_entry, "columns": columns}
+
+        segment = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for array, start in buffers:
+            segment.buf[start:start + array.nbytes] = array.view(np.uint8).reshape(-1)
+
+        dataset = cls(segment.name, manifest, offset)
+        dataset._segment = segment
+        dataset._owner = True
+        dataset._finalizer = weakref.finalize(dataset, _unlink, segment)
+        _published[segment.name] = segment
+        return dataset
+
+    @staticmethod
+    def _place(arrays, buffers, offset):
+        """Assign aligned offsets in the segment to the arrays of one column."""
+        placed = []
+        for array in arrays:
+            offset = _aligned(offset)
+            placed.append({"offset": offset, "dtype": array.dtype.str, "length": len(array)})
+            buffers.append((array, offset))
+            offset += array.nbytes
+        return placed, offset
+
+    def __getstate__(self):
+        return {"segment_name": self.segment_name, "manifest": self.manifest, "size": self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state["segment_name"], state["manifest"], state["size"])
+
+    def _attach(self) -> shared_memory.SharedMemory:
+        if self._segment is None and self.segment_name in _published:
+            self._segment = _published[self.segment_name]
+        if self._segment is None:
+            segment = shared_memory.SharedMemory(name=self.segment_name)
+            # Before Python 3.13 attaching also registers the segment with this process's resource tracker,
+            # which would unlink it when an unrelated process exits. Pool workers share the owner's tracker.
+            if sys.version_info < (3, 13) and multiprocessing.parent_process() is None:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(segment._name, "shared_memory")
+            self._segment = segment
+        return self._segment
+
+    def _arrays(self, entry: dict):
+        buffer = self._attach().buf
+        arrays = []
+        for spec in entry["buffers"]:
+            if spec["length"] == 0:
+                arrays.append(np.empty(0, dtype=np.dtype(spec["dtype"])))
+                continue
+            array = np.ndarray(spec["length"], dtype=np.dtype(spec["dtype"]), buffer=buffer, offset=spec["offset"])
+            array.flags.writeable = False
+            arrays.append(array)
+        return arrays
+
+    def _decode(self, entry: dict):
+        arrays = self._arrays(entry)
+        if entry["kind"] == "numeric":
+            return arrays[0]
+        if entry["kind"] == "arrow":
+            import pyarrow as pa
+            buffers = iter(pa.py_buffer(array) for array in arrays)
+            values = pa.Array.from_buffers(pa.type_for_alias(entry["arrow_type"]), entry["length"],
+                                           [next(buffers) if present else None for present in entry["present"]],
+                                           null_count=entry["null_count"], offset=entry["offset"])
+            return pd.arrays.ArrowStringArray(pa.chunked_array([values]), dtype=entry["dtype"])
+        if entry["kind"] == "string":
+            codes, offsets, text = arrays
+            raw = text.tobytes()
+            distinct = np.array([raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])] +
+                                [None], dtype=object)
+            # Code -1 (missing) takes the None appended at the end
+            return pd.array(distinct[codes], dtype=entry["dtype"])
+        return pickle.loads(arrays[0].tobytes()).array
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """
+        Returns a dataframe attached to the shared segment; numeric columns are read-only views.
+
+        Writing to the frame is allowed: pandas copies a column before changing it.
+        """
+        if name not in self._frames:
+            spec = self.manifest[name]
+            index_entry = spec["index"]
+            if index_entry["kind"] == "range":
+                index = pd.RangeIndex(index_entry["start"], index_entry["stop"], index_entry["step"])
+            else:
+                index = pd.Index(self._decode(index_entry), name=index_entry["name"])
+            data = {entry["name"]: self._decode(entry) for entry in spec["columns"]}
+            self._frames[name] = pd.DataFrame(data, index=index, copy=False)
+        return self._frames[name]
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        return {name: self.frame(name) for name in self.manifest}
+
+    @property
+    def nbytes(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        """Detach from the segment; the owner also removes it."""
+        self._frames.clear()
+        if self._owner and self._finalizer is not None:
+            self._finalizer()
+        elif self._segment is not None:
+            try:
+                self._segment.close()
+            except BufferError:
+                # Views on the segment are still in use; the mapping is released with them
+                pass
+        self._segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def publish_kro(df_aanzien: pd.DataFrame, df_gebruik: pd.DataFrame) -> SharedDataset:
+    """Publish a loaded KRO-aanzien/KRO-gebruik pair for worker processes."""
+    return SharedDataset.publish({"aanzien": df_aanzien, "gebruik": df_gebruik})
+
+
+def attach_kro(dataset: SharedDataset) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns the (df_aanzien, df_gebruik) pair of a dataset published with publish_kro."""
+    return dataset.frame("aanzien"), dataset.frame("gebruik")
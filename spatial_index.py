@@ -0,0 +1,192 @@
+"""
+Spatial selection of KRO objects on their x/y coordinates (RD New, EPSG:28992).
+
+GridIndex buckets the objects in a uniform grid once per dataset; radius,
+polygon and nearest-N queries then only look at the objects in the grid cells
+around the query. All queries return a boolean mask over all objects, so as
+filter steps they are independent of the order in which they are applied:
+nearest-N always means the N nearest objects of the whole dataset.
+
+Polygons are read from local GeoJSON files (Polygon, MultiPolygon, Feature or
+FeatureCollection) with coordinates in RD.
+"""
+
+import os
+import json
+from typing import List
+
+import numpy as np
+
+# Average number of objects per grid cell used to choose the cell size
+OBJECTS_PER_CELL = 16
+
+# EPSG codes accepted in the 'crs' member of a GeoJSON file
+RD_CRS_CODES = ("28992",)
+
+
+class GridIndex:
+    """
+    Uniform grid over the object coordinates.
+
+    Args:
+        x: x coordinate per object (RD, metres)
+        y: y coordinate per object (RD, metres)
+        cell_size: Width of a grid cell in metres; chosen from the point density if None
+    """
+
+    def __init__(self, x, y, cell_size=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.size = len(self.x)
+        valid = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+
+        if len(valid):
+            self.x0, self.y0 = self.x[valid].min(), self.y[valid].min()
+            width = max(self.x[valid].max() - self.x0, 1.0)
+            height = max(self.y[valid].max() - self.y0, 1.0)
+        else:
+            self.x0 = self.y0 = 0.0
+            width = height = 1.0
+        if cell_size is None:
+            cell_size = max(np.sqrt(width * height * OBJECTS_PER_CELL / max(len(valid), 1)), 1.0)
+        self.cell_size = float(cell_size)
+        self.columns = int(width // self.cell_size) + 1
+        self.rows = int(height // self.cell_size) + 1
+
+        # Objects sorted by cell number (row-major), so each row of cells is a few contiguous slices
+        keys = self._cells(self.y[valid], self.y0, self.rows) * self.columns + \
+            self._cells(self.x[valid], self.x0, self.columns)
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._objects = valid[order]
+
+    def _cells(self, values, origin, count):
+        return np.clip(((values - origin) // self.cell_size).astype(np.int64), 0, count - 1)
+
+    def candidates(self, xmin, ymin, xmax, ymax) -> np.ndarray:
+        """Returns the positions of the objects in the grid cells that overlap the bounding box."""
+        if xmax < self.x0 or ymax < self.y0 or len(self._keys) == 0:
+            return np.empty(0, dtype=np.int64)
+        column_lo, column_hi = self._cells(np.array([xmin, xmax]), self.x0, self.columns)
+        row_lo, row_hi = self._cells(np.array([ymin, ymax]), self.y0, self.rows)
+        rows = np.arange(row_lo, row_hi + 1) * self.columns
+        starts = np.searchsorted(self._keys, rows + column_lo, side='left')
+        ends = np.searchsorted(self._keys, rows + column_hi, side='right')
+        return np.concatenate([self._objects[start:end] for start, end in zip(starts, ends)] or
+                              [np.empty(0, dtype=np.int64)])
+
+    def _to_mask(self, positions) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def within_radius(self, x, y, radius) -> np.ndarray:
+        """Mask of the objects within radius metres of (x, y)."""
+        candidates = self.candidates(x - radius, y - radius, x + radius, y + radius)
+        distance2 = (self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2
+        return self._to_mask(candidates[distance2 <= radius * radius])
+
+    def within_polygon(self, rings: List[np.ndarray]) -> np.ndarray:
+        """Mask of the objects inside the polygon rings (even-odd rule, so holes are excluded)."""
+        if not rings:
+            return np.zeros(self.size, dtype=bool)
+        points = np.concatenate(rings)
+        candidates = self.candidates(points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+        inside = points_in_polygon(self.x[candidates], self.y[candidates], rings)
+        return self._to_mask(candidates[inside])
+
+    def nearest(self, x, y, count) -> np.ndarray:
+        """
+        Mask of the count objects nearest to (x, y); ties at the same distance are broken by position.
+        """
+        count = int(count)
+        available = len(self._objects)
+        if count <= 0:
+            return np.zeros(self.size, dtype=bool)
+        if count >= available:
+            return self._to_mask(self._objects)
+
+        # Grow the search box until it contains the circle through the count-th nearest candidate
+        radius = self.cell_size
+        while True:
+            candidates = self.candidates(x - radius, y - radius, x + radius, y + radius)
+            if len(candidates) >= count:
+                distance2 = (self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2
+                order = np.lexsort((candidates, distance2))[:count]
+                reach = np.sqrt(distance2[order[-1]])
+                if reach <= radius or len(candidates) == available:
+                    return self._to_mask(candidates[order])
+                radius = reach
+            else:
+                radius *= 2
+
+
+def points_in_polygon(px, py, rings: List[np.ndarray]) -> np.ndarray:
+    """
+    Even-odd point-in-polygon test for many points.
+
+    The points are sorted on y once, so each edge only tests the points in its own y band.
+    """
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    order = np.argsort(py, kind='stable')
+    xs, ys = px[order], py[order]
+    inside = np.zeros(len(px), dtype=bool)
+
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        lows = np.searchsorted(ys, np.minimum(y1, y2), side='left')
+        highs = np.searchsorted(ys, np.maximum(y1, y2), side='left')
+        for i in np.flatnonzero(highs > lows):
+            band = slice(lows[i], highs[i])
+            crossing = (x2[i] - x1[i]) * (ys[band] - y1[i]) / (y2[i] - y1[i]) + x1[i]
+            inside[band] ^= xs[band] < crossing
+
+    result = np.empty(len(px), dtype=bool)
+    result[order] = inside
+    return result
+
+
+def load_polygon(path: str) -> List[np.ndarray]:
+    """
+    Reads the polygon rings from a GeoJSON file with RD coordinates.
+
+    Args:
+        path: Path to a GeoJSON Polygon, MultiPolygon, Feature or FeatureCollection
+
+    Returns:
+        List of rings as (n, 2) arrays; holes are separate rings
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    crs = data.get("crs", {}).get("properties", {}).get("name") if isinstance(data, dict) else None
+    if crs and not any(code in str(crs) for code in RD_CRS_CODES):
+        raise ValueError(f"Polygon in {os.path.basename(path)} uses {crs}; only RD (EPSG:28992) is supported.")
+
+    def geometries(obj):
+        if obj.get("type") == "FeatureCollection":
+            for feature in obj.get("features", []):
+                yield from geometries(feature)
+        elif obj.get("type") == "Feature":
+            if obj.get("geometry"):
+                yield from geometries(obj["geometry"])
+        else:
+            yield obj
+
+    rings = []
+    for geometry in geometries(data):
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise ValueError(f"Unsupported geometry type in {os.path.basename(path)}: {geometry.get('type')}")
+        for polygon in polygons:
+            rings.extend(np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon if len(ring) >= 3)
+
+    if rings and max(np.abs(ring).max() for ring in rings) <= 180:
+        raise ValueError(f"Polygon in {os.path.basename(path)} looks like longitude/latitude; "
+                         f"coordinates must be RD (EPSG:28992).")
+    return rings
@@ -0,0 +1,121 @@
+"""
+Startup path of the HUP Generator.
+
+The launcher only imports what it needs to get the web server listening. The
+data stack (pandas, numpy, openpyxl and the HUP modules) is imported in a
+background thread once the server is up, and the browser is opened as soon as
+the port accepts connections instead of after a fixed delay. StartupTimer
+records every phase, from process start to a warm data stack, for the
+startup report.
+
+Only the standard library is used here, so importing this module is cheap.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import importlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Modules imported in the background after the server is listening
+WARM_UP_MODULES = ["numpy", "pandas", "openpyxl", "data_management", "classes", "exporters", "template_cache",
+                   "profiling"]
+
+
+def process_start_time() -> Optional[float]:
+    """
+    Return the wall-clock time the process was started, or None if unknown.
+
+    For a PyInstaller one-file build the parent (bootloader) process is used, so unpacking is included.
+    """
+    try:
+        import psutil
+        process = psutil.Process()
+        if getattr(sys, 'frozen', False) and process.parent() is not None:
+            process = process.parent()
+        return process.create_time()
+    except Exception:
+        pass
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/stat') as f:
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/uptime') as f:
+                uptime = float(f.read().split()[0])
+            return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            return None
+    return None
+
+
+class StartupTimer:
+    """Records named phases of the startup, each measured from the end of the previous one."""
+
+    def __init__(self):
+        self.started = process_start_time()
+        self.created = time.time()
+        self.phases: List[Dict] = []
+        self._last = self.created
+        self._lock = threading.Lock()
+        if self.started is not None and self.started < self.created:
+            self.phases.append({"phase": "proces gestart tot eerste import", "seconds": self.created - self.started})
+
+    def mark(self, phase: str) -> None:
+        """Close the current phase under the given name."""
+        now = time.time()
+        with self._lock:
+            self.phases.append({"phase": phase, "seconds": now - self._last})
+            self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - (self.started if self.started is not None else self.created)
+
+    def report(self) -> str:
+        lines = ["Opstarttijden:"]
+        for phase in self.phases:
+            lines.append(f"  {phase['phase']:<40} {phase['seconds']:>7.3f} s")
+        lines.append(f"  {'totaal':<40} {self.total:>7.3f} s")
+        return "\n".join(lines)
+
+    def to_json(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"phases": self.phases, "total_seconds": self.total}, f, indent=2)
+        return path
+
+
+# Timer for this process, created when the launcher is first imported
+STARTUP = StartupTimer()
+
+
+def wait_for_port(port: int, host: str = "127.0.0.1", timeout: float = 60.0, interval: float = 0.05) -> bool:
+    """
+    Wait until a TCP port accepts connections.
+
+    Returns:
+        True when the port is ready, False after the timeout
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=interval * 4):
+                return True
+        except OSError:
+            time.sleep(interval)
+    return False
+
+
+def warm_up(modules: Iterable[str] = WARM_UP_MODULES) -> None:
+    """Import the data stack so the first session does not have to wait for it."""
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning("Could not preload %s: %s", module, e)
@@ -0,0 +1,176 @@
+"""
+Parsed Excel templates reused across exports.
+
+Parsing the styled HUP template with openpyxl is a large part of a small
+export and was repeated for every export. TemplateCache parses a template once
+per path and content hash and keeps it in pickled form; every export gets its
+own copy by unpickling, which is several times cheaper than parsing the
+.xlsx again and saves the same workbook apart from the modification time.
+
+Uploaded custom templates are stored once per content hash in a shared
+temporary folder instead of a new temporary file per upload, and old copies
+are removed on startup.
+"""
+
+import io
+import os
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from openpyxl import load_workbook
+from openpyxl.utils.bound_dictionary import BoundDictionary
+
+logger = logging.getLogger(__name__)
+
+# Folder for uploaded custom templates, one file per content hash
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "HUP Generator", "sjablonen")
+
+# Uploaded templates that have not been used for this long are removed by cleanup_uploaded_templates
+UPLOAD_MAX_AGE = 24 * 60 * 60
+
+
+def _restore_bound_dictionary(cls, default_factory):
+    """Recreate an openpyxl BoundDictionary (e.g. column_dimensions) with its default factory."""
+    instance = cls.__new__(cls)
+    dict.__init__(instance)
+    instance.default_factory = default_factory
+    return instance
+
+
+class _WorkbookPickler(pickle.Pickler):
+    """
+    Pickler for openpyxl workbooks.
+
+    BoundDictionary subclasses (row and column dimensions) take extra constructor arguments, so the
+    default defaultdict pickling recreates them without their default factory and they fail on the
+    first missing key. They are rebuilt from their class, factory, attributes and items instead.
+    """
+
+    def reducer_override(self, obj):
+        if isinstance(obj, BoundDictionary):
+            return (_restore_bound_dictionary, (type(obj), obj.default_factory), obj.__dict__, None,
+                    iter(obj.items()))
+        return NotImplemented
+
+
+def _dumps(workbook) -> bytes:
+    buffer = io.BytesIO()
+    _WorkbookPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(workbook)
+    return buffer.getvalue()
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TemplateCache:
+    """
+    Thread-safe cache of parsed workbooks, keyed by absolute path and content hash.
+
+    Args:
+        max_entries: Number of templates kept before the least recently used one is dropped
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, template_path: str):
+        """
+        Return a fresh, independent workbook for the template.
+
+        Args:
+            template_path: Path to the .xlsx template
+
+        Returns:
+            openpyxl Workbook that the caller may modify and save
+        """
+        key = (os.path.abspath(template_path), file_digest(template_path))
+        with self._lock:
+            state = self._templates.get(key)
+            if state is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if state is not None:
+            return pickle.loads(state)
+
+        workbook = load_workbook(filename=template_path)
+        try:
+            state = _dumps(workbook)
+        except Exception as e:
+            # Templates with parts that cannot be pickled are parsed on every export
+            logger.warning("Template %s cannot be cached: %s", template_path, e)
+            return workbook
+
+        with self._lock:
+            self._templates[key] = state
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return pickle.loads(state)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+# Process-wide cache shared by all sessions
+TEMPLATE_CACHE = TemplateCache()
+
+
+def store_uploaded_template(content: bytes) -> str:
+    """
+    Store an uploaded template once per content hash and return its path.
+
+    Uploading the same template again reuses the existing file (and its cached parse).
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, hashlib.sha1(content).hexdigest() + ".xlsx")
+    if os.path.exists(path):
+        os.utime(path)  # Mark as recently used
+        return path
+
+    # Write to a temporary name first so another session never reads a half-written file
+    with tempfile.NamedTemporaryFile(delete=False, dir=UPLOAD_DIR, suffix='.tmp') as temp_file:
+        temp_file.write(content)
+    os.replace(temp_file.name, path)
+    return path
+
+
+def cleanup_uploaded_templates(max_age: float = UPLOAD_MAX_AGE) -> int:
+    """
+    Remove uploaded templates (and leftover partial writes) not used for max_age seconds.
+
+    Returns:
+        Number of files removed
+    """
+    if not os.path.isdir(UPLOAD_DIR):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(UPLOAD_DIR):
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+# After the root, so the scripts do not shadow the modules of the same name (e.g. threshold_sweep)
+sys.path.append(os.path.join(ROOT_DIR, "scripts"))
+
+from data_management import load_data_from_file
+from generate_synthetic_kro import generate
+
+
+@pytest.fixture(scope="session")
+def kro_release(tmp_path_factory):
+    """A small synthetic KRO-aanzien/KRO-gebruik pair, loaded like an uploaded release."""
+    aanzien_path, gebruik_path = generate(3000, str(tmp_path_factory.mktemp("kro")), seed=1)
+    return load_data_from_file(aanzien_path), load_data_from_file(gebruik_path)
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from classes import KRO_Tree
+from data_management import FILTER_DEFINITIONS, apply_filter_to_tree
+
+
+def _prepared(df_aanzien, df_gebruik, enriched_view):
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None, enriched_view=enriched_view)
+    for filter_key in FILTER_DEFINITIONS:
+        apply_filter_to_tree(tree, filter_key)
+    return tree.prepare_dataframe(add_A=True)
+
+
+@pytest.mark.parametrize("mixed_codes", [False, True])
+def test_prepare_dataframe_with_view_equals_without(kro_release, tmp_path, mixed_codes):
+    df_aanzien, df_gebruik = kro_release
+    if mixed_codes:
+        # SBI codes read as numbers for some rows and as text for others must come back unchanged
+        df_gebruik = df_gebruik.copy()
+        df_gebruik['act1code'] = df_gebruik['act1code'].astype(object)
+        df_gebruik.loc[df_gebruik.index[::2], 'act1code'] = df_gebruik['act1code'].iloc[::2].map(
+            lambda code: code if pd.isna(code) else str(code))
+
+    expected = _prepared(df_aanzien, df_gebruik, None)
+    # The second run opens the view built by the first
+    for _ in range(2):
+        pd.testing.assert_frame_equal(_prepared(df_aanzien, df_gebruik, str(tmp_path)), expected)
+    assert len(list(tmp_path.iterdir())) == 1
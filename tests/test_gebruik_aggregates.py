@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from gebruik_aggregates import GebruikAggregates, AGGREGATE_COLUMNS
+
+
+def _first_valid(series):
+    valid = series.dropna()
+    return valid.iloc[0] if len(valid) else np.nan
+
+
+def _reference(df_gebruik, object_keys):
+    """The aggregates per object computed with a plain groupby over KRO-gebruik."""
+    rows = {}
+    for key, group in df_gebruik.groupby('aanzien_id', sort=False):
+        coded = group[group['act1code'].notna()]
+        rows[key] = {
+            AGGREGATE_COLUMNS["rows"]: len(group),
+            AGGREGATE_COLUMNS["personen_max"]: group['personen'].max(),
+            AGGREGATE_COLUMNS["personen_min"]: group['personen'].min(),
+            AGGREGATE_COLUMNS["personen"]: _first_valid(group['personen']),
+            AGGREGATE_COLUMNS["naam_vol"]: _first_valid(group['naam_vol']),
+            AGGREGATE_COLUMNS["act1code"]: coded['act1code'].iloc[0] if len(coded) else np.nan,
+            AGGREGATE_COLUMNS["act1omschr"]: coded['act1omschr'].iloc[0] if len(coded) else np.nan,
+        }
+    empty = {column: np.nan for column in AGGREGATE_COLUMNS.values()}
+    empty[AGGREGATE_COLUMNS["rows"]] = 0
+    return [rows.get(key, empty) for key in object_keys]
+
+
+def test_columns_match_groupby(kro_release):
+    df_aanzien, df_gebruik = kro_release
+    keys = df_aanzien['bronsleutel']
+    columns = GebruikAggregates(df_gebruik).columns_for(keys)
+    assert (columns[AGGREGATE_COLUMNS["rows"]] == 0).any()
+
+    for row, expected in zip(columns.to_dict('records'), _reference(df_gebruik, keys)):
+        for column, value in expected.items():
+            assert row[column] == value or (pd.isna(row[column]) and pd.isna(value)), column
+
+
+@pytest.mark.parametrize("start_nums", [[861, 87], [88911], [1, 4], [99999]])
+def test_sbi_mask_matches_groupby(kro_release, start_nums):
+    _, df_gebruik = kro_release
+    aggregates = GebruikAggregates(df_gebruik)
+    prefixes = tuple(str(start_num) for start_num in start_nums)
+    matching = df_gebruik.loc[df_gebruik['act1code'].astype(str).str.startswith(prefixes), 'aanzien_id']
+    expected = np.asarray(aggregates.keys.isin(matching))
+    np.testing.assert_array_equal(aggregates.sbi_key_mask(start_nums), expected)
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from data_management import FILTER_DEFINITIONS
+from incremental import build_snapshot, incremental_update, OBJECT_KEY, GEBRUIK_KEY
+
+
+def _next_release(df_aanzien, df_gebruik, x, y):
+    """A release in which some objects moved next to (x, y), one was removed and new ones were added there."""
+    df_aanzien = df_aanzien.copy()
+    moved = df_aanzien.index[10:15]
+    df_aanzien.loc[moved, 'x'] = x + 1
+    df_aanzien.loc[moved, 'y'] = y + 1
+    removed = df_aanzien[OBJECT_KEY].iloc[-1]
+    df_aanzien = df_aanzien[df_aanzien[OBJECT_KEY] != removed]
+    added = df_aanzien.iloc[:5].copy()
+    added[OBJECT_KEY] = df_aanzien[OBJECT_KEY].max() + 1 + pd.RangeIndex(len(added))
+    added['x'] = x - 2
+    added['y'] = y - 2
+    df_gebruik = df_gebruik[df_gebruik[GEBRUIK_KEY] != removed]
+    return pd.concat([df_aanzien, added], ignore_index=True), df_gebruik
+
+
+def test_incremental_nearest_equals_full_run(kro_release, monkeypatch):
+    df_aanzien, df_gebruik = kro_release
+    x, y = df_aanzien['x'].median(), df_aanzien['y'].median()
+    monkeypatch.setitem(FILTER_DEFINITIONS, "test_nearest", {
+        "name": "Dichtstbijzijnde objecten",
+        "description": "De 40 objecten het dichtst bij het midden",
+        "risk": "B",
+        "filters": [{"type": "nearest", "x": x, "y": y, "count": 40}]
+    })
+    filter_keys = ["gezond", "test_nearest", "industrie"]
+    snapshot = build_snapshot(df_aanzien, df_gebruik, filter_keys)
+
+    new_aanzien, new_gebruik = _next_release(df_aanzien, df_gebruik, x, y)
+    tree, _, new_snapshot = incremental_update(snapshot, new_aanzien, new_gebruik)
+    full = build_snapshot(new_aanzien, new_gebruik, filter_keys)
+
+    for filter_key in filter_keys:
+        assert sorted(new_snapshot["matches"][filter_key]) == sorted(full["matches"][filter_key]), filter_key
+    assert len(new_snapshot["matches"]["test_nearest"]) == 40
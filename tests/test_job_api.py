@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from job_api import JobQueue, TooManyJobs, RUNNING, WAITING, DONE
+
+DATASET = "0123abcd"
+
+
+class _HeldExecutor:
+    """Executor whose jobs only finish when the test sets the result of their future."""
+
+    def __init__(self):
+        self.futures = {}
+
+    def submit(self, function, job_id, *args):
+        self.futures[job_id] = Future()
+        return self.futures[job_id]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(workers=2, per_client=1, max_waiting=2, directory=str(tmp_path))
+    os.makedirs(os.path.join(queue.dataset_dir, DATASET))
+    queue.shutdown()
+    queue._executor = _HeldExecutor()
+    return queue
+
+
+@pytest.mark.parametrize("request_body, message", [
+    (["gezond"], "JSON-object"),
+    ({"filters": ["gezond"]}, "Onbekende dataset"),
+    ({"dataset": 12}, "Onbekende dataset"),
+    ({"dataset": "ffff"}, "Onbekende dataset"),
+    ({"dataset": DATASET, "filters": []}, "niet-lege lijst"),
+    ({"dataset": DATASET, "filters": "gezond"}, "niet-lege lijst"),
+    ({"dataset": DATASET, "filters": ["gezond", "onbekend", 3]}, "onbekend, 3"),
+    ({"dataset": DATASET, "format": "docx"}, "Uitvoerformaat"),
+])
+def test_job_spec_rejects_invalid_requests(queue, request_body, message):
+    with pytest.raises(ValueError, match=message):
+        queue._job_spec(request_body)
+
+
+def test_job_spec_defaults(queue):
+    spec = queue._job_spec({"dataset": DATASET})
+    assert spec["format"] == "xlsx" and spec["filters"] and not spec["add_A"] and not spec["remove_no_name"]
+
+
+def test_dispatch_shares_workers_between_clients(queue):
+    request = {"dataset": DATASET, "filters": ["gezond"], "format": "csv"}
+    first = [queue.submit("a", request) for _ in range(3)]
+    with pytest.raises(TooManyJobs):
+        queue.submit("a", request)
+    # The second client gets the free worker, although jobs of the first client were submitted earlier
+    other = queue.submit("b", request)
+    assert [job.status for job in first + [other]] == [RUNNING, WAITING, WAITING, RUNNING]
+    assert queue.position(first[1]) == 1
+
+    # A finished job of the first client makes room for its next job, not for a second job of the other
+    later = queue.submit("b", request)
+    queue._executor.futures[first[0].id].set_result(None)
+    assert first[0].status == DONE
+    assert [job.status for job in first[1:] + [later]] == [RUNNING, WAITING, WAITING]
+    queue._executor.futures[other.id].set_result(None)
+    assert later.status == RUNNING and first[2].status == WAITING
@@ -0,0 +1,30 @@
+import pytest
+
+from classes import KRO_Tree
+from data_management import FILTER_DEFINITIONS, apply_filter_to_tree
+from mask_cache import MaskCache
+
+
+def _hup_parts(df_aanzien, df_gebruik, mask_cache, filter_key):
+    """The positions and risk class stored by a definition."""
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=mask_cache)
+    apply_filter_to_tree(tree, filter_key)
+    return [(positions.tolist(), risk) for positions, risk in tree._hup_parts]
+
+
+@pytest.fixture(scope="module")
+def warm_cache(kro_release):
+    """A mask cache filled by running every definition once."""
+    df_aanzien, df_gebruik = kro_release
+    cache = MaskCache()
+    for filter_key in FILTER_DEFINITIONS:
+        _hup_parts(df_aanzien, df_gebruik, cache, filter_key)
+    assert len(cache)
+    return cache
+
+
+@pytest.mark.parametrize("filter_key", list(FILTER_DEFINITIONS))
+def test_definition_with_warm_cache_equals_uncached(kro_release, warm_cache, filter_key):
+    df_aanzien, df_gebruik = kro_release
+    cached = _hup_parts(df_aanzien, df_gebruik, warm_cache, filter_key)
+    assert cached == _hup_parts(df_aanzien, df_gebruik, None, filter_key)
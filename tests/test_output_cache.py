@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+from data_management import FILTER_DEFINITIONS
+from output_cache import OutputCache, output_key
+
+FINGERPRINT = "abc123"
+SQUARE = '{"type": "Polygon", "coordinates": [[[0, 0], [0, %d], [%d, %d], [%d, 0], [0, 0]]]}'
+
+
+@pytest.fixture
+def polygon(tmp_path, monkeypatch):
+    """A definition with a polygon filter reading a GeoJSON file, returned as its path."""
+    path = tmp_path / "gebied.geojson"
+    path.write_text(SQUARE % ((100,) * 4))
+    monkeypatch.setitem(FILTER_DEFINITIONS, "test_gebied", {
+        "name": "Gebied", "description": "", "risk": "B",
+        "filters": [{"type": "polygon", "path": str(path)}]
+    })
+    return path
+
+
+def test_key_is_stable(polygon):
+    assert output_key(FINGERPRINT, ["gezond", "test_gebied"], "xlsx") == \
+        output_key(FINGERPRINT, ["gezond", "test_gebied"], "xlsx")
+
+
+def test_key_changes_with_request(polygon, tmp_path):
+    template = tmp_path / "sjabloon.xlsx"
+    template.write_bytes(b"sjabloon 1")
+    base = output_key(FINGERPRINT, ["gezond", "industrie", "test_gebied"], "xlsx", template_path=str(template))
+
+    def key(filter_keys=("gezond", "industrie", "test_gebied"), **options):
+        return output_key(FINGERPRINT, list(filter_keys), "xlsx", template_path=str(template), **options)
+
+    assert key(filter_keys=("industrie", "gezond", "test_gebied")) != base
+    assert key(add_A=True) != base
+    assert key(remove_no_name=True) != base
+
+    template.write_bytes(b"sjabloon 2")
+    assert key() != base
+    template.write_bytes(b"sjabloon 1")
+
+    polygon.write_text(SQUARE % ((200,) * 4))
+    assert key() != base
+    polygon.write_text(SQUARE % ((100,) * 4))
+    assert key() == base
+
+
+def _cached_file(cache, name, size, age):
+    path = os.path.join(cache.directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+    return path
+
+
+def test_evict_removes_least_recently_used_above_max_bytes(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"), max_bytes=250)
+    oldest = _cached_file(cache, "a.csv.gz", 100, age=30)
+    middle = _cached_file(cache, "b.csv.gz", 100, age=20)
+    newest = _cached_file(cache, "c.csv.gz", 100, age=10)
+    assert cache.evict() == 1
+    assert not os.path.exists(oldest) and os.path.exists(middle) and os.path.exists(newest)
+    assert cache.nbytes == 200
+
+
+def test_evict_removes_expired_files(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"), max_age=60)
+    expired = _cached_file(cache, "a.xlsx", 10, age=120)
+    recent = _cached_file(cache, "b.xlsx", 10, age=30)
+    partial = _cached_file(cache, "c.xlsx.1-2.tmp", 10, age=2 * 3600)
+    writing = _cached_file(cache, "d.xlsx.1-2.tmp", 10, age=30)
+    assert cache.evict() == 2
+    assert [os.path.exists(path) for path in (expired, recent, partial, writing)] == [False, True, False, True]
+    assert cache.get("b", ".xlsx") == recent
+
+    _cached_file(cache, "e.xlsx", 10, age=120)
+    assert cache.get("e", ".xlsx") is None
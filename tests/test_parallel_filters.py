@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+from classes import KRO_Tree
+from data_management import FILTER_DEFINITIONS, apply_filter_to_tree
+from parallel_filters import apply_filters_parallel
+
+
+@pytest.mark.parametrize("by", ["rows", "gemnaam"])
+def test_parallel_filters_equal_serial(kro_release, by):
+    df_aanzien, df_gebruik = kro_release
+    filter_keys = list(FILTER_DEFINITIONS)
+
+    serial = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None)
+    for filter_key in filter_keys:
+        apply_filter_to_tree(serial, filter_key)
+
+    parallel = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None)
+    apply_filters_parallel(parallel, filter_keys, workers=2, by=by, partitions=3)
+
+    expected = serial.prepare_dataframe()
+    assert len(expected)
+    pd.testing.assert_frame_equal(parallel.prepare_dataframe(), expected)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from classes import KRO_Tree
+from data_management import FILTER_DEFINITIONS, apply_filter_to_tree
+from query_backend import BACKENDS
+
+pytest.importorskip("duckdb")
+
+PREDICATE_STEPS = [lambda tree: tree.filter_personen(">", 10),
+                   lambda tree: tree.filter_personen("<=", 3),
+                   lambda tree: tree.filter_SBI([861, 87])]
+
+
+def _selections(df_aanzien, df_gebruik, backend):
+    """Ascending positions of the objects that pass each predicate step and each filter definition."""
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None, backend=backend)
+    selections = []
+    for step in PREDICATE_STEPS:
+        step(tree)
+        tree.execute()
+        selections.append(np.sort(tree._current_positions()))
+        tree.reset()
+    for filter_key in FILTER_DEFINITIONS:
+        apply_filter_to_tree(tree, filter_key)
+        positions, _ = tree._hup_parts[-1]
+        selections.append(np.sort(positions))
+    return selections
+
+
+@pytest.mark.parametrize("null_key", [False, True])
+def test_backends_select_the_same_objects(kro_release, null_key):
+    df_aanzien, df_gebruik = kro_release
+    if null_key:
+        # A KRO-gebruik row without an object must not change which objects are selected
+        df_gebruik = pd.concat([df_gebruik, df_gebruik.iloc[:1].assign(aanzien_id=np.nan)], ignore_index=True)
+
+    expected = _selections(df_aanzien, df_gebruik, "pandas")
+    # Objects without gebruik rows pass the personen steps
+    without_gebruik = np.flatnonzero(~df_aanzien['bronsleutel'].isin(df_gebruik['aanzien_id']).to_numpy())
+    assert len(without_gebruik) and np.isin(without_gebruik, expected[0]).all()
+    for backend in BACKENDS:
+        selections = _selections(df_aanzien, df_gebruik, backend)
+        for step, (selection, reference) in enumerate(zip(selections, expected)):
+            assert np.array_equal(selection, reference), f"{backend}, step {step}"
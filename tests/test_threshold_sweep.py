@@ -0,0 +1,53 @@
+import copy
+import itertools
+
+import numpy as np
+import pytest
+
+from classes import KRO_Tree
+from data_management import FILTER_DEFINITIONS, apply_filter_to_tree
+from threshold_sweep import sweep_definition
+
+SWEEPS = {
+    "gezond": [("personen", [5, 10, 20])],
+    "industrie": [("bag_oppvlk", [1000, 2500, 4000])],
+    "onderwijs": [("woz_opp_nietwoon", [0, 200]), ("pandhoogte", [0, 5, 10])],
+    "kantoor_b": [("woz_opp_nietwoon", [200, 1000]), ("pandhoogte", [5, 20])],
+}
+
+
+def _rerun(df_aanzien, df_gebruik, filter_key, thresholds, monkeypatch):
+    """Objects of the definition and per risk class in the HUP, with all definitions run again."""
+    definition = copy.deepcopy(FILTER_DEFINITIONS[filter_key])
+    for (column, _), value in zip(SWEEPS[filter_key], thresholds):
+        next(item for item in definition["filters"] if item.get("column") == column)["value"] = value
+    monkeypatch.setitem(FILTER_DEFINITIONS, filter_key, definition)
+
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None)
+    risk_of = {}
+    for key in FILTER_DEFINITIONS:
+        apply_filter_to_tree(tree, key)
+        positions, risk = tree._hup_parts[-1]
+        if key == filter_key:
+            definition_count = len(positions)
+        for position in positions.tolist():
+            risk_of.setdefault(position, risk)
+    counts = {risk: list(risk_of.values()).count(risk) for risk in set(risk_of.values())}
+    return definition_count, counts
+
+
+@pytest.mark.parametrize("filter_key", list(SWEEPS))
+def test_sweep_matches_rerun(kro_release, monkeypatch, filter_key):
+    df_aanzien, df_gebruik = kro_release
+    sweeps = [(column, np.array(values, dtype=float)) for column, values in SWEEPS[filter_key]]
+    result = sweep_definition(KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None), filter_key, sweeps)
+
+    combinations = list(itertools.product(*[values for _, values in SWEEPS[filter_key]]))
+    assert len(result) == len(combinations)
+    for row, thresholds in zip(result.to_dict("records"), combinations):
+        with monkeypatch.context() as patch:
+            definition_count, counts = _rerun(df_aanzien, df_gebruik, filter_key, thresholds, patch)
+        assert row[f"objecten {filter_key}"] == definition_count
+        assert row["objecten HUP"] == sum(counts.values())
+        for risk in {item["risk"] for item in FILTER_DEFINITIONS.values()}:
+            assert row[f"risico {risk}"] == counts.get(risk, 0)
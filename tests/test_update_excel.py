@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from classes import KRO_Tree, OBJECT_ID_COLUMN, STATUS_COLUMN
+from data_management import apply_filter_to_tree, get_resource_path
+
+SHEET_NAME = "Online Checklist Bedrijven"
+FILTER_KEYS = ["gezond", "industrie"]
+
+
+def _hup(df_aanzien, df_gebruik):
+    tree = KRO_Tree(df_aanzien.copy(), df_gebruik, mask_cache=None)
+    for filter_key in FILTER_KEYS:
+        apply_filter_to_tree(tree, filter_key)
+    return tree
+
+
+def _rows(path):
+    """The data rows of a HUP workbook as dictionaries keyed by object id."""
+    sheet = load_workbook(path)[SHEET_NAME]
+    header = [cell.value for cell in sheet[1]]
+    rows = {}
+    for values in sheet.iter_rows(min_row=2, values_only=True):
+        row = dict(zip(header, values))
+        if row.get(OBJECT_ID_COLUMN) is not None:
+            rows[row[OBJECT_ID_COLUMN]] = row
+    return rows
+
+
+def test_update_marks_changes_and_keeps_manual_columns(kro_release, tmp_path):
+    df_aanzien, df_gebruik = kro_release
+    template = get_resource_path(os.path.join("resources", "HUP lijst lay-out.xlsx"))
+    first_path = str(tmp_path / "HUP-1.xlsx")
+    _hup(df_aanzien, df_gebruik).insert_dataframe_into_excel(template, SHEET_NAME, 2, output_path=first_path)
+
+    # An inspector fills in a manual column of an object whose data will change
+    object_ids = list(_rows(first_path))
+    changed_id, removed_id, copied_id = object_ids[0], object_ids[1], object_ids[2]
+    workbook = load_workbook(first_path)
+    sheet = workbook[SHEET_NAME]
+    header = {cell.value: cell.column for cell in sheet[1]}
+    for row in range(2, sheet.max_row + 1):
+        if sheet.cell(row=row, column=header[OBJECT_ID_COLUMN]).value == changed_id:
+            sheet.cell(row=row, column=header["Checklist verstuurd?"], value="ja")
+    workbook.save(first_path)
+
+    # Next release: one object changed, one removed and a new one that passes the same filter
+    new_aanzien = df_aanzien.copy()
+    new_aanzien.loc[new_aanzien['bronsleutel'] == changed_id, 'bouwjaar'] = 1850
+    new_aanzien = new_aanzien[new_aanzien['bronsleutel'] != removed_id]
+    new_id = int(df_aanzien['bronsleutel'].max()) + 1
+    added = df_aanzien[df_aanzien['bronsleutel'] == copied_id].assign(bronsleutel=new_id,
+                                                                      id=df_aanzien['id'].max() + 1)
+    new_aanzien = pd.concat([new_aanzien, added], ignore_index=True)
+    new_gebruik = df_gebruik[df_gebruik['aanzien_id'] != removed_id]
+    new_gebruik = pd.concat([new_gebruik, df_gebruik[df_gebruik['aanzien_id'] == copied_id].assign(aanzien_id=new_id)],
+                            ignore_index=True)
+
+    second_path = str(tmp_path / "HUP-2.xlsx")
+    _hup(new_aanzien, new_gebruik).update_excel(first_path, SHEET_NAME, 2, output_path=second_path)
+    rows = _rows(second_path)
+
+    assert rows[changed_id][STATUS_COLUMN] == "Gewijzigd"
+    assert rows[changed_id]["Bouwjaar"] == 1850
+    assert rows[changed_id]["Checklist verstuurd?"] == "ja"
+    assert rows[removed_id][STATUS_COLUMN] == "Vervallen"
+    assert rows[new_id][STATUS_COLUMN] == "Nieuw"
+    unchanged = [row[STATUS_COLUMN] for object_id, row in rows.items()
+                 if object_id not in (changed_id, removed_id, new_id)]
+    assert unchanged and all(status is None for status in unchanged)
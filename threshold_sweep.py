@@ -0,0 +1,197 @@
+"""
+Threshold sensitivity sweeps for the filter definitions.
+
+"What if the woz_opp_nietwoon threshold were 800 instead of 1000?" normally
+means running the definitions again for every candidate value. sweep_definition
+answers it for a whole range of values (of one or two thresholds of a
+definition) in a single pass:
+
+- the other steps of the definitions are evaluated once as cached masks;
+- per object, the swept value is located among the sorted thresholds with
+  np.searchsorted, which gives how many of the thresholds it passes;
+- a histogram of those positions, cumulated over the thresholds, gives the
+  number of objects at every threshold (a 2-D histogram for two thresholds).
+
+Besides the objects of the swept definition, the result has the HUP totals
+per risk class for every threshold and the change against the current
+thresholds. Like in prepare_dataframe, an object in several definitions takes
+the risk class of the first definition it matches, so objects can shift
+between risk classes when a threshold moves.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_management import FILTER_DEFINITIONS, add_definition_filters
+from gebruik_aggregates import AGGREGATE_COLUMNS
+
+# Operators whose passing objects change monotonically with the threshold
+SWEEP_OPERATORS = (">", ">=", "<", "<=")
+
+
+def parse_sweep(text: str) -> Tuple[str, np.ndarray]:
+    """
+    Parses 'column=start:stop:step' (stop included) or 'column=value,value,...'.
+
+    Returns:
+        The column and the sorted distinct threshold values
+    """
+    column, separator, values = text.partition("=")
+    if not separator or not column or not values:
+        raise ValueError(f"Expected column=start:stop:step or column=value,value,...: {text}")
+    if ":" in values:
+        start, stop, step = (float(part) for part in values.split(":"))
+        if step <= 0:
+            raise ValueError(f"Step must be positive: {text}")
+        thresholds = np.arange(start, stop + step / 2, step)
+    else:
+        thresholds = np.array([float(value) for value in values.split(",")])
+    return column.strip(), np.unique(thresholds)
+
+
+def _pass_index(values: np.ndarray, thresholds: np.ndarray, operator: str) -> np.ndarray:
+    """
+    Position of every value among the sorted thresholds.
+
+    For > and >= an object passes threshold i when its position is larger than i, for < and <= when its
+    position is at most i. Missing values pass no threshold.
+    """
+    side = "left" if operator in (">", "<=") else "right"
+    index = np.searchsorted(thresholds, values, side=side)
+    if operator in (">", ">="):
+        index[np.isnan(values)] = 0
+    return index
+
+
+def _cumulate(histogram: np.ndarray, operator: str, axis: int) -> np.ndarray:
+    """Turns a histogram of pass positions along axis into the number of passing objects per threshold."""
+    positions = histogram.shape[axis]
+    if operator in (">", ">="):
+        upper = np.take(histogram, np.arange(1, positions), axis=axis)
+        return np.flip(np.cumsum(np.flip(upper, axis=axis), axis=axis), axis=axis)
+    return np.take(np.cumsum(histogram, axis=axis), np.arange(positions - 1), axis=axis)
+
+
+def _first_risk(masks: Sequence[np.ndarray], risk_codes: Sequence[int], size: int) -> np.ndarray:
+    """Per object the code of the risk class of the first mask it is in (0 for none)."""
+    codes = np.zeros(size, dtype=np.int8)
+    for mask, code in zip(masks, risk_codes):
+        codes[(codes == 0) & mask] = code
+    return codes
+
+
+def sweep_definition(tree, filter_key: str, sweeps: List[Tuple[str, np.ndarray]],
+                     filter_keys: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Object counts of a filter definition and of the HUP for every combination of threshold values.
+
+    Args:
+        tree: KRO_Tree with the loaded data
+        filter_key: Key of the definition in FILTER_DEFINITIONS whose thresholds are swept
+        sweeps: One or two (column, thresholds) pairs; each column must have a >, >=, < or <= step in the
+            definition ('personen' included)
+        filter_keys: Definitions that make up the HUP, in order (default: all of FILTER_DEFINITIONS)
+
+    Returns:
+        Dataframe with a row per threshold combination: the thresholds, the objects of the definition, the
+        objects in the HUP, the objects per risk class and the change per risk class against the current
+        thresholds
+    """
+    filter_keys = list(FILTER_DEFINITIONS) if filter_keys is None else list(filter_keys)
+    if filter_key not in filter_keys:
+        filter_keys.append(filter_key)
+    if not 1 <= len(sweeps) <= 2:
+        raise ValueError("Sweep one or two thresholds.")
+    filter_def = FILTER_DEFINITIONS[filter_key]
+
+    # The swept steps of the definition; the other steps are evaluated as masks
+    swept_items, other_items = [], list(filter_def["filters"])
+    for column, thresholds in sweeps:
+        item = next((item for item in other_items if item["type"] == "column" and item["column"] == column
+                     and item["operator"] in SWEEP_OPERATORS), None)
+        if item is None:
+            raise ValueError(f"Definition {filter_key} has no {'/'.join(SWEEP_OPERATORS)} step on {column}.")
+        other_items.remove(item)
+        swept_items.append((item, np.asarray(thresholds, dtype=float)))
+
+    def definition_mask(definition):
+        return tree.selection_mask(tree.collect_predicates(lambda: add_definition_filters(tree, definition)))
+
+    size = len(tree.original_data)
+    base = definition_mask({"filters": other_items})
+
+    # Per object and swept step: its position among the thresholds
+    positions = []
+    for item, thresholds in swept_items:
+        operator = item["operator"]
+        if item["column"] == "personen":
+            # As in KRO_Tree.evaluate: some gebruik row passes when the highest (or lowest) does, and
+            # objects without gebruik rows always pass
+            data = tree.original_data
+            aggregate = AGGREGATE_COLUMNS["personen_max" if operator.startswith(">") else "personen_min"]
+            index = _pass_index(data[aggregate].to_numpy(dtype=float, na_value=np.nan), thresholds, operator)
+            without_rows = (data[AGGREGATE_COLUMNS["rows"]] == 0).to_numpy()
+            index[without_rows] = len(thresholds) if operator.startswith(">") else 0
+        else:
+            values = tree.original_data[item["column"]].to_numpy(dtype=float, na_value=np.nan)
+            index = _pass_index(values, thresholds, operator)
+        positions.append(index)
+    shape = tuple(len(thresholds) + 1 for _, thresholds in swept_items)
+
+    # Risk classes of the other definitions: the first one before (fixed) and after the swept definition
+    risks = sorted({FILTER_DEFINITIONS[key]["risk"] for key in filter_keys})
+    code_of = {risk: code for code, risk in enumerate(risks, start=1)}
+    order = filter_keys.index(filter_key)
+    earlier = [(definition_mask(FILTER_DEFINITIONS[key]), code_of[FILTER_DEFINITIONS[key]["risk"]])
+               for key in filter_keys[:order]]
+    later = [(definition_mask(FILTER_DEFINITIONS[key]), code_of[FILTER_DEFINITIONS[key]["risk"]])
+             for key in filter_keys[order + 1:]]
+    earlier_codes = _first_risk([mask for mask, _ in earlier], [code for _, code in earlier], size)
+    later_codes = _first_risk([mask for mask, _ in later], [code for _, code in later], size)
+    swept_code = code_of[filter_def["risk"]]
+
+    def passing(selection, groups, group_count):
+        """Objects of the selection per group that pass each threshold combination."""
+        flat = np.ravel_multi_index(tuple(index[selection] for index in positions), shape)
+        flat = groups[selection].astype(np.int64) * int(np.prod(shape)) + flat
+        histogram = np.bincount(flat, minlength=group_count * int(np.prod(shape))).reshape((group_count,) + shape)
+        for axis, (item, _) in enumerate(swept_items, start=1):
+            histogram = _cumulate(histogram, item["operator"], axis)
+        return histogram
+
+    group_count = len(risks) + 1
+    definition_counts = passing(base, np.zeros(size, dtype=np.int8), 1)[0]
+
+    # Objects of earlier definitions keep their risk class; the others take the swept risk class when they
+    # pass, or else the risk class of the first later definition they match
+    fixed = np.bincount(earlier_codes, minlength=group_count)
+    open_objects = earlier_codes == 0
+    candidates = open_objects & base
+    fixed += np.bincount(later_codes[open_objects & ~base], minlength=group_count)
+    candidate_totals = np.bincount(later_codes[candidates], minlength=group_count)
+    passed = passing(candidates, later_codes, group_count)
+
+    totals = {}
+    for risk, code in code_of.items():
+        total = fixed[code] + candidate_totals[code] - passed[code]
+        if code == swept_code:
+            total = total + passed.sum(axis=0)
+        totals[risk] = total
+
+    # The HUP with the current thresholds, for the change per risk class
+    current = tree.count_preview([(key, tree.collect_predicates(
+        lambda key=key: add_definition_filters(tree, FILTER_DEFINITIONS[key])), FILTER_DEFINITIONS[key]["risk"])
+        for key in filter_keys])
+
+    grid = np.meshgrid(*[thresholds for _, thresholds in swept_items], indexing="ij")
+    result = pd.DataFrame({f"{item['column']} {item['operator']}": values.ravel()
+                           for (item, _), values in zip(swept_items, grid)})
+    result[f"objecten {filter_key}"] = definition_counts.ravel()
+    result["objecten HUP"] = sum(totals.values()).ravel()
+    for risk in risks:
+        result[f"risico {risk}"] = totals[risk].ravel()
+    for risk in risks:
+        result[f"verschil {risk}"] = totals[risk].ravel() - current["risk"].get(risk, 0)
+    return result